@@ -1,16 +1,23 @@
 import streamlit as st
 import pandas as pd
-from streamlit_folium import st_folium
+import numpy as np
+import streamlit.components.v1 as components
 from core import (
     charger_donnees,
-    sauvegarder_donnees,
+    charger_geometrie,
+    file_sauvegardes,
+    sauvegarder_en_arriere_plan,
     identifier_sejours_multiples,
     ouvrir_pdf,
+    prechauffer_pdfs,
     charger_routes_existantes
 )
-from utils.get_route import calculate_routes
+from utils.get_route import controler_routes, recalculer_segments, segments_impactes
+from utils.geometrie import COLONNES_GEOMETRIE
+from utils.magasin_geometrie import COLONNE_SEGMENT
+from utils.diff_voyage import COLONNE_ID, assurer_identifiants, calculer_changements, appliquer_changements
 
-from utils.creer_carte import creer_carte
+from utils.cache_carte import html_carte
 
 def configurer_page():
     """Configuration initiale de la page Streamlit"""
@@ -65,7 +72,7 @@ def afficher_pdfs_selectbox(df):
             pdf_link = pdf_links[selected_option]
             with st.expander("Document PDF", expanded=True):
                 # Appeler ouvrir_pdf avec use_expander=False pour éviter l'imbrication d'expanders
-                ouvrir_pdf(pdf_link, use_expander=False)
+                ouvrir_pdf(pdf_link, use_expander=False, cle="carte_")
 
                 # Ajouter un bouton pour fermer le PDF si nécessaire
                 if st.button("Fermer le PDF", key="carte_pdf_close_button"):
@@ -134,7 +141,7 @@ def creer_editeur_donnees(df):
         st.session_state.previous_checked_idx = None
 
     # Définir les colonnes à cacher
-    colonnes_cachees = ['Chemin', 'Longitude', 'Latitude', 'Distance (km)', 'Durée (h)', 'Lien']
+    colonnes_cachees = ['Chemin', 'Chemin_Niveaux', 'Segment', 'Longitude', 'Latitude', 'Distance (km)', 'Durée (h)', 'Lien']
     df_visible = df.drop(columns=colonnes_cachees, errors="ignore")
 
     # Sauvegarde d'une copie des adresses actuelles
@@ -175,7 +182,8 @@ def creer_editeur_donnees(df):
         "Nom": st.column_config.TextColumn("Hébergement", width="medium"),
         "Prix": st.column_config.NumberColumn("Prix ($)", format="%.2f", width='small'),
         "Nuit": st.column_config.DatetimeColumn("Nuit", width="small", format="HH[h] DD/MM"),
-        "Lien": st.column_config.TextColumn("Lien", width="small")
+        "Lien": st.column_config.TextColumn("Lien", width="small"),
+        COLONNE_ID: None  # Identifiant des lignes, masqué
     }
 
     # Édition interactive du tableau
@@ -221,7 +229,7 @@ def creer_editeur_donnees(df):
     if st.session_state.pdf_a_ouvrir:
         with st.expander("📄 Document PDF", expanded=True):
             # Appeler ouvrir_pdf avec use_expander=False pour éviter l'imbrication d'expanders
-            ouvrir_pdf(st.session_state.pdf_a_ouvrir, use_expander=False)
+            ouvrir_pdf(st.session_state.pdf_a_ouvrir, use_expander=False, cle="editeur_")
             if st.button("Fermer le PDF"):
                 # Fermer le PDF et décocher la case
                 st.session_state.pdf_a_ouvrir = None
@@ -235,99 +243,86 @@ def creer_editeur_donnees(df):
     return edited_df, df_visible, adresses_actuelles
 
 
+def signaler_routes_incoherentes(df, segments):
+    """Affiche un avertissement si des segments recalculés ont un itinéraire incohérent"""
+    # Seuls les segments recalculés sont décodés et contrôlés
+    incoherents = np.flatnonzero(controler_routes(df, segments=segments)).tolist()
+    if incoherents:
+        st.warning(f"⚠️ Itinéraires à vérifier (distance incohérente avec le tracé) : {incoherents}")
+
+
+def afficher_etat_sauvegardes():
+    """Affiche dans la sidebar l'état des sauvegardes en arrière-plan"""
+    etat = file_sauvegardes().etat()
+    en_attente = sorted(set(etat["en_attente"]) | set(etat["en_cours"]))
+
+    if etat["echecs"]:
+        for nom, erreur in etat["echecs"].items():
+            st.sidebar.error(f"❌ Échec de la sauvegarde de {nom} : {erreur}")
+        if st.sidebar.button("🔁 Réessayer la sauvegarde"):
+            file_sauvegardes().reessayer()
+    elif en_attente:
+        st.sidebar.info(f"⏳ Sauvegarde en attente : {', '.join(en_attente)}")
+    elif etat["derniere_sauvegarde"] is not None:
+        heure = pd.Timestamp(etat["derniere_sauvegarde"], unit="s")
+        st.sidebar.caption(f"✅ Données sauvegardées ({heure:%H:%M:%S} UTC)")
+
+
 def traiter_modifications(edited_df, df_visible, df, adresses_actuelles, uploaded_file):
     """Traite les modifications apportées aux données et recalcule les distances si nécessaire"""
-    # Vérifier si de nouvelles lignes ont été ajoutées
-    if len(edited_df) > len(df_visible):
-        st.info(f"Détection de {len(edited_df) - len(df_visible)} nouvelles lignes.")
+    # Lignes ajoutées dans l'éditeur : nouvel identifiant
+    edited_df = assurer_identifiants(edited_df)
 
-        # Pour les nouvelles lignes, on ajoute directement au DataFrame principal
-        nouvelles_lignes = edited_df.iloc[len(df_visible):]
-        for _, nouvelle_ligne in nouvelles_lignes.iterrows():
-            # Créer une nouvelle ligne pour df avec toutes les colonnes nécessaires
-            nouvelle_ligne_complete = pd.Series(index=df.columns)
+    # Lignes appariées par identifiant : suppressions et réordonnancements sont détectés
+    changements = calculer_changements(df_visible, edited_df, ignorer=("Afficher PDF",))
+    if changements.vide:
+        st.info("Aucune modification détectée.")
+        return
 
-            # Copier les valeurs existantes
-            for col in nouvelle_ligne.index:
-                if col in df.columns:
-                    nouvelle_ligne_complete[col] = nouvelle_ligne[col]
+    if changements.inseres:
+        st.info(f"Détection de {len(changements.inseres)} nouvelles lignes.")
+    if changements.supprimes:
+        st.info(f"Suppression de {len(changements.supprimes)} lignes.")
 
-            # Ajouter la nouvelle ligne au DataFrame principal
-            df = pd.concat([df, pd.DataFrame([nouvelle_ligne_complete])], ignore_index=True)
+    # Les tracés ne sont lus qu'ici, pour recalculer et contrôler les segments modifiés
+    df = charger_geometrie(df, nom_fichier=uploaded_file)
 
-        # Sauvegarder immédiatement pour les nouvelles lignes
-        df = df.sort_values(by="Nuit").reset_index(drop=True)
+    # Positions d'origine des lignes (les nouvelles lignes sont placées après les anciennes)
+    position_avant = {id_ligne: position for position, id_ligne in enumerate(df[COLONNE_ID])}
+    derniere_avant = len(df) - 1
+    for id_ligne in changements.inseres:
+        position_avant[id_ligne] = len(position_avant)
 
-        _, _, _, df = calculate_routes(df)
+    df = appliquer_changements(df, edited_df, changements)
 
-        sauvegarder_donnees(df, nom_fichier=uploaded_file)
-        st.success("✅ Nouvelles lignes ajoutées avec succès!")
-        return
+    # Trier puis repérer les segments touchant une ligne modifiée ou ajoutée, ou reliant
+    # des lignes rapprochées par le tri ou par une suppression
+    df = df.sort_values(by="Nuit", kind="stable").reset_index(drop=True)
+    ordre = df[COLONNE_ID].map(position_avant).to_numpy()
+    lignes_modifiees = {position_avant[i] for i in changements.a_router()}
+    segments = segments_impactes(ordre, lignes_modifiees)
 
-    # Ne comparer que les lignes existantes (pour les modifications)
-    if len(edited_df) == len(df_visible):
-        # Vérifier les modifications ligne par ligne et colonne par colonne
-        routes_a_recalculer = set()
-        modifications_detectees = False
-
-        for idx in range(len(edited_df)):
-            for col in edited_df.columns:
-                # Éviter de comparer la colonne 'Afficher PDF' qui est un état temporaire
-                if col == 'Afficher PDF':
-                    continue
-
-                # Vérifier si la valeur a été modifiée
-                if edited_df.loc[idx, col] != df_visible.loc[idx, col]:
-                    modifications_detectees = True
-
-                    # Mettre à jour la valeur dans le DataFrame complet
-                    if col in df.columns:
-                        df.loc[idx, col] = edited_df.loc[idx, col]
-
-                    # Vérifier les modifications qui nécessitent un recalcul des routes
-                    if col == "Adresse":
-                        routes_a_recalculer.add(idx)
-                        # Réinitialiser les coordonnées
-                        df.loc[idx, "Latitude"] = None
-                        df.loc[idx, "Longitude"] = None
-
-                    if col == "Type_Deplacement":
-                        routes_a_recalculer.add(idx)
-
-        # Pour chaque route à recalculer, réinitialiser les données de chemin
-        for idx in routes_a_recalculer:
-            df.loc[idx, "Chemin"] = None
-            df.loc[idx, "Distance (km)"] = None
-            df.loc[idx, "Durée (h)"] = None
-
-            # Réinitialiser aussi le chemin précédent si ce n'est pas la première ligne
-            if idx > 0:
-                df.loc[idx - 1, "Chemin"] = None
-                df.loc[idx - 1, "Distance (km)"] = None
-                df.loc[idx - 1, "Durée (h)"] = None
-
-        if modifications_detectees:
-            if routes_a_recalculer:
-                st.info(f"Recalcul des routes pour les indices : {sorted(routes_a_recalculer)}")
-
-                # Recalculer les routes et distances pour tout le DataFrame
-                with st.spinner("Recalcul des itinéraires et des distances..."):
-                    distances_list, durations, route_geoms, df_updated = calculate_routes(df)
-                    # Mettre à jour le DataFrame avec les résultats recalculés
-                    df = df_updated
-
-            # Trier et réinitialiser l'index
-            df = df.sort_values(by="Nuit").reset_index(drop=True)
-
-            # Sauvegarder le DataFrame mis à jour
-            sauvegarder_donnees(df, nom_fichier=uploaded_file)
-
-            # Calculer la distance totale mise à jour
-            distance_totale_maj = df["Distance (km)"].sum(skipna=True)
-
-            st.success("✅ Modifications appliquées avec succès!")
-        else:
-            st.info("Aucune modification détectée.")
+    # L'ancienne dernière ligne n'avait pas de segment sortant : le calculer si elle a
+    # été déplacée ou si des lignes la suivent désormais (rien si elle a été supprimée)
+    segments |= set(np.flatnonzero(ordre[:-1] == derniere_avant).tolist())
+
+    # La dernière ligne n'a pas de segment sortant : effacer celui qu'elle a pu garder
+    if len(df):
+        for col in COLONNES_GEOMETRIE + [COLONNE_SEGMENT, "Distance (km)", "Durée (h)"]:
+            if col in df.columns:
+                df.at[len(df) - 1, col] = np.nan if col in ("Distance (km)", "Durée (h)") else None
+
+    if segments:
+        st.info(f"Recalcul des routes pour les segments : {sorted(segments)}")
+
+        # Recalculer uniquement les segments concernés
+        with st.spinner("Recalcul des itinéraires et des distances..."):
+            df = recalculer_segments(df, segments)
+        signaler_routes_incoherentes(df, segments)
+
+    # Sauvegarder le DataFrame mis à jour en arrière-plan
+    sauvegarder_en_arriere_plan(df, nom_fichier=uploaded_file)
+    st.success("✅ Modifications appliquées avec succès!")
 
 
 def main():
@@ -340,29 +335,43 @@ def main():
     uploaded_file = 'data/hebergements_chemins.parquet'
     df = charger_donnees(nom_fichier=uploaded_file, format="parquet")
 
+    # Identifiant permanent de chaque ligne, pour apparier les lignes modifiées dans l'éditeur
+    if df is not None:
+        df = assurer_identifiants(df)
+
+    # Aperçus des PDF calculés en arrière-plan, pour un affichage immédiat à la sélection
+    if df is not None and "Lien" in df.columns:
+        prechauffer_pdfs(df["Lien"])
+
     # Onglets pour différentes sections de l'application
     tab1, tab2 = st.tabs(["🗺️ Carte", "📝 Données"])
 
+    # État des sauvegardes en arrière-plan
+    afficher_etat_sauvegardes()
+
+    # Les fonctions mises en cache ne reçoivent pas les tracés : leur hachage
+    # resterait sinon proportionnel au nombre total de points
+    df_sans_traces = df.drop(columns=COLONNES_GEOMETRIE, errors="ignore")
+
     with tab1:
-        # Calculer les distances et les trajets
-        distances,durations, routes, df = charger_routes_existantes(df)
+        # Récupérer les distances, durées et un accès paresseux aux trajets
+        distances, durations, routes, df = charger_routes_existantes(df, nom_fichier=uploaded_file)
 
         # Identifier les séjours multiples
-        df_avec_duree = identifier_sejours_multiples(df)
+        df_avec_duree = identifier_sejours_multiples(df_sans_traces)
 
         # Afficher le récapitulatif dans la sidebar (seulement dans l'onglet carte)
-        afficher_recapitulatif_metrics(df)
+        afficher_recapitulatif_metrics(df_sans_traces)
 
-        # Créer et afficher la carte
-        m = creer_carte(df, df_avec_duree, distances, durations)
-        st_folium(m, height=700, use_container_width= True, returned_objects=[])
+        # Afficher la carte, reconstruite seulement si son contenu a changé
+        components.html(html_carte(df, df_avec_duree, distances, durations, routes), height=700)
 
         # Remplacer la fonction d'affichage d'emails par celle pour les PDF
         afficher_pdfs_selectbox(df)
 
     with tab2:
         # Afficher le récapitulatif dans la sidebar (seulement dans l'onglet carte)
-        afficher_recapitulatif_metrics(df)
+        afficher_recapitulatif_metrics(df_sans_traces)
 
         # Créer l'éditeur de données (qui gère aussi les PDF)
         edited_df, df_visible, adresses_actuelles = creer_editeur_donnees(df)
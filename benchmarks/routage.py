@@ -0,0 +1,134 @@
+import argparse
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import utils.get_route as get_route
+from utils import fournisseurs_routage, moteur_routage
+from utils.cache_persistant import CacheSQLite
+from utils.serveur_ors_simule import ServeurRoutageSimule
+
+
+def voyage_aleatoire(rng, nb_lignes, part_marche=0.2):
+    """Voyage aléatoire : étapes de 5 à 80 km, en voiture ou à pied"""
+    pas = rng.uniform(0.05, 0.7, (nb_lignes, 2)) * rng.choice([-1, 1], (nb_lignes, 2))
+    points = np.array([45.5, -73.6]) + np.cumsum(pas, axis=0)
+    return pd.DataFrame({
+        "Latitude": points[:, 0],
+        "Longitude": points[:, 1],
+        "Type_Deplacement": np.where(rng.random(nb_lignes) < part_marche, "Marche", "Voiture"),
+        "Chemin": None,
+        "Distance (km)": None,
+        "Durée (h)": None,
+    })
+
+
+class MesureRequetes:
+    """Chronomètre chaque requête HTTP de la session de routage partagée (latence vue du client)"""
+
+    def __init__(self, session):
+        self._request = session.request
+        self._verrou = threading.Lock()
+        self.durees = []
+        self.statuts = []
+        session.request = self
+
+    def __call__(self, *args, **kwargs):
+        debut = time.perf_counter()
+        reponse = self._request(*args, **kwargs)
+        with self._verrou:
+            self.durees.append(time.perf_counter() - debut)
+            self.statuts.append(reponse.status_code)
+        return reponse
+
+
+def parametres(args, serveur):
+    """Paramètres (st.secrets) pointant le fournisseur choisi vers le serveur simulé"""
+    secrets = {
+        "openrouteservices": {
+            "token": "benchmark",
+            "url": serveur.url,
+            "threads": args.threads,
+            "multi_points": args.multi_points,
+            "points_max": args.points_max,
+            # Pas de limitation de débit côté client : seul le serveur est mesuré
+            "requetes_par_minute": 1_000_000,
+        },
+        "routage": {
+            "fournisseur": args.fournisseur,
+            "osrm_url": serveur.url,
+            "osrm_requetes_par_seconde": 1_000_000,
+        },
+    }
+    return secrets
+
+
+def vider_ressources():
+    """Oublie les ressources partagées construites avec d'autres paramètres"""
+    for ressource in (fournisseurs_routage.fournisseur_routage, moteur_routage.session_ors,
+                      moteur_routage.limiteur_ors, moteur_routage.limiteur_osrm):
+        ressource.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Débit et latence de calculate_routes face au serveur simulé "
+                                                 "(à lancer depuis la racine : python -m benchmarks.routage)")
+    parser.add_argument("--lignes", type=int, default=200, help="Nombre d'étapes du voyage")
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--fournisseur", choices=["ors", "osrm"], default="ors")
+    parser.add_argument("--threads", type=int, default=8, help="openrouteservices.threads")
+    parser.add_argument("--multi-points", action="store_true", help="Requêtes ORS à plusieurs points")
+    parser.add_argument("--points-max", type=int, default=50)
+    parser.add_argument("--latence", type=float, default=0.1, help="Latence médiane du serveur (s)")
+    parser.add_argument("--dispersion", type=float, default=0.5, help="Écart-type log de la latence")
+    parser.add_argument("--taux-erreur", type=float, default=0.0, help="Proportion de réponses 500")
+    parser.add_argument("--taux-429", type=float, default=0.0, help="Proportion de réponses 429")
+    parser.add_argument("--retry-after", type=int, default=0, help="Retry-After des réponses 429 (s)")
+    parser.add_argument("--graine", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.graine)
+    with ServeurRoutageSimule(latence=args.latence, dispersion=args.dispersion, taux_erreur=args.taux_erreur,
+                              taux_429=args.taux_429, retry_after=args.retry_after, graine=args.graine) as serveur, \
+            tempfile.TemporaryDirectory() as dossier, \
+            mock.patch.object(st, "secrets", parametres(args, serveur)):
+        vider_ressources()
+        mesure = MesureRequetes(moteur_routage.session_ors())
+
+        durees_totales = []
+        for repetition in range(args.repetitions):
+            # Cache des routes vide à chaque passage : toutes les requêtes atteignent le serveur
+            cache = CacheSQLite(f"routes_{repetition}", dossier=Path(dossier))
+            with mock.patch.object(get_route, "cache_routes", lambda: cache):
+                df = voyage_aleatoire(rng, args.lignes)
+                debut = time.perf_counter()
+                distances, _, _, _ = get_route.calculate_routes(df)
+                durees_totales.append(time.perf_counter() - debut)
+            manquants = sum(d is None for d in distances[:-1])
+            print(f"Passage {repetition + 1} : {durees_totales[-1]:.2f} s, "
+                  f"{args.lignes - 1 - manquants}/{args.lignes - 1} segments calculés")
+
+        durees = np.array(mesure.durees) * 1000
+        statuts = pd.Series(mesure.statuts).value_counts().sort_index().to_dict()
+        duree_totale = sum(durees_totales)
+        print()
+        print(f"Fournisseur {args.fournisseur}, {args.threads} threads, multi_points={args.multi_points}")
+        print(f"Requêtes HTTP : {len(durees)} ({statuts})")
+        print(f"Débit : {len(durees) / duree_totale:.1f} requêtes/s, "
+              f"{args.repetitions * (args.lignes - 1) / duree_totale:.1f} segments/s")
+        if len(durees):
+            p50, p95, p99 = np.percentile(durees, [50, 95, 99])
+            print(f"Latence client (ms) : p50 {p50:.0f} | p95 {p95:.0f} | p99 {p99:.0f} | max {durees.max():.0f}")
+        stats = serveur.statistiques()
+        print(f"Latence serveur (ms) : p50 {stats['p50_ms']:.0f} | p95 {stats['p95_ms']:.0f} | p99 {stats['p99_ms']:.0f}")
+    vider_ressources()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from core import identifier_sejours_multiples
+from tests.sejours_reference import identifier_sejours_multiples_boucle, voyage_aleatoire
+
+
+def mesurer(fonction, df, repetitions):
+    """Retourne la meilleure durée d'exécution, en secondes"""
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction(df)
+        durees.append(time.perf_counter() - debut)
+    return min(durees)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mesure identifier_sejours_multiples sur un voyage aléatoire "
+                                                 "(à lancer depuis la racine : python -m benchmarks.sejours_multiples)")
+    parser.add_argument("--lignes", type=int, nargs="+", default=[1_000, 10_000, 20_000])
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--sans-boucle", action="store_true", help="Ne pas mesurer l'implémentation d'origine (lente)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for nb_lignes in args.lignes:
+        df = voyage_aleatoire(rng, nb_lignes)
+        vectorise = mesurer(identifier_sejours_multiples, df, args.repetitions)
+        ligne = f"{nb_lignes:>7} lignes : vectorisé {vectorise * 1000:8.1f} ms"
+        if not args.sans_boucle:
+            resultat = identifier_sejours_multiples(df)
+            pd.testing.assert_frame_equal(resultat, identifier_sejours_multiples_boucle(df))
+            boucle = mesurer(identifier_sejours_multiples_boucle, df, 1)
+            ligne += f" | boucle {boucle * 1000:8.1f} ms | x{boucle / vectorise:.0f}"
+        print(ligne)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,272 +1,486 @@
+import atexit
 import streamlit as st
 import pandas as pd
-import base64
-from github import Github, GithubException
+import numpy as np
 from io import BytesIO
 from streamlit_pdf_viewer import pdf_viewer
 import json
+import pyarrow.parquet as pq
+from utils.cache_carte import vider_cache_carte
+from utils.cache_pdf import cache_pdf
+from utils.geometrie import CheminsParesseux, migrer_chemins, table_arrow
+from utils.journal_parquet import lire_avec_journal, preparer_ecriture
+from utils.magasin_geometrie import COLONNE_SEGMENT, joindre_geometrie, magasin_geometrie, separer_geometrie
+from utils.parametres import lire_parametre
+from utils.sauvegarde_differee import FileSauvegardes
+from utils.stockage import depot_donnees
 
-@st.cache_data
 def charger_donnees(nom_fichier="data/hebergements_chemins.parquet", format=None, branche="main"):
     """
-    Fonction pour charger des données depuis un dépôt GitHub privé.
+    Fonction pour charger des données depuis le dépôt configuré (GitHub privé par défaut,
+    voir utils.stockage).
+
+    Les fichiers sont lus depuis le dossier local des blobs : avec GitHub, seule
+    l'arborescence de la branche est revalidée (requête conditionnelle), et un
+    fichier n'est téléchargé que si son contenu a changé. Un fichier Parquet et
+    ses patchs ne sont rejoués qu'une fois par version (SHA de la base et des
+    patchs) ; une sauvegarde encore en file d'attente est servie à la place.
 
     Args:
         nom_fichier: Chemin du fichier relatif à la racine du dépôt
         format: Format de conversion souhaité
         branche: Nom de la branche (par défaut: "main")
-    """
-    try:
-        # Récupérer les identifiants depuis les secrets Streamlit
-        token = st.secrets["github"]["token"]
-        repo_name = st.secrets["github"]["repo_name"]
-
-        # Initialiser le client GitHub
-        g = Github(token)
-        repo = g.get_repo(repo_name)
 
-        try:
-            # Récupérer le contenu du fichier à partir de la branche spécifiée
-            contents = repo.get_contents(nom_fichier, ref=branche)
+    Returns:
+        Un DataFrame pour le format parquet ; sinon un objet fichier (projeté en
+        mémoire) que l'appelant doit fermer, par exemple avec `with`
+    """
+    # Une sauvegarde encore en file d'attente est plus récente que le dépôt
+    en_attente = file_sauvegardes().contenu_en_attente(nom_fichier, branche)
+    if en_attente is not None:
+        if isinstance(en_attente, pd.DataFrame):
+            df = en_attente.copy()
+        elif format == 'parquet':
+            df = migrer_chemins(pd.read_parquet(BytesIO(_convertir_contenu(en_attente, nom_fichier))))
+        else:
+            return BytesIO(_convertir_contenu(en_attente, nom_fichier))
 
-            # Décoder le contenu du fichier
-            decoded_content = base64.b64decode(contents.content)
+        # Même forme qu'une fois écrit (colonne Segment, tracés lus à part) : la
+        # carte garde la même empreinte avant et après l'écriture
+        df, geometrie = _separer_pour_stockage(df, nom_fichier)
+        if geometrie is not None:
+            magasin_geometrie(nom_fichier, branche).retenir(geometrie)
+        return df
 
-            # Créer un objet BytesIO pour lire le contenu
-            buffer = BytesIO(decoded_content)
+    try:
+        depot = depot_donnees()
 
+        try:
             # Convertir selon le format demandé
             if format == 'parquet':
-                return pd.read_parquet(buffer)
+                # Lecture directe du fichier dans le dossier des blobs, puis des patchs de son journal
+                df, _ = lire_avec_journal(depot, nom_fichier, branche)
+                return df
             else:
-                buffer.seek(0)
-                return buffer
+                # Fichier projeté en mémoire : lu à la demande, sans copie complète
+                return depot.ouvrir(nom_fichier, branche)
 
         except Exception as e:
             st.warning(f"Erreur lors de l'accès au fichier {nom_fichier} sur la branche {branche}: {e}")
             return None
 
     except Exception as e:
-        st.error(f"Erreur lors de l'accès au dépôt GitHub: {e}")
+        st.error(f"Erreur lors de l'accès au dépôt de données: {e}")
         return None
 
 
-def sauvegarder_donnees(contenu, nom_fichier, message_commit="Mise à jour des données", branche="main"):
+def _separer_pour_stockage(contenu, nom_fichier):
     """
-    Fonction pour sauvegarder des données dans un dépôt GitHub privé sans créer de copie locale.
+    Sépare les tracés d'un DataFrame enregistré en Parquet, sauf si
+    stockage.geometrie_separee vaut false.
 
     Args:
-        contenu: Contenu à sauvegarder (DataFrame, dict, str, bytes, ou BytesIO)
-        nom_fichier: Nom du fichier à sauvegarder
-        message_commit: Message pour le commit GitHub
-        branche: Nom de la branche (par défaut: "main")
+        contenu: Contenu à sauvegarder
+        nom_fichier: Chemin du fichier dans le dépôt
 
     Returns:
-        bool: True si la sauvegarde a réussi, False sinon
+        Tuple (contenu à enregistrer, DataFrame des tracés ou None s'ils ne sont pas séparés)
     """
-    try:
-        # Récupérer les identifiants depuis les secrets Streamlit
-        token = st.secrets["github"]["token"]
-        repo_name = st.secrets["github"]["repo_name"]
-
-        # Convertir le contenu en bytes selon son type
-        if isinstance(contenu, pd.DataFrame):
-            # Pour un DataFrame pandas
-            buffer = BytesIO()
-            if nom_fichier.endswith('.parquet'):
-                contenu.to_parquet(buffer, index=False)
-            elif nom_fichier.endswith('.csv'):
-                contenu.to_csv(buffer, index=False)
-            else:
-                contenu.to_csv(buffer, index=False)  # CSV par défaut
-            buffer.seek(0)
-            github_content = buffer.read()
+    if isinstance(contenu, pd.DataFrame) and nom_fichier.endswith('.parquet') \
+            and "Chemin" in contenu.columns and lire_parametre("stockage", "geometrie_separee", True):
+        return separer_geometrie(contenu)
+    return contenu, None
 
-        elif isinstance(contenu, dict) or isinstance(contenu, list):
-            # Pour un dictionnaire ou une liste (format JSON)
-            github_content = json.dumps(contenu).encode('utf-8')
 
-        elif isinstance(contenu, str):
-            # Pour une chaîne de caractères
-            github_content = contenu.encode('utf-8')
+def _convertir_contenu(contenu, nom_fichier):
+    """
+    Convertit un contenu à sauvegarder en octets, selon son type et l'extension du fichier.
 
-        elif isinstance(contenu, bytes):
-            # Pour des données binaires
-            github_content = contenu
+    Args:
+        contenu: DataFrame, dict, list, str, bytes ou BytesIO
+        nom_fichier: Nom du fichier (détermine le format d'un DataFrame)
 
-        elif isinstance(contenu, BytesIO):
-            # Pour un BytesIO
-            contenu.seek(0)
-            github_content = contenu.read()
+    Returns:
+        bytes
 
+    Raises:
+        TypeError si le type de contenu n'est pas pris en charge
+    """
+    if isinstance(contenu, pd.DataFrame):
+        # Pour un DataFrame pandas
+        buffer = BytesIO()
+        if nom_fichier.endswith('.parquet'):
+            # Chemin est écrit en list<float32> natif plutôt qu'en chaînes JSON
+            pq.write_table(table_arrow(contenu), buffer)
+        elif nom_fichier.endswith('.csv'):
+            contenu.to_csv(buffer, index=False)
         else:
-            st.error(f"Type de contenu non pris en charge: {type(contenu)}")
-            return False
+            contenu.to_csv(buffer, index=False)  # CSV par défaut
+        return buffer.getvalue()
 
-        # Initialiser le client GitHub
-        g = Github(token)
-        repo = g.get_repo(repo_name)
+    elif isinstance(contenu, dict) or isinstance(contenu, list):
+        # Pour un dictionnaire ou une liste (format JSON)
+        return json.dumps(contenu).encode('utf-8')
 
-        try:
-            # Vérifier si le fichier existe déjà
-            contents = repo.get_contents(nom_fichier, ref=branche)
-            # Mettre à jour le fichier existant
-            repo.update_file(
-                path=contents.path,
-                message=message_commit,
-                content=github_content,
-                sha=contents.sha,
-                branch=branche
-            )
-        except GithubException as e:
-            if e.status == 404:
-                # Si le fichier n'existe pas, le créer
-                repo.create_file(
-                    path=nom_fichier,
-                    message=message_commit,
-                    content=github_content,
-                    branch=branche
-                )
-            else:
-                raise e
+    elif isinstance(contenu, str):
+        # Pour une chaîne de caractères
+        return contenu.encode('utf-8')
+
+    elif isinstance(contenu, bytes):
+        # Pour des données binaires
+        return contenu
+
+    elif isinstance(contenu, BytesIO):
+        # Pour un BytesIO
+        return contenu.getvalue()
+
+    raise TypeError(f"Type de contenu non pris en charge: {type(contenu)}")
+
+
+def _ecrire_lot(fichiers, message_commit="Mise à jour des données", branche="main"):
+    """
+    Écrit plusieurs fichiers dans le dépôt de données en un seul commit, sans affichage.
 
-        # Invalider le cache pour forcer un rechargement des données
-        if 'charger_donnees' in globals() and hasattr(charger_donnees, 'clear'):
-            charger_donnees.clear()
+    Un DataFrame enregistré en Parquet n'est pas réécrit en entier : seules ses
+    lignes modifiées sont ajoutées au journal du fichier (voir
+    utils.journal_parquet), sauf si stockage.journal vaut false. Ses tracés sont
+    enregistrés à part, dans le magasin des tracés (voir utils.magasin_geometrie),
+    sauf si stockage.geometrie_separee vaut false.
 
-        st.success(f"✅ Fichier {nom_fichier} sauvegardé sur GitHub")
+    Args:
+        fichiers: dict {nom du fichier: contenu (voir _convertir_contenu), ou None pour le supprimer}
+        message_commit: Message pour le commit GitHub
+        branche: Nom de la branche
+
+    Returns:
+        Le SHA du commit créé, ou None si aucun fichier n'a changé
+
+    Raises:
+        TypeError si un contenu n'est pas pris en charge, requests.HTTPError en cas d'échec de l'API
+    """
+    depot = depot_donnees()
+    journal = lire_parametre("stockage", "journal", True)
+
+    octets = {}
+    ecrits = {}  # nom -> identifiants des tracés écrits
+    for nom, contenu in fichiers.items():
+        contenu, geometrie = _separer_pour_stockage(contenu, nom)
+        if geometrie is not None:
+            # Métadonnées et tracés dans le même commit
+            octets.update(magasin_geometrie(nom, branche).preparer_ecriture(geometrie))
+            ecrits[nom] = geometrie[COLONNE_SEGMENT].tolist()
+
+        if journal and isinstance(contenu, pd.DataFrame) and nom.endswith('.parquet'):
+            octets.update(preparer_ecriture(depot, nom, contenu, branche))
+        else:
+            octets[nom] = None if contenu is None else _convertir_contenu(contenu, nom)
+    commit = depot.commiter(octets, message_commit, branche)
+
+    # Les tracés sont désormais dans un paquet : inutile de les garder en mémoire
+    for nom, segments in ecrits.items():
+        magasin_geometrie(nom, branche).oublier(segments)
+
+    # Invalider la carte mise en cache pour forcer sa reconstruction
+    vider_cache_carte()
+    return commit
+
+
+def sauvegarder_lot(fichiers, message_commit="Mise à jour des données", branche="main"):
+    """
+    Sauvegarde plusieurs fichiers dans le dépôt de données en un seul commit.
+
+    Les fichiers inchangés ne sont pas renvoyés ; si aucun n'a changé, aucun
+    commit n'est créé. Tous les fichiers arrivent ensemble ou aucun.
+
+    Args:
+        fichiers: dict {nom du fichier: contenu (voir _convertir_contenu), ou None pour le supprimer}
+        message_commit: Message pour le commit GitHub
+        branche: Nom de la branche (par défaut: "main")
+
+    Returns:
+        bool: True si la sauvegarde a réussi, False sinon
+    """
+    try:
+        commit = _ecrire_lot(fichiers, message_commit, branche)
+
+        noms = ", ".join(fichiers)
+        if commit is None:
+            st.info(f"Aucun changement à sauvegarder ({noms})")
+        else:
+            st.success(f"✅ Fichier(s) {noms} sauvegardé(s) ({depot_donnees().nom})")
         return True
 
+    except TypeError as e:
+        st.error(str(e))
+        return False
+
     except Exception as e:
-        st.error(f"Erreur lors de la sauvegarde sur GitHub: {e}")
+        st.error(f"Erreur lors de la sauvegarde ({depot_donnees().nom}): {e}")
         import traceback
         st.error(traceback.format_exc())
         return False
 
 
-@st.cache_data()
-def identifier_sejours_multiples(df):
-    """Identifie les séjours multiples au même endroit et met à jour les durées"""
-    # Créer une copie pour éviter de modifier le DataFrame original
-    df_avec_duree = df.copy()
+def sauvegarder_donnees(contenu, nom_fichier, message_commit="Mise à jour des données", branche="main"):
+    """
+    Fonction pour sauvegarder des données dans un dépôt GitHub privé sans créer de copie locale.
 
-    # Initialiser les colonnes pour la durée du séjour et la date de fin
-    df_avec_duree['Duree_Sejour'] = 1
-    df_avec_duree['Date_Fin'] = None
+    Args:
+        contenu: Contenu à sauvegarder (DataFrame, dict, str, bytes, ou BytesIO)
+        nom_fichier: Nom du fichier à sauvegarder
+        message_commit: Message pour le commit GitHub
+        branche: Nom de la branche (par défaut: "main")
 
-    # Première passe pour identifier les groupes de séjour
-    groupes_sejour = []
-    groupe_actuel = [0]  # Commencer avec la première ligne
+    Returns:
+        bool: True si la sauvegarde a réussi, False sinon
+    """
+    return sauvegarder_lot({nom_fichier: contenu}, message_commit, branche)
 
-    for i in range(1, len(df_avec_duree)):
-        # Comparer avec le dernier élément du groupe actuel
-        dernier_index = groupe_actuel[-1]
 
-        # Vérifier si l'adresse actuelle est la même que celle du dernier élément du groupe
-        meme_adresse = df_avec_duree.iloc[dernier_index]['Adresse'] == df_avec_duree.iloc[i]['Adresse']
-        memes_coords = (df_avec_duree.iloc[dernier_index]['Latitude'] == df_avec_duree.iloc[i]['Latitude'] and
-                        df_avec_duree.iloc[dernier_index]['Longitude'] == df_avec_duree.iloc[i]['Longitude'])
+@st.cache_resource
+def file_sauvegardes():
+    """
+    Retourne la file des sauvegardes en arrière-plan, partagée entre les sessions.
 
-        if meme_adresse or memes_coords:
-            # Même endroit, ajouter à ce groupe
-            groupe_actuel.append(i)
-        else:
-            # Nouvel endroit, terminer le groupe actuel et en coammencer un nouveau
-            groupes_sejour.append(groupe_actuel)
-            groupe_actuel = [i]
+    Paramètres (section github) :
+        delai_sauvegarde: Inactivité (s) avant l'envoi d'une rafale de modifications (défaut 2)
+        delai_max_sauvegarde: Attente maximale (s) d'une modification avant son envoi (défaut 10)
+    """
+    file = FileSauvegardes(
+        _ecrire_lot,
+        delai=lire_parametre("github", "delai_sauvegarde", 2.0),
+        delai_max=lire_parametre("github", "delai_max_sauvegarde", 10.0),
+    )
+    # Ne rien perdre à l'arrêt du serveur. Le dépôt est créé avant : atexit appelle les
+    # fonctions en ordre inverse, la file est donc vidée avant la dernière synchronisation
+    depot_donnees()
+    atexit.register(file.arreter)
+    return file
+
+
+def sauvegarder_en_arriere_plan(contenu, nom_fichier, message_commit="Mise à jour des données", branche="main"):
+    """
+    Met une sauvegarde en file d'attente et retourne immédiatement.
 
-    # Ajouter le dernier groupe
-    groupes_sejour.append(groupe_actuel)
+    Les sauvegardes successives d'un même fichier sont fusionnées : seule la
+    dernière version est envoyée, en un seul commit. Tant qu'elle n'est pas
+    écrite, charger_donnees retourne cette version.
 
-    # Deuxième passe pour mettre à jour les durées et dates
-    for groupe in groupes_sejour:
-        if len(groupe) > 1:  # Séjour multiple
-            premier_index = groupe[0]
-            dernier_index = groupe[-1]
+    Args:
+        contenu: Contenu à sauvegarder (DataFrame, dict, str, bytes, ou BytesIO)
+        nom_fichier: Nom du fichier à sauvegarder
+        message_commit: Message pour le commit GitHub
+        branche: Nom de la branche (par défaut: "main")
 
-            # Mettre à jour le premier élément du groupe
-            df_avec_duree.at[premier_index, 'Duree_Sejour'] = len(groupe)
-            df_avec_duree.at[premier_index, 'Date_Fin'] = df_avec_duree.iloc[dernier_index]['Nuit']
+    Returns:
+        bool: True (la sauvegarde est en attente, voir file_sauvegardes().etat())
+    """
+    if isinstance(contenu, pd.DataFrame):
+        # Copie : l'appelant peut continuer à modifier son DataFrame
+        contenu = contenu.copy()
+    file_sauvegardes().soumettre(nom_fichier, contenu, message_commit, branche)
+    return True
+
+
+@st.cache_data()
+def identifier_sejours_multiples(df):
+    """
+    Identifie les séjours multiples au même endroit et met à jour les durées.
+
+    Deux nuits consécutives appartiennent au même séjour si elles ont la même adresse
+    ou les mêmes coordonnées. Les groupes sont numérotés par comparaison décalée puis
+    somme cumulée : la première ligne d'un séjour multiple reçoit sa durée et sa date
+    de fin, les suivantes sont marquées -1 (à fusionner).
+    """
+    # Créer une copie pour éviter de modifier le DataFrame original
+    df_avec_duree = df.copy()
+    n = len(df_avec_duree)
 
-            # Marquer les autres éléments du groupe comme à fusionner
-            for i in groupe[1:]:
-                df_avec_duree.at[i, 'Duree_Sejour'] = -1
+    # Initialiser les colonnes pour la durée du séjour et la date de fin
+    duree_sejour = np.ones(n, dtype=np.int64)
+    date_fin = np.full(n, None, dtype=object)
+
+    if n > 1:
+        # Comparer chaque ligne à la précédente ; les tableaux object conservent la
+        # sémantique d'égalité Python (None == None, mais NaN != NaN)
+        adresses = df_avec_duree['Adresse'].to_numpy(dtype=object)
+        latitudes = df_avec_duree['Latitude'].to_numpy(dtype=object)
+        longitudes = df_avec_duree['Longitude'].to_numpy(dtype=object)
+        meme_endroit = ((adresses[1:] == adresses[:-1])
+                        | ((latitudes[1:] == latitudes[:-1]) & (longitudes[1:] == longitudes[:-1])))
+
+        # Un nouveau groupe commence à chaque changement d'endroit
+        debut_groupe = np.concatenate(([True], ~meme_endroit.astype(bool)))
+        groupes = np.cumsum(debut_groupe) - 1
+        tailles = np.bincount(groupes)
+        premiers = np.flatnonzero(debut_groupe)
+        derniers = premiers + tailles - 1
+
+        # Mettre à jour le premier élément de chaque séjour multiple
+        multiples = tailles > 1
+        nuits = df_avec_duree['Nuit'].to_numpy(dtype=object)
+        duree_sejour[~debut_groupe] = -1
+        duree_sejour[premiers[multiples]] = tailles[multiples]
+        date_fin[premiers[multiples]] = nuits[derniers[multiples]]
+
+    df_avec_duree['Duree_Sejour'] = duree_sejour
+    # dtype object explicite : pas de conversion automatique en datetime64
+    df_avec_duree['Date_Fin'] = pd.Series(date_fin, index=df_avec_duree.index, dtype=object)
 
     return df_avec_duree
 
-@st.cache_data
-def charger_routes_existantes(df):
+def charger_routes_existantes(df, nom_fichier="data/hebergements_chemins.parquet", branche="main"):
     """
     Charge les routes, distances et durées existantes dans le DataFrame
     sans recalculer les valeurs manquantes.
 
+    Aucun tracé n'est décodé ici : les distances et durées sont des vues NumPy sur
+    les colonnes, et les tracés sont décodés à la demande par l'accesseur retourné.
+    Quand les tracés sont stockés à part (colonne Segment), ils ne sont lus que
+    lorsque la carte les dessine.
+
     Args:
         df: DataFrame avec les données du voyage
+        nom_fichier: Fichier dont le magasin des tracés est lu (si df n'a pas de colonne Chemin)
+        branche: Nom de la branche
 
     Returns:
-        distances, durations, routes, df
+        distances, durations (tableaux NumPy, NaN si absent), routes (CheminsParesseux), df
     """
-    import json
-    import pandas as pd
+    def colonne(nom):
+        if nom not in df.columns:
+            return np.full(len(df), np.nan)
+        valeurs = pd.to_numeric(df[nom], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        if len(valeurs):
+            # Le dernier point n'a pas de segment sortant
+            valeurs = valeurs.copy()
+            valeurs[-1] = np.nan
+        return valeurs
+
+    if "Chemin" not in df.columns and COLONNE_SEGMENT in df.columns:
+        routes = CheminsParesseux.depuis_segments(df[COLONNE_SEGMENT], magasin_geometrie(nom_fichier, branche).lire)
+    else:
+        routes = CheminsParesseux.depuis_df(df)
+
+    return colonne("Distance (km)"), colonne("Durée (h)"), routes, df
 
-    # Créer une copie du DataFrame pour éviter de modifier l'original
-    df = df.copy()
 
-    # Initialiser les listes pour stocker les résultats
-    distances = []
-    durations = []
-    routes = []
+def charger_geometrie(df, nom_fichier="data/hebergements_chemins.parquet", branche="main"):
+    """
+    Ajoute les tracés (Chemin, Chemin_Niveaux) aux métadonnées du voyage, avant un recalcul des routes.
 
-    # Parcourir le DataFrame pour extraire les informations existantes
-    for i in range(len(df) - 1):  # On parcourt jusqu'à l'avant-dernier point
-        # Récupérer les valeurs existantes
-        distance = df.iloc[i]["Distance (km)"] if "Distance (km)" in df.columns else None
-        duration = df.iloc[i]["Durée (h)"] if "Durée (h)" in df.columns else None
+    Args:
+        df: DataFrame avec les données du voyage
+        nom_fichier: Fichier dont le magasin des tracés est lu
+        branche: Nom de la branche
+
+    Returns:
+        Le DataFrame avec ses tracés
+    """
+    return joindre_geometrie(df, magasin_geometrie(nom_fichier, branche))
+
+
+def prechauffer_pdfs(liens, branche="main"):
+    """
+    Lance en arrière-plan le calcul des aperçus des PDF (vignette, texte) qui n'en ont pas encore.
 
-        # Récupérer les coordonnées du chemin
-        route_coords = df.iloc[i]["Chemin"] if "Chemin" in df.columns else None
+    Args:
+        liens: Chemins des PDF dans le dépôt (valeurs vides ignorées)
+        branche: Nom de la branche
+    """
+    try:
+        cache_pdf().prechauffer([lien for lien in liens if isinstance(lien, str) and lien], branche)
+    except Exception as e:
+        print(f"Préchargement des aperçus PDF impossible : {e}")
 
-        # Convertir les coordonnées JSON en liste si nécessaire
-        if isinstance(route_coords, str) and route_coords:
-            try:
-                route_coords = json.loads(route_coords)
-            except json.JSONDecodeError:
-                route_coords = []
 
-        # Ajouter aux listes
-        distances.append(distance)
-        durations.append(duration)
-        routes.append(route_coords if isinstance(route_coords, list) else route_coords)
+def afficher_pdf_pagine(chemin_pdf, nb_pages, cle=""):
+    """
+    Affiche un long PDF page par page : seules la page courante et ses voisines
+    sont extraites et envoyées au navigateur.
 
-    # Ajouter une dernière valeur pour correspondre à la taille du DataFrame
-    distances.append(None)
-    durations.append(None)
-    routes.append([])
+    Args:
+        chemin_pdf: Chemin du fichier PDF dans le dépôt
+        nb_pages: Nombre de pages du document
+        cle: Préfixe des clés des widgets
+    """
+    page = st.number_input(f"Page (sur {nb_pages})", min_value=1, max_value=nb_pages, value=1, step=1,
+                           key=f"{cle}pdf_page_{chemin_pdf}")
+    premiere = max(page - 2, 0)
+    derniere = min(page, nb_pages - 1)
 
-    return distances, durations, routes, df
+    try:
+        extrait = cache_pdf().extraire_pages(chemin_pdf, premiere, derniere)
+        pdf_viewer(input=extrait, width="100%", render_text=True,
+                   scroll_to_page=page - premiere, key=f"{cle}pdf_vue_{chemin_pdf}_{premiere}")
+    except Exception as e:
+        # Extraction impossible : document entier, mais seules ces pages sont rendues
+        print(f"Extraction des pages de {chemin_pdf} impossible : {e}")
+        contenu_pdf = charger_donnees(nom_fichier=chemin_pdf, format="binary")
+        if not contenu_pdf:
+            st.error(f"Impossible de charger le fichier PDF: {chemin_pdf}")
+            return
+        # Projection fermée dès la lecture : elle garderait sinon le fichier ouvert
+        with contenu_pdf:
+            pdf_data = contenu_pdf.read()
+        pdf_viewer(input=pdf_data, width="100%", render_text=True,
+                   pages_to_render=list(range(premiere + 1, derniere + 2)))
 
 
-def ouvrir_pdf(chemin_pdf, use_expander = False):
+def ouvrir_pdf(chemin_pdf, use_expander = False, cle=""):
 
     """
     Affiche un PDF en utilisant streamlit-pdf-viewer
 
+    Si un aperçu est disponible (voir utils.cache_pdf), seule la vignette de la
+    première page est affichée ; le document complet n'est chargé et envoyé au
+    navigateur qu'à la demande. Un aperçu pas encore calculé l'est en
+    arrière-plan : l'affichage n'attend pas le rendu du document.
+
     Args:
-        chemin_pdf: Chemin du fichier PDF dans le dépôt GitHub
+        chemin_pdf: Chemin du fichier PDF dans le dépôt
+        cle: Préfixe des clés des widgets (un même PDF peut être ouvert à deux endroits)
     """
-    import os
+    try:
+        apercu = cache_pdf().apercu(chemin_pdf, attendre=False)
+    except Exception as e:
+        print(f"Aperçu de {chemin_pdf} indisponible : {e}")
+        apercu = None
+
+    if apercu is not None:
+        st.image(str(apercu["vignette"]), use_container_width=True)
+        st.caption(f"{apercu['pages']} page(s)")
+        if apercu["texte"].strip() and st.toggle("Texte du document", key=f"{cle}pdf_texte_{chemin_pdf}"):
+            st.text(apercu["texte"])
+    elif cache_pdf().disponible():
+        st.caption("⏳ Aperçu en préparation")
+
+    if apercu is not None or cache_pdf().disponible():
+        if not st.toggle("📖 Afficher le document complet", key=f"{cle}pdf_complet_{chemin_pdf}"):
+            return
+
+    # Nombre de pages connu sans pypdfium2 : un long document reste affiché page par page
+    try:
+        nb_pages = apercu["pages"] if apercu is not None else cache_pdf().nombre_pages(chemin_pdf)
+    except Exception as e:
+        print(f"Nombre de pages de {chemin_pdf} inconnu : {e}")
+        nb_pages = None
+    if nb_pages is not None and nb_pages > lire_parametre("pdf", "seuil_pagination", 3):
+        afficher_pdf_pagine(chemin_pdf, nb_pages, cle)
+        return
 
-    # Charger le fichier PDF depuis GitHub en utilisant votre fonction existante
+    # Charger le fichier PDF depuis le dépôt (projeté en mémoire)
     contenu_pdf = charger_donnees(nom_fichier=chemin_pdf, format="binary")
 
     if not contenu_pdf:
         st.error(f"Impossible de charger le fichier PDF: {chemin_pdf}")
         return
 
-    # Récupérer les données binaires du PDF
+    # Récupérer les données binaires du PDF, puis fermer la projection en mémoire
     if hasattr(contenu_pdf, 'read'):
-        contenu_pdf.seek(0)
-        pdf_data = contenu_pdf.read()
+        with contenu_pdf:
+            contenu_pdf.seek(0)
+            pdf_data = contenu_pdf.read()
     else:
         pdf_data = contenu_pdf
 
@@ -275,4 +489,5 @@ def ouvrir_pdf(chemin_pdf, use_expander = False):
         input=pdf_data,  # Données binaires du PDF
         width="100%",    # Utiliser toute la largeur disponible
         render_text=True, # Activer la sélection de texte
-    )
\ No newline at end of file
+        key=f"{cle}pdf_vue_{chemin_pdf}",
+    )
@@ -0,0 +1,65 @@
+import pandas as pd
+
+
+def identifier_sejours_multiples_boucle(df):
+    """Implémentation d'origine (boucle ligne par ligne), référence des tests et des mesures"""
+    df_avec_duree = df.copy()
+    df_avec_duree['Duree_Sejour'] = 1
+    df_avec_duree['Date_Fin'] = None
+
+    groupes_sejour = []
+    groupe_actuel = [0]
+    for i in range(1, len(df_avec_duree)):
+        dernier_index = groupe_actuel[-1]
+        meme_adresse = df_avec_duree.iloc[dernier_index]['Adresse'] == df_avec_duree.iloc[i]['Adresse']
+        memes_coords = (df_avec_duree.iloc[dernier_index]['Latitude'] == df_avec_duree.iloc[i]['Latitude'] and
+                        df_avec_duree.iloc[dernier_index]['Longitude'] == df_avec_duree.iloc[i]['Longitude'])
+        if meme_adresse or memes_coords:
+            groupe_actuel.append(i)
+        else:
+            groupes_sejour.append(groupe_actuel)
+            groupe_actuel = [i]
+    groupes_sejour.append(groupe_actuel)
+
+    for groupe in groupes_sejour:
+        if len(groupe) > 1:
+            df_avec_duree.at[groupe[0], 'Duree_Sejour'] = len(groupe)
+            df_avec_duree.at[groupe[0], 'Date_Fin'] = df_avec_duree.iloc[groupe[-1]]['Nuit']
+            for i in groupe[1:]:
+                df_avec_duree.at[i, 'Duree_Sejour'] = -1
+
+    return df_avec_duree
+
+
+def voyage_aleatoire(rng, nb_lignes, nb_adresses=6):
+    """
+    Voyage aléatoire : peu d'adresses distinctes, si bien qu'une même adresse
+    revient à plusieurs endroits du voyage (A, A, B, A, ...). Quelques lignes
+    ont des coordonnées manquantes, ou les coordonnées d'une autre adresse.
+    """
+    adresses = rng.integers(0, nb_adresses, nb_lignes)
+    # Séjours de plusieurs nuits : une ligne sur deux reprend l'adresse précédente
+    repetitions = rng.random(nb_lignes) < 0.5
+    for i in range(1, nb_lignes):
+        if repetitions[i]:
+            adresses[i] = adresses[i - 1]
+
+    latitudes = 40.0 + adresses.astype(float)
+    longitudes = -70.0 - adresses.astype(float)
+    # Coordonnées d'un voisin (même endroit sous une autre adresse) ou manquantes
+    autres = rng.random(nb_lignes) < 0.1
+    latitudes[autres] = 40.0 + rng.integers(0, nb_adresses, autres.sum())
+    longitudes[autres] = -70.0 - (latitudes[autres] - 40.0)
+    manquantes = rng.random(nb_lignes) < 0.1
+    latitudes[manquantes] = float("nan")
+    longitudes[manquantes] = float("nan")
+
+    libelles = pd.Series([f"{a} rue du Lac" for a in adresses], dtype=object)
+    libelles[rng.random(nb_lignes) < 0.05] = None
+    return pd.DataFrame({
+        "Nom": [f"Hébergement {a}" for a in adresses],
+        "Adresse": libelles,
+        "Latitude": latitudes,
+        "Longitude": longitudes,
+        "Nuit": pd.date_range("2025-06-01", periods=nb_lignes, freq="D"),
+    })
@@ -0,0 +1,23 @@
+import zlib
+
+from utils.cache_pdf import compter_pages
+
+
+def test_compter_pages_arbre_en_clair():
+    # La racine compte toutes les pages, les noeuds intermédiaires une partie
+    pdf = (b"%PDF-1.4\n1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n"
+           b"2 0 obj\n<< /Type /Pages /Kids [3 0 R 4 0 R] /Count 7 >>\nendobj\n"
+           b"3 0 obj\n<< /Type /Pages /Parent 2 0 R /Kids [] /Count 4 /Resources << /Font << >> >> >>\nendobj\n"
+           b"5 0 obj\n<< /Type /Outlines /Count 12 >>\nendobj\n")
+    assert compter_pages(pdf) == 7
+
+
+def test_compter_pages_flux_objets():
+    flux = zlib.compress(b"2 0 << /Type /Pages /Kids [3 0 R] /Count 12 >>")
+    pdf = (b"%PDF-1.5\n5 0 obj\n<< /Type /ObjStm /N 1 /First 4 /Filter /FlateDecode >>\nstream\n"
+           + flux + b"\nendstream\nendobj\n")
+    assert compter_pages(pdf) == 12
+
+
+def test_compter_pages_inconnu():
+    assert compter_pages(b"%PDF-1.4\n<< /Type /Page >>") is None
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+from utils.diff_voyage import appliquer_changements, assurer_identifiants, calculer_changements
+
+
+def voyage():
+    return pd.DataFrame({
+        "Id": ["a", "b", "c", "d"],
+        "Adresse": ["A", "B", "C", "D"],
+        "Type_Deplacement": ["Voiture", "Voiture", "Marche", "Voiture"],
+        "Latitude": [1.0, 2.0, 3.0, 4.0],
+        "Longitude": [1.0, 2.0, 3.0, 4.0],
+    })
+
+
+def editable(df):
+    return df[["Id", "Adresse", "Type_Deplacement"]]
+
+
+def test_insertion():
+    df = voyage()
+    apres = assurer_identifiants(pd.concat([
+        editable(df),
+        pd.DataFrame({"Id": [None], "Adresse": ["E"], "Type_Deplacement": ["Marche"]}),
+    ], ignore_index=True))
+    changements = calculer_changements(editable(df), apres)
+    nouvel_id = apres["Id"].iloc[-1]
+    assert changements.inseres == [nouvel_id]
+    assert not changements.supprimes and not changements.modifies
+    assert changements.a_router() == {nouvel_id}
+
+    resultat = appliquer_changements(df, apres, changements)
+    assert resultat["Id"].tolist() == ["a", "b", "c", "d", nouvel_id]
+    assert resultat["Adresse"].iloc[-1] == "E"
+    assert np.isnan(resultat["Latitude"].iloc[-1])
+
+
+def test_suppression():
+    df = voyage()
+    apres = editable(df).drop(index=1)
+    changements = calculer_changements(editable(df), apres)
+    assert changements.supprimes == ["b"]
+    assert not changements.inseres and not changements.modifies
+
+    resultat = appliquer_changements(df, apres, changements)
+    assert resultat["Id"].tolist() == ["a", "c", "d"]
+    assert resultat["Latitude"].tolist() == [1.0, 3.0, 4.0]
+
+
+def test_reordonnancement_sans_fausse_modification():
+    df = voyage()
+    apres = editable(df).iloc[[3, 0, 2, 1]]
+    changements = calculer_changements(editable(df), apres)
+    assert changements.vide
+
+    apres = apres.assign(Adresse=apres["Adresse"].where(apres["Id"] != "c", "C bis"))
+    changements = calculer_changements(editable(df), apres)
+    assert changements.modifies == {"Adresse": ["c"]}
+    assert changements.a_geocoder() == {"c"}
+
+    resultat = appliquer_changements(df, apres, changements)
+    assert resultat["Id"].tolist() == ["a", "b", "c", "d"]
+    assert resultat["Adresse"].tolist() == ["A", "B", "C bis", "D"]
+    assert np.isnan(resultat["Latitude"].iloc[2]) and resultat["Latitude"].iloc[1] == 2.0
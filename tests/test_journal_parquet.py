@@ -0,0 +1,89 @@
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.depots_locaux import DepotLocal
+from utils.geometrie import migrer_chemins
+from utils.journal_parquet import appliquer_patch, calculer_patch, en_parquet, lire_avec_journal, preparer_ecriture
+
+
+def voyage(nb_lignes):
+    return migrer_chemins(pd.DataFrame({
+        "Id": [f"id{i}" for i in range(nb_lignes)],
+        "Nuit": pd.date_range("2025-06-01", periods=nb_lignes, freq="D"),
+        "Adresse": [f"Adresse {i}" for i in range(nb_lignes)],
+        "Duree": np.arange(nb_lignes),
+        "Distance (km)": np.linspace(0, 100, nb_lignes),
+        "Chemin": [np.arange(4, dtype=np.float32) + i if i % 3 else None for i in range(nb_lignes)],
+    }))
+
+
+def inserer(df, position, id_ligne):
+    ligne = df.iloc[[0]].assign(Id=id_ligne, Adresse="Nouvelle adresse", Duree=99)
+    return pd.concat([df.iloc[:position], ligne, df.iloc[position:]], ignore_index=True)
+
+
+def relire(patch):
+    """Patch tel que relu depuis le dépôt"""
+    return migrer_chemins(pd.read_parquet(BytesIO(en_parquet(patch))))
+
+
+def assert_voyages_egaux(resultat, attendu):
+    attendu = attendu.reset_index(drop=True)
+    scalaires = [col for col in attendu.columns if col not in ("Chemin", "Chemin_Niveaux")]
+    pd.testing.assert_frame_equal(resultat[scalaires], attendu[scalaires])
+    for a, b in zip(resultat["Chemin"], attendu["Chemin"]):
+        assert (a is None and b is None) or np.array_equal(a, b)
+
+
+@pytest.mark.parametrize("modification, lignes_patch", [
+    (lambda df: inserer(df, 2, "nouveau"), 1),
+    (lambda df: df.drop(index=5), 1),
+    (lambda df: pd.concat([df.iloc[[15]], df.drop(index=15)]), 1),
+    (lambda df: df.assign(Duree=df["Duree"].where(df.index != 7, -1)), 1),
+    (lambda df: df, 0),
+])
+def test_patch_aller_retour(modification, lignes_patch):
+    df = voyage(20)
+    modifie = modification(df)
+    patch = calculer_patch(df, modifie)
+    assert len(patch) == lignes_patch
+    assert_voyages_egaux(appliquer_patch(df, relire(patch), len(modifie)), modifie)
+
+
+def test_patch_melange():
+    df = voyage(30)
+    modifie = df.sample(frac=1, random_state=0).drop(index=[3, 4])
+    modifie = inserer(modifie, 10, "nouveau")
+    assert_voyages_egaux(appliquer_patch(df, relire(calculer_patch(df, modifie)), len(modifie)), modifie)
+
+
+def test_patch_sans_identifiants_uniques():
+    df = voyage(5)
+    assert calculer_patch(df, df.assign(Id="meme")) is None
+    assert calculer_patch(df, df.drop(columns="Id")) is None
+
+
+def test_lire_avec_journal(tmp_path):
+    depot = DepotLocal(tmp_path)
+    df = voyage(40)
+    depot.commiter(preparer_ecriture(depot, "voyage.parquet", df), "Base")
+
+    rng = np.random.default_rng(0)
+    for k in range(6):
+        if k % 3 == 0:
+            df = inserer(df, int(rng.integers(len(df))), f"nouveau{k}")
+        elif k % 3 == 1:
+            df = df.drop(index=df.index[int(rng.integers(len(df)))]).reset_index(drop=True)
+        else:
+            df = pd.concat([df.iloc[[-1]], df.iloc[:-1]], ignore_index=True)
+        fichiers = preparer_ecriture(depot, "voyage.parquet", df)
+        # Une ligne ajoutée, supprimée ou déplacée : un patch d'une ligne
+        assert [len(pd.read_parquet(BytesIO(octets))) for octets in fichiers.values()] == [1]
+        depot.commiter(fichiers, f"Modification {k}")
+
+    resultat, patchs = lire_avec_journal(depot, "voyage.parquet")
+    assert len(patchs) == 6
+    assert_voyages_egaux(resultat, df)
@@ -0,0 +1,78 @@
+import heapq
+
+import numpy as np
+import pytest
+
+from utils.geodesie import haversine
+from utils.routage_local import construire_graphe
+
+
+def dijkstra(reseau, source, cible):
+    distances = {source: 0.0}
+    tas = [(0.0, source)]
+    while tas:
+        d, u = heapq.heappop(tas)
+        if u == cible:
+            return d
+        if d > distances[u]:
+            continue
+        for k in range(reseau.indptr[u], reseau.indptr[u + 1]):
+            v = reseau.indices[k]
+            if d + reseau.poids[k] < distances.get(v, np.inf):
+                distances[v] = d + reseau.poids[k]
+                heapq.heappush(tas, (distances[v], v))
+    return None
+
+
+def graphe_aleatoire(graine, nb_noeuds=300):
+    rng = np.random.default_rng(graine)
+    latitudes = 45 + rng.random(nb_noeuds) * 0.2
+    longitudes = -73.7 + rng.random(nb_noeuds) * 0.3
+    # Chaque noeud est relié à ses plus proches voisins, certaines voies à sens unique
+    distances = np.hypot(latitudes[:, None] - latitudes, longitudes[:, None] - longitudes)
+    voisins = np.argsort(distances, axis=1)[:, 1:4]
+    origines = np.repeat(np.arange(nb_noeuds), 3)
+    destinations = voisins.ravel()
+    vitesses = {
+        "driving-car": rng.choice([0, 30, 50, 90], len(origines)).astype(float),
+        "foot-hiking": np.full(len(origines), 4.0),
+    }
+    return construire_graphe(latitudes, longitudes, origines, destinations, vitesses), rng
+
+
+@pytest.mark.parametrize("graine", range(5))
+@pytest.mark.parametrize("profil", ["driving-car", "foot-hiking"])
+def test_astar_identique_a_dijkstra(graine, profil):
+    graphe, rng = graphe_aleatoire(graine)
+    reseau = graphe._reseau(profil)
+    for source, cible in rng.integers(graphe.nb_noeuds, size=(20, 2)).tolist():
+        aretes = graphe._chercher(reseau, source, cible)
+        attendu = dijkstra(reseau, source, cible)
+        if attendu is None:
+            assert aretes is None
+            continue
+        assert sum(reseau.poids[a] for a in aretes) == pytest.approx(attendu)
+        # Trajet continu de la source à la cible
+        noeuds = [source] + [reseau.indices[a] for a in aretes]
+        assert all(reseau.origines[a] == u for a, u in zip(aretes, noeuds))
+        assert noeuds[-1] == cible
+
+
+def test_noeud_proche_identique_au_parcours_complet():
+    graphe, rng = graphe_aleatoire(0)
+    candidats = graphe._reseau("driving-car").departs_possibles
+    for latitude, longitude in zip(45 + rng.random(50) * 0.2, -73.7 + rng.random(50) * 0.3):
+        noeud, distance = graphe.noeud_proche((latitude, longitude), candidats)
+        attendues = np.where(candidats, haversine(latitude, longitude, graphe.latitudes, graphe.longitudes), np.inf)
+        assert noeud == int(np.argmin(attendues))
+        assert distance == pytest.approx(attendues.min())
+
+
+def test_points_accroches_au_meme_noeud():
+    graphe, _ = graphe_aleatoire(0)
+    noeud = int(np.flatnonzero(graphe._reseau("foot-hiking").departs_possibles)[0])
+    depart = (graphe.latitudes[noeud] + 1e-5, graphe.longitudes[noeud])
+    arrivee = (graphe.latitudes[noeud] - 1e-5, graphe.longitudes[noeud])
+    distance_km, duree_h, _ = graphe.itineraire(depart, arrivee, "foot-hiking")
+    assert 0 < distance_km < 0.01
+    assert duree_h == pytest.approx(distance_km / 4)
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from core import identifier_sejours_multiples
+from tests.sejours_reference import identifier_sejours_multiples_boucle, voyage_aleatoire
+
+
+@pytest.mark.parametrize("graine", range(50))
+def test_identique_a_la_boucle(graine):
+    rng = np.random.default_rng(graine)
+    df = voyage_aleatoire(rng, int(rng.integers(1, 60)))
+    pd.testing.assert_frame_equal(identifier_sejours_multiples(df), identifier_sejours_multiples_boucle(df))
+
+
+def test_meme_adresse_a_plusieurs_endroits():
+    df = pd.DataFrame({
+        "Adresse": ["A", "A", "B", "A", "A", "A"],
+        "Latitude": [1.0, 1.0, 2.0, 1.0, 1.0, 1.0],
+        "Longitude": [1.0, 1.0, 2.0, 1.0, 1.0, 1.0],
+        "Nuit": pd.date_range("2025-06-01", periods=6, freq="D"),
+    })
+    resultat = identifier_sejours_multiples(df)
+    assert resultat["Duree_Sejour"].tolist() == [2, -1, 1, 3, -1, -1]
+    assert resultat["Date_Fin"].tolist() == [df["Nuit"][1], None, None, df["Nuit"][5], None, None]
+    pd.testing.assert_frame_equal(resultat, identifier_sejours_multiples_boucle(df))
+
+
+def test_coordonnees_manquantes_ne_regroupent_pas():
+    # NaN != NaN : deux adresses différentes sans coordonnées sont deux séjours
+    df = pd.DataFrame({
+        "Adresse": ["A", "B"],
+        "Latitude": [np.nan, np.nan],
+        "Longitude": [np.nan, np.nan],
+        "Nuit": pd.date_range("2025-06-01", periods=2, freq="D"),
+    })
+    assert identifier_sejours_multiples(df)["Duree_Sejour"].tolist() == [1, 1]
+    pd.testing.assert_frame_equal(identifier_sejours_multiples(df), identifier_sejours_multiples_boucle(df))
@@ -0,0 +1,89 @@
+import hashlib
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.creer_carte import creer_carte
+from utils.geometrie import COLONNES_GEOMETRIE
+from utils.parametres import lire_parametre
+
+# Colonnes dont dépend le rendu de la carte (tracés mis à part)
+COLONNES_CARTE = [
+    "Nuit", "Adresse", "Ville", "Nom", "Prix", "Type", "Type_Hebergement",
+    "Type_Deplacement", "Latitude", "Longitude", "Distance (km)", "Durée (h)",
+    # Identifiant du tracé stocké à part, dérivé de son contenu
+    "Segment",
+]
+
+# Paramètres de la section carte qui modifient le rendu
+PARAMETRES_CARTE = ["mode_marqueurs", "seuil_geojson", "seuil_cluster", "zoom_sans_cluster", "marge_zoom"]
+
+
+def empreinte_carte(df):
+    """
+    Calcule l'empreinte du contenu affiché sur la carte.
+
+    Seules les colonnes utiles à la carte sont hachées : les colonnes scalaires en
+    un seul appel vectorisé, les tracés directement depuis leurs tableaux NumPy.
+
+    Args:
+        df: DataFrame avec les données du voyage
+
+    Returns:
+        Empreinte hexadécimale, identique tant que la carte n'a pas à changer
+    """
+    empreinte = hashlib.blake2b(digest_size=20)
+    empreinte.update(repr([(p, lire_parametre("carte", p)) for p in PARAMETRES_CARTE]).encode("utf-8"))
+
+    colonnes = [col for col in COLONNES_CARTE if col in df.columns]
+    empreinte.update(repr(colonnes).encode("utf-8"))
+    if colonnes:
+        hachages = pd.util.hash_pandas_object(df[colonnes].astype(object), index=False)
+        empreinte.update(hachages.to_numpy().tobytes())
+
+    for col in COLONNES_GEOMETRIE:
+        if col not in df.columns:
+            continue
+        empreinte.update(col.encode("utf-8"))
+        for valeur in df[col]:
+            # Le préfixe de longueur distingue les tracés absents des tracés vides
+            donnees = valeur.tobytes() if isinstance(valeur, np.ndarray) else repr(valeur).encode("utf-8")
+            empreinte.update(len(donnees).to_bytes(8, "little"))
+            empreinte.update(donnees)
+
+    return empreinte.hexdigest()
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _rendre_carte(empreinte, _df, _df_avec_duree, _distances, _durations, _routes):
+    """
+    Construit la carte et la sérialise en HTML.
+
+    Seule l'empreinte sert de clé de cache : les arguments préfixés par _ ne sont
+    pas hachés par Streamlit.
+    """
+    m = creer_carte(_df, _df_avec_duree, _distances, _durations, _routes)
+    return m.get_root().render()
+
+
+def html_carte(df, df_avec_duree, distances=None, durations=None, routes=None):
+    """
+    Retourne le HTML de la carte du voyage, construit une seule fois par contenu.
+
+    Les réexécutions du script qui ne modifient pas les données (changement
+    d'onglet, sélection d'un PDF, ...) réutilisent la carte déjà sérialisée.
+
+    Args:
+        df: DataFrame avec les données du voyage
+        df_avec_duree: DataFrame des étapes avec Duree_Sejour
+        distances, durations, routes: Voir creer_carte
+
+    Returns:
+        Document HTML de la carte
+    """
+    return _rendre_carte(empreinte_carte(df), df, df_avec_duree, distances, durations, routes)
+
+
+def vider_cache_carte():
+    """Oublie les cartes déjà construites (à appeler quand les données sont réécrites)"""
+    _rendre_carte.clear()
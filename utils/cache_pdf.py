@@ -0,0 +1,314 @@
+import re
+import threading
+import zlib
+import streamlit as st
+from collections import OrderedDict
+from io import BytesIO
+
+from utils.cache_persistant import CacheSQLite
+from utils.parametres import DOSSIER_CACHE, lire_parametre
+from utils.stockage import depot_donnees
+
+# Largeur des vignettes de première page, en pixels
+LARGEUR_VIGNETTE = 600
+
+# Nombre maximal de caractères de texte extraits par document
+TEXTE_MAX = 20000
+
+# Nombre d'extraits de pages (sous-documents) gardés en mémoire
+TAILLE_CACHE_PAGES = 16
+
+# Noeud de l'arbre des pages d'un PDF, nombre de pages sous un noeud, flux d'objets compressés
+MOTIF_NOEUD_PAGES = re.compile(rb"/Type\s*/Pages(?![A-Za-z0-9])")
+MOTIF_COUNT = re.compile(rb"/Count\s+(\d+)")
+MOTIF_FLUX_OBJETS = re.compile(rb"/Type\s*/ObjStm.*?stream\r?\n", re.DOTALL)
+
+
+def _dictionnaire_englobant(contenu, position):
+    """Retourne le dictionnaire PDF (<< ... >>) contenant une position, sans ses sous-dictionnaires"""
+    profondeur, debut = 0, position
+    while debut > 0:
+        debut -= 1
+        if contenu[debut:debut + 2] == b">>":
+            profondeur += 1
+        elif contenu[debut:debut + 2] == b"<<":
+            if profondeur == 0:
+                break
+            profondeur -= 1
+    fin = contenu.find(b">>", position)
+    return contenu[debut:fin if fin >= 0 else len(contenu)]
+
+
+def _compter_pages_texte(contenu):
+    """Plus grand /Count des noeuds /Pages d'un contenu PDF non compressé, ou None"""
+    comptes = []
+    for correspondance in MOTIF_NOEUD_PAGES.finditer(contenu):
+        compte = MOTIF_COUNT.search(_dictionnaire_englobant(contenu, correspondance.start()))
+        if compte is not None:
+            comptes.append(int(compte[1]))
+    return max(comptes, default=None)
+
+
+def compter_pages(contenu):
+    """
+    Compte les pages d'un PDF sans le décoder : /Count de la racine de l'arbre des
+    pages, cherché dans le texte du fichier puis dans ses flux d'objets compressés
+    (PDF 1.5+). Ne nécessite pas pypdfium2.
+
+    Args:
+        contenu: Octets du PDF (ou fichier projeté en mémoire)
+
+    Returns:
+        Nombre de pages, ou None s'il n'a pas pu être déterminé
+    """
+    pages = _compter_pages_texte(contenu)
+    if pages is not None:
+        return pages
+
+    comptes = []
+    for correspondance in MOTIF_FLUX_OBJETS.finditer(contenu):
+        fin = contenu.find(b"endstream", correspondance.end())
+        try:
+            flux = zlib.decompress(contenu[correspondance.end():fin if fin >= 0 else len(contenu)])
+        except zlib.error:
+            continue
+        pages = _compter_pages_texte(flux)
+        if pages is not None:
+            comptes.append(pages)
+    return max(comptes, default=None)
+
+
+class CachePDF:
+    """
+    Aperçus des documents PDF du dépôt : vignette de la première page, nombre de
+    pages et texte extrait.
+
+    Les PDF eux-mêmes sont déjà conservés sur disque par le dépôt, indexés par
+    SHA de blob ; les aperçus le sont aussi, dans le dossier de cache. Un
+    document modifié change de SHA et obtient donc un nouvel aperçu.
+
+    Le rendu utilise pypdfium2 (dépendance optionnelle, `pip install road-trip[pdf]`) ;
+    sans lui, aucun aperçu n'est produit, mais le nombre de pages reste connu
+    (voir compter_pages) pour afficher les longs documents page par page.
+    PDFium n'étant pas thread-safe, les rendus sont faits un par un.
+    """
+
+    def __init__(self, depot, dossier=DOSSIER_CACHE / "apercus_pdf", largeur=LARGEUR_VIGNETTE,
+                 taille_cache_pages=TAILLE_CACHE_PAGES):
+        """
+        Args:
+            depot: Dépôt des données (voir utils.stockage)
+            dossier: Dossier des vignettes
+            largeur: Largeur des vignettes en pixels
+            taille_cache_pages: Nombre d'extraits de pages gardés en mémoire (voir extraire_pages)
+        """
+        self.depot = depot
+        self.dossier = dossier
+        self.dossier.mkdir(parents=True, exist_ok=True)
+        self.largeur = largeur
+        self._apercus = CacheSQLite("apercus_pdf", dossier=dossier)
+        self._rendu = threading.Lock()
+        self._verrou = threading.Lock()
+        self._a_prechauffer = []  # (chemin, branche) en attente de calcul
+        self._traites = set()     # SHA déjà programmés ou calculés
+        self._en_cours = None     # (chemin, branche) de l'aperçu en cours de calcul en arrière-plan
+        self._thread = None
+        self.taille_cache_pages = taille_cache_pages
+        self._pages = OrderedDict()  # (SHA, première, dernière) -> octets du sous-document
+        self._nombres_pages = {}     # SHA -> nombre de pages lu sans pypdfium2
+
+    @staticmethod
+    def disponible():
+        """Indique si pypdfium2 est installé"""
+        try:
+            import pypdfium2
+            return True
+        except ImportError:
+            return False
+
+    def apercu(self, chemin, branche="main", attendre=True):
+        """
+        Retourne l'aperçu d'un PDF du dépôt, calculé lors du premier appel pour ce contenu.
+
+        Args:
+            chemin: Chemin du PDF dans le dépôt
+            branche: Nom de la branche
+            attendre: Si False, un aperçu absent est calculé en arrière-plan
+                (voir prechauffer) au lieu de bloquer l'appelant
+
+        Returns:
+            dict avec sha, pages, texte et vignette (chemin du PNG), ou None si
+            pypdfium2 n'est pas installé ou si l'aperçu est en cours de calcul
+
+        Raises:
+            FileNotFoundError si le fichier n'existe pas sur la branche
+        """
+        sha = self.depot.sha_fichier(chemin, branche)
+        apercu = self._apercus.lire(sha)
+        vignette = self.dossier / f"{sha}.png"
+        if apercu is None or not vignette.is_file():
+            if not self.disponible():
+                return None
+            if not attendre:
+                with self._verrou:
+                    # Ni en file ni en cours : aperçu évincé du cache ou calcul échoué, à reprogrammer
+                    if (chemin, branche) != self._en_cours and (chemin, branche) not in self._a_prechauffer:
+                        self._traites.discard(sha)
+                self.prechauffer([chemin], branche)
+                return None
+            apercu = self._calculer(sha, vignette)
+        return dict(apercu, vignette=vignette)
+
+    def nombre_pages(self, chemin, branche="main"):
+        """
+        Retourne le nombre de pages d'un PDF du dépôt : celui de son aperçu s'il
+        est calculé, sinon lu dans le fichier (voir compter_pages), sans pypdfium2.
+
+        Args:
+            chemin: Chemin du PDF dans le dépôt
+            branche: Nom de la branche
+
+        Returns:
+            Nombre de pages, ou None s'il n'a pas pu être déterminé
+        """
+        sha = self.depot.sha_fichier(chemin, branche)
+        apercu = self._apercus.lire(sha)
+        if apercu is not None:
+            return apercu["pages"]
+        with self._verrou:
+            if sha in self._nombres_pages:
+                return self._nombres_pages[sha]
+        with self.depot.ouvrir(chemin, branche) as contenu:
+            pages = compter_pages(contenu)
+        with self._verrou:
+            self._nombres_pages[sha] = pages
+        return pages
+
+    def _calculer(self, sha, vignette):
+        import pypdfium2 as pdfium
+
+        with self._rendu:
+            pdf = pdfium.PdfDocument(str(self.depot.chemin_blob(sha)))
+            try:
+                textes = []
+                longueur = 0
+                for page in pdf:
+                    if longueur >= TEXTE_MAX:
+                        break
+                    texte = page.get_textpage().get_text_bounded()
+                    textes.append(texte)
+                    longueur += len(texte)
+
+                premiere = pdf[0]
+                image = premiere.render(scale=self.largeur / premiere.get_width()).to_pil()
+                # Écriture puis renommage : une vignette n'est jamais lue à moitié écrite
+                temporaire = vignette.with_suffix(".tmp")
+                image.save(temporaire, format="PNG", optimize=True)
+                temporaire.replace(vignette)
+
+                apercu = {"sha": sha, "pages": len(pdf), "texte": "\n".join(textes)[:TEXTE_MAX]}
+            finally:
+                pdf.close()
+
+        self._apercus.ecrire(sha, apercu)
+        return apercu
+
+    def extraire_pages(self, chemin, premiere, derniere, branche="main"):
+        """
+        Retourne un PDF ne contenant que les pages demandées d'un document du dépôt.
+
+        Les pages sont copiées sans être rendues ; les extraits récents sont
+        gardés en mémoire (LRU), si bien que revenir sur une page déjà vue ne
+        relit pas le document.
+
+        Args:
+            chemin: Chemin du PDF dans le dépôt
+            premiere: Indice de la première page (à partir de 0)
+            derniere: Indice de la dernière page (incluse)
+            branche: Nom de la branche
+
+        Returns:
+            Octets du sous-document
+
+        Raises:
+            ImportError si pypdfium2 n'est pas installé
+        """
+        import pypdfium2 as pdfium
+
+        sha = self.depot.sha_fichier(chemin, branche)
+        cle = (sha, premiere, derniere)
+        with self._verrou:
+            extrait = self._pages.get(cle)
+            if extrait is not None:
+                self._pages.move_to_end(cle)
+                return extrait
+
+        with self._rendu:
+            source = pdfium.PdfDocument(str(self.depot.chemin_blob(sha)))
+            extrait_pdf = pdfium.PdfDocument.new()
+            try:
+                derniere = min(derniere, len(source) - 1)
+                extrait_pdf.import_pages(source, list(range(premiere, derniere + 1)))
+                buffer = BytesIO()
+                extrait_pdf.save(buffer)
+            finally:
+                extrait_pdf.close()
+                source.close()
+        extrait = buffer.getvalue()
+
+        with self._verrou:
+            self._pages[cle] = extrait
+            while len(self._pages) > self.taille_cache_pages:
+                self._pages.popitem(last=False)
+        return extrait
+
+    def prechauffer(self, chemins, branche="main"):
+        """
+        Calcule en arrière-plan les aperçus manquants ; retourne immédiatement.
+
+        Args:
+            chemins: Chemins des PDF dans le dépôt (les chemins absents du dépôt sont ignorés)
+            branche: Nom de la branche
+        """
+        if not self.disponible():
+            return
+        arbre = self.depot.arbre(branche)
+        with self._verrou:
+            for chemin in dict.fromkeys(chemins):
+                sha = arbre.get(chemin)
+                if sha is not None and sha not in self._traites:
+                    # Marqué dès la mise en file : les réexécutions suivantes ne le reprogramment pas
+                    self._traites.add(sha)
+                    self._a_prechauffer.append((chemin, branche))
+            if self._a_prechauffer and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._boucle, name="apercus_pdf", daemon=True)
+                self._thread.start()
+
+    def _boucle(self):
+        while True:
+            with self._verrou:
+                if not self._a_prechauffer:
+                    self._thread = None
+                    return
+                chemin, branche = self._a_prechauffer.pop(0)
+                self._en_cours = (chemin, branche)
+            try:
+                self.apercu(chemin, branche)
+            except Exception as e:
+                print(f"Aperçu de {chemin} impossible : {e}")
+            finally:
+                with self._verrou:
+                    self._en_cours = None
+
+
+@st.cache_resource
+def cache_pdf():
+    """
+    Retourne le cache des aperçus PDF, partagé entre les sessions.
+
+    Paramètres (section pdf) :
+        largeur_vignette: Largeur des vignettes en pixels (défaut 600)
+        pages_en_cache: Nombre d'extraits de pages gardés en mémoire (défaut 16)
+    """
+    return CachePDF(depot_donnees(), largeur=lire_parametre("pdf", "largeur_vignette", LARGEUR_VIGNETTE),
+                    taille_cache_pages=lire_parametre("pdf", "pages_en_cache", TAILLE_CACHE_PAGES))
@@ -0,0 +1,184 @@
+import json
+import sqlite3
+import threading
+import time
+
+from utils.parametres import DOSSIER_CACHE
+
+# SQLite limite le nombre de paramètres par requête
+TAILLE_LOT_SQL = 500
+
+
+class CacheSQLite:
+    """
+    Cache clé/valeur persistant sur disque, partagé entre sessions et processus.
+
+    Les valeurs sont sérialisées en JSON. Une entrée expire après `ttl` secondes
+    et, au-delà de `taille_max` entrées ou de `octets_max` octets de valeurs,
+    les moins récemment utilisées sont évincées.
+    """
+
+    def __init__(self, nom, ttl=None, taille_max=10000, octets_max=None, dossier=DOSSIER_CACHE):
+        """
+        Args:
+            nom: Nom du fichier SQLite (sans extension) dans le dossier de cache
+            ttl: Durée de vie d'une entrée en secondes (None = pas d'expiration)
+            taille_max: Nombre maximal d'entrées conservées
+            octets_max: Taille maximale cumulée des valeurs en octets (None = pas de limite)
+            dossier: Dossier contenant le fichier SQLite
+        """
+        dossier.mkdir(parents=True, exist_ok=True)
+        self.chemin = dossier / f"{nom}.sqlite"
+        self.ttl = ttl
+        self.taille_max = taille_max
+        self.octets_max = octets_max
+        self.hits = 0
+        self.misses = 0
+        self._verrou = threading.Lock()
+        # Une connexion par thread : sqlite3 interdit le partage entre threads
+        self._local = threading.local()
+
+        with self._connexion() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entrees ("
+                "cle TEXT PRIMARY KEY, valeur TEXT NOT NULL, "
+                "cree REAL NOT NULL, utilise REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_utilise ON entrees(utilise)")
+
+    def _connexion(self):
+        """Retourne la connexion SQLite du thread courant"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.chemin, timeout=30)
+            # WAL permet des lectures concurrentes pendant une écriture (plusieurs processus)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def lire_plusieurs(self, cles):
+        """
+        Récupère plusieurs entrées en une seule passe.
+
+        Args:
+            cles: Itérable de clés (les doublons sont ignorés)
+
+        Returns:
+            dict {clé: valeur} contenant uniquement les entrées trouvées et non expirées
+        """
+        cles = list(dict.fromkeys(cles))
+        if not cles:
+            return {}
+
+        maintenant = time.time()
+        limite = maintenant - self.ttl if self.ttl is not None else float("-inf")
+        trouves = {}
+        expirees = []
+
+        conn = self._connexion()
+        for debut in range(0, len(cles), TAILLE_LOT_SQL):
+            lot = cles[debut:debut + TAILLE_LOT_SQL]
+            marqueurs = ",".join("?" * len(lot))
+            lignes = conn.execute(
+                f"SELECT cle, valeur, cree FROM entrees WHERE cle IN ({marqueurs})", lot
+            ).fetchall()
+            for cle, valeur, cree in lignes:
+                if cree < limite:
+                    expirees.append(cle)
+                else:
+                    trouves[cle] = json.loads(valeur)
+
+        with conn:
+            if trouves:
+                conn.executemany(
+                    "UPDATE entrees SET utilise = ? WHERE cle = ?",
+                    [(maintenant, cle) for cle in trouves]
+                )
+            if expirees:
+                conn.executemany("DELETE FROM entrees WHERE cle = ?", [(cle,) for cle in expirees])
+
+        with self._verrou:
+            self.hits += len(trouves)
+            self.misses += len(cles) - len(trouves)
+
+        return trouves
+
+    def lire(self, cle, defaut=None):
+        """Récupère une entrée, ou `defaut` si elle est absente ou expirée"""
+        return self.lire_plusieurs([cle]).get(cle, defaut)
+
+    def ecrire_plusieurs(self, entrees):
+        """
+        Enregistre plusieurs entrées dans une seule transaction puis applique l'éviction.
+
+        Args:
+            entrees: dict {clé: valeur sérialisable en JSON}
+        """
+        if not entrees:
+            return
+
+        maintenant = time.time()
+        conn = self._connexion()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO entrees (cle, valeur, cree, utilise) VALUES (?, ?, ?, ?)",
+                [(cle, json.dumps(valeur), maintenant, maintenant) for cle, valeur in entrees.items()]
+            )
+            self._evincer(conn)
+
+    def ecrire(self, cle, valeur):
+        """Enregistre une entrée"""
+        self.ecrire_plusieurs({cle: valeur})
+
+    def _evincer(self, conn):
+        """Supprime les entrées expirées puis les moins récemment utilisées au-delà des limites"""
+        if self.ttl is not None:
+            conn.execute("DELETE FROM entrees WHERE cree < ?", (time.time() - self.ttl,))
+
+        nombre = conn.execute("SELECT COUNT(*) FROM entrees").fetchone()[0]
+        excedent = nombre - self.taille_max
+        if excedent > 0:
+            conn.execute(
+                "DELETE FROM entrees WHERE cle IN "
+                "(SELECT cle FROM entrees ORDER BY utilise ASC LIMIT ?)",
+                (excedent,)
+            )
+
+        if self.octets_max is not None:
+            total = conn.execute("SELECT COALESCE(SUM(LENGTH(valeur)), 0) FROM entrees").fetchone()[0]
+            excedent = total - self.octets_max
+            if excedent > 0:
+                # Parcourir les entrées de la moins récemment utilisée à la plus récente
+                a_supprimer = []
+                for cle, taille in conn.execute("SELECT cle, LENGTH(valeur) FROM entrees ORDER BY utilise ASC"):
+                    if excedent <= 0:
+                        break
+                    a_supprimer.append((cle,))
+                    excedent -= taille
+                conn.executemany("DELETE FROM entrees WHERE cle = ?", a_supprimer)
+
+    def statistiques(self):
+        """
+        Retourne les compteurs du cache depuis le démarrage du processus.
+
+        Returns:
+            dict avec les clés hits, misses, taux_hit (entre 0 et 1) et entrees
+        """
+        nombre = self._connexion().execute("SELECT COUNT(*) FROM entrees").fetchone()[0]
+        with self._verrou:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "taux_hit": self.hits / total if total else 0.0,
+                "entrees": nombre,
+            }
+
+    def vider(self):
+        """Supprime toutes les entrées et remet les compteurs à zéro"""
+        conn = self._connexion()
+        with conn:
+            conn.execute("DELETE FROM entrees")
+        with self._verrou:
+            self.hits = 0
+            self.misses = 0
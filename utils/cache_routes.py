@@ -0,0 +1,41 @@
+import hashlib
+import streamlit as st
+
+from utils.cache_persistant import CacheSQLite
+from utils.parametres import lire_parametre
+
+
+@st.cache_resource
+def cache_routes():
+    """Retourne le cache persistant des itinéraires, partagé entre les sessions et les processus"""
+    return CacheSQLite(
+        "routes",
+        ttl=lire_parametre("cache", "routes_ttl_jours", 365) * 86400,
+        taille_max=lire_parametre("cache", "routes_taille_max", 20000),
+        octets_max=lire_parametre("cache", "routes_octets_max", 500 * 1024 * 1024),
+    )
+
+
+def cle_segment(start_coords, end_coords, profile, precision=None):
+    """
+    Calcule la clé de contenu d'un segment : coordonnées arrondies + profil ORS.
+
+    Deux segments dont les extrémités coïncident à la précision près partagent la
+    même clé, quel que soit le voyage ou la position dans le voyage.
+
+    Args:
+        start_coords: Tuple (latitude, longitude) du point de départ
+        end_coords: Tuple (latitude, longitude) du point d'arrivée
+        profile: Profil ORS ('driving-car', 'foot-hiking', ...)
+        precision: Nombre de décimales conservées (par défaut cache.routes_precision, 5 ≈ 1 m)
+
+    Returns:
+        Empreinte SHA-1 hexadécimale du segment
+    """
+    if precision is None:
+        precision = lire_parametre("cache", "routes_precision", 5)
+
+    # Arrondir avant de formater pour que -0.0 et 0.0 donnent la même clé
+    valeurs = [round(float(v), precision) + 0.0 for v in (*start_coords, *end_coords)]
+    texte = f"{profile}|" + ",".join(f"{v:.{precision}f}" for v in valeurs)
+    return hashlib.sha1(texte.encode("utf-8")).hexdigest()
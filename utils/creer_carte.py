@@ -1,7 +1,22 @@
 import folium
-import json
 import pandas as pd
 import streamlit as st
+from folium.elements import JSCSSMixin
+from folium.map import Layer
+from folium.plugins import MarkerCluster
+from folium.template import Template
+from folium.utilities import camelize
+from utils.geometrie import DECIMALES_AFFICHAGE, CheminsParesseux
+from utils.parametres import lire_parametre
+from utils.simplification import choisir_niveau
+
+# Zoom initial de la carte
+ZOOM_INITIAL = 6
+
+# Nombre d'étapes au-delà duquel les marqueurs sont émis en une seule couche GeoJSON
+# (mode "auto" de carte.mode_marqueurs), puis regroupés côté navigateur
+SEUIL_GEOJSON = 200
+SEUIL_CLUSTER = 500
 
 
 def formater_date_sejour(row):
@@ -84,7 +99,7 @@ def initialiser_carte(start_lat, start_lon):
     # Créer une carte sans tuile de base pour pouvoir alterner entre les vues
     m = folium.Map(
         location=[start_lat, start_lon],
-        zoom_start=6,
+        zoom_start=ZOOM_INITIAL,
         tiles=None,
         width="100%",
         height="100%"
@@ -109,67 +124,92 @@ def initialiser_carte(start_lat, start_lon):
     return m
 
 
-def ajouter_routes(m, df, distances=None, durations=None):
-    """Ajoute les routes entre les points sur la carte"""
+def formater_duree(duree_heures):
+    """Convertit une durée en heures décimales au format 1h05"""
+    heures = int(duree_heures)
+    minutes = int((duree_heures - heures) * 60)
+    return f"{heures}h{minutes:02d}"
+
+
+def ajouter_routes(m, df, distances=None, durations=None, zoom=None, routes=None):
+    """
+    Ajoute les routes entre les points sur la carte.
+
+    Les tracés sont simplifiés au niveau de détail adapté à l'étendue du voyage
+    et au zoom initial, grâce aux niveaux précalculés dans Chemin_Niveaux.
+    Seuls les segments dessinés sont décodés.
+
+    Args:
+        m: Carte Folium
+        df: DataFrame avec les données du voyage
+        distances: Distances par segment, utilisées si la colonne Distance (km) est absente
+        durations: Durées par segment, utilisées si la colonne Durée (h) est absente
+        zoom: Zoom initial de la carte
+        routes: Accesseur CheminsParesseux (par défaut, construit à partir de df)
+    """
+    if routes is None:
+        routes = CheminsParesseux.depuis_df(df)
+    niveau = choisir_niveau(df["Latitude"], df["Longitude"], zoom)
+
+    # Colonnes lues une seule fois plutôt que ligne par ligne
+    types = df["Type_Deplacement"].to_numpy() if "Type_Deplacement" in df.columns else None
+    distances_df = df["Distance (km)"].to_numpy() if "Distance (km)" in df.columns else None
+    durees_df = df["Durée (h)"].to_numpy() if "Durée (h)" in df.columns else None
+
     for i in range(len(df) - 1):
-        if pd.notna(df.iloc[i]["Chemin"]):
-            route_coords = json.loads(df.iloc[i]["Chemin"])
-            if route_coords:
-                # Déterminer si c'est un déplacement à pied
-                is_marche = False
-                if "Type_Deplacement" in df.columns and pd.notna(df.iloc[i]["Type_Deplacement"]):
-                    is_marche = df.iloc[i]["Type_Deplacement"].lower() == "marche"
-
-                # Calculer la distance et la durée
-                distance_text = ""
-                duration_text = ""
-                if "Distance (km)" in df.columns and pd.notna(df.iloc[i]["Distance (km)"]):
-                    distance_text = f"{df.iloc[i]['Distance (km)']:.2f} km"
-                elif distances is not None and i < len(distances) and pd.notna(distances[i]):
-                    distance_text = f"{(distances[i] / 1000):.2f} km"
-
-                if "Durée (h)" in df.columns and pd.notna(df.iloc[i]["Durée (h)"]):
-                    # Convertir la durée en heures:minutes
-                    duree_heures = df.iloc[i]["Durée (h)"]
-                    heures = int(duree_heures)
-                    minutes = int((duree_heures - heures) * 60)
-                    duration_text = f"{heures}h{minutes:02d}"
-                elif durations is not None and i < len(durations) and pd.notna(durations[i]):
-                    duree_heures = durations[i]
-                    heures = int(duree_heures)
-                    minutes = int((duree_heures - heures) * 60)
-                    duration_text = f"{heures}h{minutes:02d}"
-
-                # Tracer la route avec distance et durée
-                tooltip = f"Distance: {distance_text}"
-                if duration_text:
-                    tooltip += f" - Durée: {duration_text}"
-
-                # Définir le style de ligne selon le type de déplacement
-                dash_array = "10, 10" if is_marche else None
-
-                # Tracer la route
-                route = folium.PolyLine(
-                    locations=route_coords,
-                    color="#4169E1",  # Bleu royal
-                    weight=4,
-                    opacity=0.8,
-                    tooltip=tooltip,
-                    dash_array=dash_array  # Ligne pointillée pour la marche
-                )
-                route.add_to(m)
+        if not routes.present(i):
+            continue
+        route_coords = routes.pour_affichage(i, niveau)
+        if not route_coords:
+            continue
+
+        # Déterminer si c'est un déplacement à pied
+        is_marche = types is not None and pd.notna(types[i]) and types[i].lower() == "marche"
+
+        # Calculer la distance et la durée
+        distance_text = ""
+        duration_text = ""
+        if distances_df is not None and pd.notna(distances_df[i]):
+            distance_text = f"{distances_df[i]:.2f} km"
+        elif distances is not None and i < len(distances) and pd.notna(distances[i]):
+            distance_text = f"{(distances[i] / 1000):.2f} km"
+
+        if durees_df is not None and pd.notna(durees_df[i]):
+            # Convertir la durée en heures:minutes
+            duration_text = formater_duree(durees_df[i])
+        elif durations is not None and i < len(durations) and pd.notna(durations[i]):
+            duration_text = formater_duree(durations[i])
+
+        # Tracer la route avec distance et durée
+        tooltip = f"Distance: {distance_text}"
+        if duration_text:
+            tooltip += f" - Durée: {duration_text}"
+
+        # Définir le style de ligne selon le type de déplacement
+        dash_array = "10, 10" if is_marche else None
+
+        # Tracer la route
+        route = folium.PolyLine(
+            locations=route_coords,
+            color="#4169E1",  # Bleu royal
+            weight=4,
+            opacity=0.8,
+            tooltip=tooltip,
+            dash_array=dash_array  # Ligne pointillée pour la marche
+        )
+        route.add_to(m)
 
     return m
 
 
-def determiner_type_point(i, row, df, icons, colors, duree_sejour, type_hebergement):
+def determiner_type_point(i, row, nb_lignes, adresse_arrivee, icons, colors, duree_sejour, type_hebergement):
     """Détermine le type de point et ses caractéristiques pour le marqueur"""
     if i == 0:
         point_type = "départ"
         icon = icons["depart"]
         title = "Point de départ"
         color = colors["départ"]
-    elif i == len(df) - 1 or (row["Adresse"] == df.iloc[-1]["Adresse"] if "Adresse" in row else False):
+    elif i == nb_lignes - 1 or (row["Adresse"] == adresse_arrivee if "Adresse" in row else False):
         point_type = "arrivée"
         icon = icons["arrivee"]
         title = "Point d'arrivée"
@@ -256,12 +296,26 @@ def creer_tooltip(point_type, ville, date_info, type_hebergement, duree_sejour):
         return f"{ville} - Séjour de {duree_sejour} nuits ({date_info})"
 
 
-def ajouter_marqueurs(m, df_avec_duree, df, icons, colors):
-    """Ajoute les marqueurs sur la carte"""
-    for i, row in df_avec_duree.iterrows():
+def decrire_etapes(df_avec_duree, df, icons, colors):
+    """
+    Prépare la description des étapes à afficher sur la carte.
+
+    Les lignes fusionnées avec une étape précédente, les points de passage et les
+    étapes sans coordonnées sont ignorés.
+
+    Yields:
+        dict avec la ligne, les caractéristiques du point (determiner_type_point),
+        les champs de la popup et le texte du tooltip
+    """
+    adresse_arrivee = df["Adresse"].iloc[-1] if "Adresse" in df.columns and len(df) else None
+
+    # Lignes converties en dictionnaires d'un coup, plutôt que par iterrows
+    for i, row in zip(df_avec_duree.index, df_avec_duree.to_dict("records")):
         # Ignorer les lignes qui ont été fusionnées avec une étape précédente
         if row["Duree_Sejour"] == -1:
             continue
+        if pd.isna(row["Latitude"]) or pd.isna(row["Longitude"]):
+            continue
 
         # Déterminer le type d'hébergement et le nombre de nuits
         duree_sejour = row["Duree_Sejour"] if "Duree_Sejour" in row and pd.notna(row["Duree_Sejour"]) else 0
@@ -269,7 +323,8 @@ def ajouter_marqueurs(m, df_avec_duree, df, icons, colors):
             row["Type_Hebergement"]) else ""
 
         # Déterminer le type de point et ses caractéristiques
-        point_info = determiner_type_point(i, row, df, icons, colors, duree_sejour, type_hebergement)
+        point_info = determiner_type_point(i, row, len(df), adresse_arrivee, icons, colors,
+                                           duree_sejour, type_hebergement)
 
         # Si point_info est None, c'est un point de passage à ignorer
         if point_info is None:
@@ -278,34 +333,175 @@ def ajouter_marqueurs(m, df_avec_duree, df, icons, colors):
         # Récupérer les informations
         date_info = formater_date_sejour(row)
         ville = row["Ville"] if "Ville" in row and pd.notna(row["Ville"]) else ""
-        nom = row["Nom"] if "Nom" in row and pd.notna(row["Nom"]) else ""
-        prix = row["Prix"] if "Prix" in row and pd.notna(row["Prix"]) else ""
-        type_heb = row["Type"] if "Type" in row and pd.notna(row["Type"]) else ""
+
+        yield {
+            "row": row,
+            "point_info": point_info,
+            "ville": ville,
+            "date_info": date_info,
+            "nom": row["Nom"] if "Nom" in row and pd.notna(row["Nom"]) else "",
+            "prix": row["Prix"] if "Prix" in row and pd.notna(row["Prix"]) else "",
+            "type_heb": row["Type"] if "Type" in row and pd.notna(row["Type"]) else "",
+            "tooltip": creer_tooltip(point_info["point_type"], ville, date_info, type_hebergement, duree_sejour),
+        }
+
+
+def ajouter_marqueurs(m, df_avec_duree, df, icons, colors):
+    """Ajoute les marqueurs sur la carte, un objet Folium par étape"""
+    for etape in decrire_etapes(df_avec_duree, df, icons, colors):
+        row = etape["row"]
+        point_info = etape["point_info"]
 
         # Créer le contenu de la popup
         html_content = creer_html_popup(
-            ville, date_info, nom, type_heb, prix,
+            etape["ville"], etape["date_info"], etape["nom"], etape["type_heb"], etape["prix"],
             point_info["title"], point_info["color"]
         )
 
-        # Créer le texte du tooltip
-        tooltip_text = creer_tooltip(
-            point_info["point_type"], ville, date_info,
-            type_hebergement, duree_sejour
-        )
-
         # Ajouter le marqueur
         folium.Marker(
             location=[row["Latitude"], row["Longitude"]],
             popup=folium.Popup(html_content, max_width=300),
-            tooltip=tooltip_text,
+            tooltip=etape["tooltip"],
             icon=point_info["icon"]
         ).add_to(m)
 
     return m
 
 
-def creer_carte(df, df_avec_duree, distances=None, durations=None):
+class CoucheEtapes(JSCSSMixin, Layer):
+    """
+    Couche Leaflet affichant toutes les étapes à partir d'une seule FeatureCollection GeoJSON.
+
+    L'icône de chaque étape est choisie dans une table de styles d'après la
+    propriété `style`, et le contenu de sa popup n'est construit qu'à l'ouverture.
+    Les étapes peuvent être regroupées côté navigateur (Leaflet.markercluster).
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function () {
+                var styles = {{ this.styles|tojson }};
+                var couleurs = {{ this.couleurs|tojson }};
+
+                function echapper(texte) {
+                    return String(texte === null || texte === undefined ? "" : texte)
+                        .replace(/&/g, "&amp;").replace(/</g, "&lt;").replace(/>/g, "&gt;");
+                }
+
+                function contenuPopup(p) {
+                    return '<div style="min-width: 180px;">'
+                        + '<h4 style="color: ' + couleurs[p.type_point] + '; margin-bottom: 5px;">'
+                        + echapper(p.titre) + '</h4>'
+                        + '<strong>' + echapper(p.ville) + '</strong><br>'
+                        + '<em>' + echapper(p.dates) + '</em><br>'
+                        + '<strong>Hébergement:</strong> ' + echapper(p.nom) + '<br>'
+                        + '<strong>Type:</strong> ' + echapper(p.type) + '<br>'
+                        + '<strong>Prix:</strong> ' + echapper(p.prix)
+                        + '</div>';
+                }
+
+                var couche = L.geoJson({{ this.donnees|tojson }}, {
+                    pointToLayer: function (feature, latlng) {
+                        return L.marker(latlng, {icon: L.AwesomeMarkers.icon(styles[feature.properties.style])});
+                    },
+                    onEachFeature: function (feature, layer) {
+                        layer.bindTooltip(echapper(feature.properties.tooltip));
+                        layer.bindPopup(function () { return contenuPopup(feature.properties); }, {maxWidth: 300});
+                    }
+                });
+                {%- if this.cluster %}
+                var groupe = L.markerClusterGroup({{ this.options_cluster|tojson }});
+                groupe.addLayer(couche);
+                couche = groupe;
+                {%- endif %}
+
+                couche.addTo({{ this._parent.get_name() }});
+                return couche;
+            })();
+        {% endmacro %}
+        """
+    )
+
+    default_js = MarkerCluster.default_js
+    default_css = MarkerCluster.default_css
+
+    def __init__(self, donnees, styles, couleurs, cluster=True, name="Étapes", **options_cluster):
+        """
+        Args:
+            donnees: FeatureCollection GeoJSON des étapes
+            styles: dict {style: options L.AwesomeMarkers.icon}
+            couleurs: dict {type de point: couleur du titre de la popup}
+            cluster: Regrouper les étapes proches selon le zoom
+            name: Nom de la couche dans le contrôle des couches
+            **options_cluster: Options de Leaflet.markercluster (ex: disableClusteringAtZoom=12)
+        """
+        super().__init__(name=name, overlay=True, control=True, show=True)
+        self._name = "CoucheEtapes"
+        self.donnees = donnees
+        self.styles = styles
+        self.couleurs = couleurs
+        self.cluster = cluster
+        self.options_cluster = {camelize(cle): valeur for cle, valeur in options_cluster.items()}
+        if not cluster:
+            # Inutile de charger Leaflet.markercluster
+            self.default_js = []
+            self.default_css = []
+
+
+def ajouter_marqueurs_geojson(m, df_avec_duree, df, icons, colors, cluster=True):
+    """
+    Ajoute toutes les étapes sur la carte en une seule couche GeoJSON.
+
+    La page ne contient qu'un objet JavaScript et une table de styles, au lieu d'un
+    marqueur, d'une icône et d'une popup HTML par étape : le poids de la page et le
+    temps de construction de la carte restent faibles avec des milliers d'étapes.
+
+    Args:
+        m: Carte Folium
+        df_avec_duree: DataFrame des étapes avec Duree_Sejour
+        df: DataFrame avec les données du voyage
+        icons: Icônes Folium (voir creer_icones)
+        colors: Couleurs des popups par type de point
+        cluster: Regrouper les étapes proches côté navigateur
+    """
+    # Table des styles : les options de chaque icône, en noms JavaScript
+    styles = {cle: {camelize(k): v for k, v in icon.options.items()} for cle, icon in icons.items()}
+    style_par_icone = {id(icon): cle for cle, icon in icons.items()}
+
+    features = []
+    for etape in decrire_etapes(df_avec_duree, df, icons, colors):
+        row = etape["row"]
+        point_info = etape["point_info"]
+        features.append({
+            "type": "Feature",
+            "geometry": {
+                "type": "Point",
+                "coordinates": [round(float(row["Longitude"]), DECIMALES_AFFICHAGE),
+                                round(float(row["Latitude"]), DECIMALES_AFFICHAGE)],
+            },
+            "properties": {
+                "style": style_par_icone[id(point_info["icon"])],
+                "type_point": point_info["point_type"],
+                "titre": point_info["title"],
+                "ville": etape["ville"],
+                "dates": etape["date_info"],
+                "nom": str(etape["nom"]),
+                "type": str(etape["type_heb"]),
+                "prix": str(etape["prix"]),
+                "tooltip": etape["tooltip"],
+            },
+        })
+
+    CoucheEtapes(
+        {"type": "FeatureCollection", "features": features}, styles, colors, cluster=cluster,
+        disable_clustering_at_zoom=lire_parametre("carte", "zoom_sans_cluster", 12),
+    ).add_to(m)
+    return m
+
+
+def creer_carte(df, df_avec_duree, distances=None, durations=None, routes=None):
     """Crée et configure la carte Folium avec les routes et marqueurs"""
     # Initialiser la carte
     start_lat = df.iloc[0]["Latitude"]
@@ -313,13 +509,20 @@ def creer_carte(df, df_avec_duree, distances=None, durations=None):
     m = initialiser_carte(start_lat, start_lon)
 
     # Ajouter les tracés des routes
-    m = ajouter_routes(m, df, distances, durations)
+    m = ajouter_routes(m, df, distances, durations, zoom=ZOOM_INITIAL, routes=routes)
 
     # Obtenir les icônes
     icons, colors = creer_icones()
 
-    # Ajouter les marqueurs
-    m = ajouter_marqueurs(m, df_avec_duree, df, icons, colors)
+    # Ajouter les marqueurs : un objet par étape, ou une couche GeoJSON pour les grands voyages
+    # (carte.mode_marqueurs : "auto", "marqueurs" ou "geojson")
+    mode = lire_parametre("carte", "mode_marqueurs", "auto")
+    nb_etapes = int((df_avec_duree["Duree_Sejour"] != -1).sum())
+    if mode == "geojson" or (mode == "auto" and nb_etapes > lire_parametre("carte", "seuil_geojson", SEUIL_GEOJSON)):
+        cluster = nb_etapes > lire_parametre("carte", "seuil_cluster", SEUIL_CLUSTER)
+        m = ajouter_marqueurs_geojson(m, df_avec_duree, df, icons, colors, cluster=cluster)
+    else:
+        m = ajouter_marqueurs(m, df_avec_duree, df, icons, colors)
 
     # Ajouter le contrôle des couches pour basculer entre carte et satellite
     folium.LayerControl().add_to(m)
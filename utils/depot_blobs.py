@@ -0,0 +1,171 @@
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+import pyarrow.parquet as pq
+from collections import OrderedDict
+from io import BytesIO
+
+from utils.geometrie import migrer_chemins
+
+
+def sha_blob_git(contenu):
+    """Calcule le SHA d'un blob git (identique à `git hash-object`)"""
+    return hashlib.sha1(b"blob %d\0" % len(contenu) + contenu).hexdigest()
+
+
+class DepotBlobs(ABC):
+    """
+    Interface commune des dépôts de données du voyage (GitHub, dossier local, SQLite).
+
+    Comme un dépôt git, un dépôt associe à chaque branche une arborescence
+    (chemin -> SHA de blob git) ; le contenu d'un blob ne change jamais. Les
+    blobs lus sont disponibles sous forme de fichiers locaux, ce qui permet de
+    les projeter en mémoire. Une écriture (commiter) est atomique : tous les
+    fichiers sont enregistrés ensemble, ou aucun.
+    """
+
+    # Nom affiché dans les messages
+    nom = "abstrait"
+
+    def __init__(self, dossier, taille_memo=8):
+        """
+        Args:
+            dossier: Dossier local des blobs (fichiers nommés par SHA)
+            taille_memo: Nombre de DataFrames décodés gardés en mémoire
+        """
+        self.dossier = dossier
+        self.dossier.mkdir(parents=True, exist_ok=True)
+        self.taille_memo = taille_memo
+        self._memo = OrderedDict()
+        self._verrou = threading.Lock()
+
+    @abstractmethod
+    def arbre(self, branche="main"):
+        """
+        Returns:
+            dict {chemin du fichier: SHA du blob}
+        """
+
+    def invalider(self, branche="main"):
+        """Force la relecture de l'arborescence au prochain accès"""
+
+    @abstractmethod
+    def chemin_blob(self, sha):
+        """Retourne le fichier local du blob"""
+
+    @abstractmethod
+    def commiter(self, fichiers, message, branche="main"):
+        """
+        Enregistre plusieurs fichiers en une seule opération atomique.
+
+        Args:
+            fichiers: dict {chemin: contenu en octets, ou None pour supprimer le fichier}
+            message: Description de la modification
+            branche: Nom de la branche
+
+        Returns:
+            Identifiant de la modification, ou None si aucun fichier n'a changé
+        """
+
+    def sha_fichier(self, chemin, branche="main"):
+        """
+        Returns:
+            Le SHA du blob du fichier sur la branche
+
+        Raises:
+            FileNotFoundError si le fichier n'existe pas sur la branche
+        """
+        sha = self.arbre(branche).get(chemin)
+        if sha is None:
+            raise FileNotFoundError(f"{chemin} absent de {self.nom}@{branche}")
+        return sha
+
+    def enregistrer_blob(self, contenu, sha=None):
+        """
+        Ajoute un contenu au dossier des blobs.
+
+        Returns:
+            Le SHA du blob
+
+        Raises:
+            ValueError si le contenu ne correspond pas au SHA attendu
+        """
+        sha_calcule = sha_blob_git(contenu)
+        if sha is not None and sha != sha_calcule:
+            raise ValueError(f"Contenu du blob {sha} corrompu")
+
+        chemin = self.dossier / sha_calcule
+        if not chemin.is_file():
+            # Écriture atomique : un lecteur concurrent ne voit jamais de fichier partiel
+            descripteur, temporaire = tempfile.mkstemp(dir=self.dossier, prefix=".telechargement-")
+            with os.fdopen(descripteur, "wb") as f:
+                f.write(contenu)
+            os.replace(temporaire, chemin)
+        return sha_calcule
+
+    def lire_octets(self, chemin, branche="main"):
+        """Retourne le contenu d'un fichier du dépôt"""
+        return self.chemin_blob(self.sha_fichier(chemin, branche)).read_bytes()
+
+    def ouvrir(self, chemin, branche="main"):
+        """
+        Ouvre un fichier du dépôt en lecture seule, projeté en mémoire (mmap).
+
+        Le contenu n'est chargé par le système qu'à mesure qu'il est lu. La
+        projection garde le fichier ouvert jusqu'à sa fermeture : l'appelant doit
+        la fermer, de préférence avec `with depot.ouvrir(...) as f:`.
+
+        Returns:
+            Un objet fichier (read, seek, indexation par tranches, gestionnaire de contexte)
+        """
+        with open(self.chemin_blob(self.sha_fichier(chemin, branche)), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # mmap refuse les fichiers vides
+                return BytesIO()
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def memoriser(self, cle, calculer):
+        """
+        Retourne un DataFrame mémorisé sous une clé dérivée de SHA de blobs, en le
+        calculant au premier appel. Les blobs ne changeant jamais, l'entrée reste
+        valable tant que la clé est la même.
+
+        Args:
+            cle: Clé hachable (SHA, ou tuple de SHA)
+            calculer: Fonction sans argument retournant le DataFrame
+
+        Returns:
+            Une copie du DataFrame, que l'appelant peut modifier
+        """
+        with self._verrou:
+            df = self._memo.get(cle)
+            if df is not None:
+                self._memo.move_to_end(cle)
+        if df is None:
+            df = calculer()
+            with self._verrou:
+                self._memo[cle] = df
+                while len(self._memo) > self.taille_memo:
+                    self._memo.popitem(last=False)
+        # Copie : l'appelant peut modifier ses cellules sans altérer le dépôt
+        return df.copy()
+
+    def lire_parquet_blob(self, sha):
+        """Lit un blob Parquet directement depuis le dossier des blobs (memory map), mémorisé par SHA"""
+        def decoder():
+            table = pq.read_table(str(self.chemin_blob(sha)), memory_map=True)
+            # Les anciens fichiers stockent Chemin en JSON : conversion au format compact
+            return migrer_chemins(table.to_pandas())
+        return self.memoriser(sha, decoder)
+
+    def lire_parquet(self, chemin, branche="main"):
+        """
+        Lit un fichier Parquet du dépôt directement depuis le dossier des blobs (memory map).
+
+        Le DataFrame décodé est mémorisé par SHA : tant que le fichier n'a pas
+        changé, seule une copie est retournée.
+        """
+        return self.lire_parquet_blob(self.sha_fichier(chemin, branche))
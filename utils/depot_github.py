@@ -0,0 +1,218 @@
+import base64
+import hashlib
+import os
+import tempfile
+import time
+import requests
+import streamlit as st
+
+from utils.cache_persistant import CacheSQLite
+from utils.depot_blobs import DepotBlobs, sha_blob_git
+from utils.moteur_routage import executer_en_parallele
+from utils.parametres import DOSSIER_CACHE, lire_parametre
+
+URL_API_GITHUB = "https://api.github.com"
+
+# Taille des morceaux lus lors du téléchargement d'un blob
+TAILLE_MORCEAU = 1024 * 1024
+
+
+class MiroirGithub(DepotBlobs):
+    """
+    Miroir local des fichiers d'un dépôt GitHub, indexé par SHA de blob git.
+
+    L'arborescence d'une branche (chemin -> SHA) est revalidée par requête
+    conditionnelle (If-None-Match) : tant que la branche n'a pas changé, GitHub
+    répond 304 sans corps. Un blob n'est téléchargé que si son SHA est absent du
+    dossier local ; son contenu ne change jamais, il n'a donc pas à être revalidé.
+    """
+
+    nom = "GitHub"
+
+    def __init__(self, token, repo_name, dossier=DOSSIER_CACHE / "blobs", intervalle=None, taille_memo=8):
+        """
+        Args:
+            token: Jeton d'accès GitHub
+            repo_name: Dépôt au format "propriétaire/nom"
+            dossier: Dossier des blobs mis en miroir
+            intervalle: Délai (s) pendant lequel une arborescence est réputée à jour
+                sans même une requête conditionnelle (par défaut github.revalidation_secondes, 30)
+            taille_memo: Nombre de DataFrames décodés gardés en mémoire
+        """
+        super().__init__(dossier, taille_memo)
+        self.repo_name = repo_name
+        self.intervalle = intervalle if intervalle is not None else lire_parametre(
+            "github", "revalidation_secondes", 30)
+
+        self._session = requests.Session()
+        self._session.headers.update({
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/vnd.github+json",
+            "X-GitHub-Api-Version": "2022-11-28",
+        })
+        # Arborescences connues (ETag compris), conservées d'un démarrage à l'autre
+        self._arbres = CacheSQLite("arbres_github", taille_max=100)
+        self._verifications = {}
+
+    def _url(self, chemin):
+        return f"{URL_API_GITHUB}/repos/{self.repo_name}/{chemin}"
+
+    def arbre(self, branche="main"):
+        """
+        Retourne l'arborescence de la branche, revalidée si nécessaire.
+
+        Returns:
+            dict {chemin du fichier: SHA du blob}
+        """
+        cle = f"{self.repo_name}@{branche}"
+        connu = self._arbres.lire(cle)
+        with self._verrou:
+            derniere = self._verifications.get(cle)
+        if connu is not None and derniere is not None and time.monotonic() - derniere < self.intervalle:
+            return connu["fichiers"]
+
+        entetes = {"If-None-Match": connu["etag"]} if connu is not None and connu.get("etag") else {}
+        response = self._session.get(self._url(f"git/trees/{branche}"), params={"recursive": "1"},
+                                     headers=entetes, timeout=30)
+
+        if response.status_code == 304:
+            # Branche inchangée : aucune donnée transférée
+            fichiers = connu["fichiers"]
+        else:
+            response.raise_for_status()
+            donnees = response.json()
+            if donnees.get("truncated"):
+                print(f"Arborescence de {self.repo_name}@{branche} tronquée par GitHub")
+            fichiers = {e["path"]: e["sha"] for e in donnees["tree"] if e["type"] == "blob"}
+            self._arbres.ecrire(cle, {"etag": response.headers.get("ETag"), "sha": donnees["sha"],
+                                      "fichiers": fichiers})
+
+        with self._verrou:
+            self._verifications[cle] = time.monotonic()
+        return fichiers
+
+    def invalider(self, branche="main"):
+        """Force la revalidation de l'arborescence au prochain accès (après une écriture)"""
+        with self._verrou:
+            self._verifications.pop(f"{self.repo_name}@{branche}", None)
+
+    def chemin_blob(self, sha):
+        """Retourne le fichier local du blob, téléchargé s'il n'est pas déjà en miroir"""
+        chemin = self.dossier / sha
+        if not chemin.is_file():
+            self._telecharger_blob(sha, chemin)
+        return chemin
+
+    def _telecharger_blob(self, sha, chemin):
+        """
+        Télécharge un blob par morceaux, directement dans un fichier temporaire.
+
+        Le contenu brut (application/vnd.github.raw) n'est limité qu'à 100 Mo, contre
+        1 Mo pour le contenu inline de l'API contents, et n'est jamais entièrement
+        en mémoire. Le SHA est vérifié (relecture par morceaux) avant de publier le fichier.
+        """
+        descripteur, temporaire = tempfile.mkstemp(dir=self.dossier, prefix=".telechargement-")
+        try:
+            with os.fdopen(descripteur, "wb") as f, self._session.get(
+                self._url(f"git/blobs/{sha}"), headers={"Accept": "application/vnd.github.raw"},
+                stream=True, timeout=60,
+            ) as response:
+                response.raise_for_status()
+                taille = 0
+                for morceau in response.iter_content(chunk_size=TAILLE_MORCEAU):
+                    f.write(morceau)
+                    taille += len(morceau)
+
+            # SHA git = SHA-1 de l'en-tête "blob <taille>\0" suivi du contenu
+            empreinte = hashlib.sha1(b"blob %d\0" % taille)
+            with open(temporaire, "rb") as f:
+                for morceau in iter(lambda: f.read(TAILLE_MORCEAU), b""):
+                    empreinte.update(morceau)
+            if empreinte.hexdigest() != sha:
+                raise ValueError(f"Contenu du blob {sha} corrompu")
+            os.replace(temporaire, chemin)
+        finally:
+            if os.path.exists(temporaire):
+                os.remove(temporaire)
+
+    def commiter(self, fichiers, message, branche="main", essais_max=3):
+        """
+        Enregistre plusieurs fichiers en un seul commit, via l'API Git Data.
+
+        Les fichiers dont le SHA de blob n'a pas changé sont ignorés ; seuls les
+        blobs nouveaux sont envoyés (en parallèle). Un arbre et un commit sont
+        ensuite créés, puis la branche est avancée : tous les fichiers arrivent
+        ensemble ou aucun. Si la branche a bougé entre-temps, l'opération est
+        reprise sur le nouveau commit.
+
+        Args:
+            fichiers: dict {chemin: contenu en octets, ou None pour supprimer le fichier}
+            message: Message du commit
+            branche: Nom de la branche
+            essais_max: Nombre de tentatives en cas de mise à jour concurrente de la branche
+
+        Returns:
+            Le SHA du commit créé, ou None si aucun fichier n'a changé
+        """
+        shas = {chemin: None if contenu is None else sha_blob_git(contenu) for chemin, contenu in fichiers.items()}
+
+        for essai in range(essais_max):
+            # Fichiers réellement modifiés (arborescence revalidée, souvent un simple 304)
+            self.invalider(branche)
+            distants = self.arbre(branche)
+            modifies = {chemin: sha for chemin, sha in shas.items() if distants.get(chemin) != sha}
+            if not modifies:
+                return None
+
+            # Commit de tête de la branche et son arbre, base du nouveau commit
+            response = self._session.get(self._url(f"git/ref/heads/{branche}"), timeout=30)
+            response.raise_for_status()
+            parent = response.json()["object"]["sha"]
+            response = self._session.get(self._url(f"git/commits/{parent}"), timeout=30)
+            response.raise_for_status()
+            arbre_parent = response.json()["tree"]["sha"]
+
+            # Envoyer uniquement les blobs absents du dépôt
+            connus = set(distants.values())
+            a_envoyer = {sha: (fichiers[chemin],) for chemin, sha in modifies.items()
+                         if sha is not None and sha not in connus}
+            executer_en_parallele(self._creer_blob, a_envoyer, nb_threads=4)
+
+            response = self._session.post(self._url("git/trees"), json={
+                "base_tree": arbre_parent,
+                "tree": [{"path": chemin, "mode": "100644", "type": "blob", "sha": sha}
+                         for chemin, sha in modifies.items()],
+            }, timeout=60)
+            response.raise_for_status()
+            response = self._session.post(self._url("git/commits"), json={
+                "message": message, "tree": response.json()["sha"], "parents": [parent],
+            }, timeout=30)
+            response.raise_for_status()
+            commit = response.json()["sha"]
+
+            response = self._session.patch(self._url(f"git/refs/heads/{branche}"),
+                                           json={"sha": commit, "force": False}, timeout=30)
+            if response.status_code == 422 and essai < essais_max - 1:
+                # La branche a avancé pendant l'opération (pas d'avance rapide possible)
+                continue
+            response.raise_for_status()
+
+            for chemin, contenu in fichiers.items():
+                if contenu is not None:
+                    self.enregistrer_blob(contenu, shas[chemin])
+            self.invalider(branche)
+            return commit
+
+    def _creer_blob(self, contenu):
+        """Envoie un blob au dépôt et retourne son SHA"""
+        response = self._session.post(self._url("git/blobs"), json={
+            "content": base64.b64encode(contenu).decode("ascii"), "encoding": "base64",
+        }, timeout=120)
+        response.raise_for_status()
+        return response.json()["sha"]
+
+
+@st.cache_resource
+def miroir_github():
+    """Retourne le miroir du dépôt GitHub configuré, partagé entre les sessions"""
+    return MiroirGithub(st.secrets["github"]["token"], st.secrets["github"]["repo_name"])
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from utils.depot_blobs import DepotBlobs, sha_blob_git
+from utils.parametres import DOSSIER_CACHE
+
+
+def _identifiant_commit(fichiers, message):
+    """
+    Identifiant d'une modification : empreinte de l'arborescence obtenue, du message et de l'heure.
+
+    L'heure rend l'identifiant unique dans l'historique : revenir à une
+    arborescence déjà enregistrée, avec le même message, donne un nouvel identifiant.
+    """
+    contenu = json.dumps([sorted(fichiers.items()), message, time.time()]).encode("utf-8")
+    return hashlib.sha1(contenu).hexdigest()
+
+
+class DepotLocal(DepotBlobs):
+    """
+    Dépôt de données dans un dossier local, sans réseau ni quota.
+
+    Les blobs sont rangés par SHA dans objets/, et l'arborescence de chaque
+    branche dans branches/<branche>.json. Une écriture ajoute d'abord les blobs
+    nouveaux, puis remplace l'arborescence d'un seul os.replace : un lecteur
+    voit l'ancienne version ou la nouvelle, jamais un mélange des deux.
+    L'historique des modifications est ajouté à historique.jsonl.
+    """
+
+    nom = "dossier local"
+
+    def __init__(self, dossier, taille_memo=8):
+        """
+        Args:
+            dossier: Dossier racine du dépôt (créé si nécessaire)
+            taille_memo: Nombre de DataFrames décodés gardés en mémoire
+        """
+        self.racine = Path(dossier)
+        super().__init__(self.racine / "objets", taille_memo)
+        (self.racine / "branches").mkdir(parents=True, exist_ok=True)
+        self._arbres = {}  # branche -> (mtime_ns, arborescence)
+        self._ecriture = threading.Lock()
+
+    def _fichier_branche(self, branche):
+        return self.racine / "branches" / f"{branche}.json"
+
+    def arbre(self, branche="main"):
+        fichier = self._fichier_branche(branche)
+        try:
+            version = fichier.stat().st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        with self._verrou:
+            connu = self._arbres.get(branche)
+        if connu is not None and connu[0] == version:
+            return connu[1]
+        with open(fichier, encoding="utf-8") as f:
+            fichiers = json.load(f)
+        with self._verrou:
+            self._arbres[branche] = (version, fichiers)
+        return fichiers
+
+    def invalider(self, branche="main"):
+        with self._verrou:
+            self._arbres.pop(branche, None)
+
+    def chemin_blob(self, sha):
+        chemin = self.dossier / sha
+        if not chemin.is_file():
+            raise FileNotFoundError(f"Blob {sha} absent de {self.racine}")
+        return chemin
+
+    def commiter(self, fichiers, message, branche="main"):
+        with self._ecriture:
+            arbre = dict(self.arbre(branche))
+            modifies = False
+            for chemin, contenu in fichiers.items():
+                if contenu is None:
+                    modifies |= arbre.pop(chemin, None) is not None
+                else:
+                    sha = self.enregistrer_blob(contenu)
+                    modifies |= arbre.get(chemin) != sha
+                    arbre[chemin] = sha
+            if not modifies:
+                return None
+
+            # Publication atomique de la nouvelle arborescence
+            fichier = self._fichier_branche(branche)
+            descripteur, temporaire = tempfile.mkstemp(dir=fichier.parent, prefix=".branche-")
+            with os.fdopen(descripteur, "w", encoding="utf-8") as f:
+                json.dump(arbre, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporaire, fichier)
+            self.invalider(branche)
+
+            commit = _identifiant_commit(arbre, message)
+            with open(self.racine / "historique.jsonl", "a", encoding="utf-8") as f:
+                f.write(json.dumps({"commit": commit, "branche": branche, "message": message,
+                                    "date": time.time(), "fichiers": sorted(fichiers)}) + "\n")
+            return commit
+
+
+class DepotSQLite(DepotBlobs):
+    """
+    Dépôt de données dans un fichier SQLite unique.
+
+    Blobs, arborescences et historique sont dans la même base : une écriture
+    est une transaction. Les blobs lus sont extraits dans le dossier de cache
+    des blobs (partagé avec le miroir GitHub, le contenu d'un SHA étant
+    toujours le même) pour pouvoir être projetés en mémoire.
+    """
+
+    nom = "SQLite"
+
+    def __init__(self, fichier, dossier=DOSSIER_CACHE / "blobs", taille_memo=8):
+        """
+        Args:
+            fichier: Fichier SQLite du dépôt (créé si nécessaire)
+            dossier: Dossier où les blobs lus sont extraits
+            taille_memo: Nombre de DataFrames décodés gardés en mémoire
+        """
+        super().__init__(dossier, taille_memo)
+        self.chemin = Path(fichier)
+        self.chemin.parent.mkdir(parents=True, exist_ok=True)
+        # Une connexion par thread : sqlite3 interdit le partage entre threads
+        self._local = threading.local()
+        self._arbres = {}  # branche -> (version, arborescence)
+
+        with self._connexion() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS blobs (sha TEXT PRIMARY KEY, contenu BLOB NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fichiers ("
+                "branche TEXT NOT NULL, chemin TEXT NOT NULL, sha TEXT NOT NULL, "
+                "PRIMARY KEY (branche, chemin))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS commits ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, branche TEXT NOT NULL, "
+                "message TEXT NOT NULL, date REAL NOT NULL)"
+            )
+
+    def _connexion(self):
+        """Retourne la connexion SQLite du thread courant"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.chemin, timeout=30)
+            # WAL permet des lectures concurrentes pendant une écriture (plusieurs processus)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _version(self, conn, branche):
+        """Dernière modification de la branche (identifie l'arborescence sans la relire)"""
+        return conn.execute("SELECT MAX(id) FROM commits WHERE branche = ?", (branche,)).fetchone()[0]
+
+    def arbre(self, branche="main"):
+        conn = self._connexion()
+        version = self._version(conn, branche)
+        with self._verrou:
+            connu = self._arbres.get(branche)
+        if connu is not None and connu[0] == version:
+            return connu[1]
+        fichiers = dict(conn.execute("SELECT chemin, sha FROM fichiers WHERE branche = ?", (branche,)))
+        with self._verrou:
+            self._arbres[branche] = (version, fichiers)
+        return fichiers
+
+    def invalider(self, branche="main"):
+        with self._verrou:
+            self._arbres.pop(branche, None)
+
+    def chemin_blob(self, sha):
+        chemin = self.dossier / sha
+        if not chemin.is_file():
+            ligne = self._connexion().execute("SELECT contenu FROM blobs WHERE sha = ?", (sha,)).fetchone()
+            if ligne is None:
+                raise FileNotFoundError(f"Blob {sha} absent de {self.chemin}")
+            self.enregistrer_blob(bytes(ligne[0]), sha)
+        return chemin
+
+    def commiter(self, fichiers, message, branche="main"):
+        conn = self._connexion()
+        # BEGIN IMMEDIATE : un seul écrivain à la fois, les lectures restent possibles
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            actuels = dict(conn.execute("SELECT chemin, sha FROM fichiers WHERE branche = ?", (branche,)))
+            supprimes = [(branche, chemin) for chemin, contenu in fichiers.items()
+                         if contenu is None and chemin in actuels]
+            ecrits = {}
+            for chemin, contenu in fichiers.items():
+                if contenu is not None:
+                    sha = sha_blob_git(contenu)
+                    if actuels.get(chemin) != sha:
+                        ecrits[chemin] = (sha, contenu)
+            if not supprimes and not ecrits:
+                conn.rollback()
+                return None
+
+            conn.executemany("INSERT OR IGNORE INTO blobs (sha, contenu) VALUES (?, ?)",
+                             [(sha, sqlite3.Binary(contenu)) for sha, contenu in ecrits.values()])
+            conn.executemany("INSERT OR REPLACE INTO fichiers (branche, chemin, sha) VALUES (?, ?, ?)",
+                             [(branche, chemin, sha) for chemin, (sha, _) in ecrits.items()])
+            conn.executemany("DELETE FROM fichiers WHERE branche = ? AND chemin = ?", supprimes)
+            curseur = conn.execute("INSERT INTO commits (branche, message, date) VALUES (?, ?, ?)",
+                                   (branche, message, time.time()))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+        self.invalider(branche)
+        return str(curseur.lastrowid)
@@ -0,0 +1,176 @@
+import uuid
+import numpy as np
+import pandas as pd
+
+# Colonne de l'identifiant permanent de chaque ligne du voyage
+COLONNE_ID = "Id"
+
+# Colonnes dont la modification déplace un point (coordonnées à recalculer)
+COLONNES_GEOCODAGE = ["Adresse"]
+
+# Colonnes dont la modification change les itinéraires touchant la ligne
+COLONNES_ROUTAGE = ["Adresse", "Type_Deplacement"]
+
+
+def assurer_identifiants(df):
+    """
+    Donne un identifiant aux lignes qui n'en ont pas, et un nouvel identifiant aux doublons.
+
+    Les lignes d'un ancien fichier reçoivent un identifiant déterministe (dérivé
+    de leur position), stable d'une réexécution à l'autre tant que le fichier n'a
+    pas été réenregistré ; les autres lignes reçoivent un identifiant aléatoire.
+
+    Args:
+        df: DataFrame avec les données du voyage
+
+    Returns:
+        Le DataFrame avec la colonne Id complète (une copie si des identifiants ont été ajoutés)
+    """
+    if COLONNE_ID in df.columns:
+        ids = df[COLONNE_ID]
+        manquants = ids.isna().to_numpy() | (ids.astype(str) == "").to_numpy()
+        doublons = ids.duplicated().to_numpy() & ~manquants
+        if not manquants.any() and not doublons.any():
+            return df
+    else:
+        manquants = np.ones(len(df), dtype=bool)
+        doublons = np.zeros(len(df), dtype=bool)
+
+    df = df.copy()
+    ids = df[COLONNE_ID].to_numpy(dtype=object) if COLONNE_ID in df.columns else np.full(len(df), None, dtype=object)
+    anciennes = COLONNE_ID not in df.columns
+    for position in np.flatnonzero(manquants | doublons):
+        if anciennes:
+            ids[position] = uuid.uuid5(uuid.NAMESPACE_OID, f"ligne-{position}").hex
+        else:
+            ids[position] = uuid.uuid4().hex
+    df[COLONNE_ID] = ids
+    return df
+
+
+class Changements:
+    """
+    Différences entre deux versions du voyage, lignes appariées par identifiant.
+
+    Attributes:
+        inseres: Identifiants des lignes ajoutées
+        supprimes: Identifiants des lignes supprimées
+        modifies: dict {colonne: identifiants des lignes dont la cellule a changé}
+    """
+
+    def __init__(self, inseres, supprimes, modifies):
+        self.inseres = list(inseres)
+        self.supprimes = list(supprimes)
+        self.modifies = {col: list(ids) for col, ids in modifies.items() if len(ids)}
+
+    @property
+    def vide(self):
+        """Indique qu'aucune ligne n'a été ajoutée, supprimée ou modifiée"""
+        return not (self.inseres or self.supprimes or self.modifies)
+
+    def lignes_modifiees(self, colonnes=None):
+        """
+        Args:
+            colonnes: Colonnes considérées (toutes par défaut)
+
+        Returns:
+            set des identifiants des lignes dont l'une de ces colonnes a changé
+        """
+        colonnes = self.modifies if colonnes is None else colonnes
+        return set().union(*(self.modifies.get(col, ()) for col in colonnes))
+
+    def a_geocoder(self):
+        """Identifiants des lignes existantes dont les coordonnées sont à recalculer"""
+        return self.lignes_modifiees(COLONNES_GEOCODAGE)
+
+    def a_router(self):
+        """Identifiants des lignes dont les segments adjacents sont à recalculer"""
+        return self.lignes_modifiees(COLONNES_ROUTAGE) | set(self.inseres)
+
+    def __repr__(self):
+        modifies = {col: len(ids) for col, ids in self.modifies.items()}
+        return f"Changements(inseres={len(self.inseres)}, supprimes={len(self.supprimes)}, modifies={modifies})"
+
+
+def _differences(avant, apres):
+    """Masque des cellules différentes entre deux colonnes alignées (deux valeurs manquantes sont égales)"""
+    return ((avant != apres) & ~(avant.isna() & apres.isna())).to_numpy()
+
+
+def calculer_changements(avant, apres, ignorer=()):
+    """
+    Compare deux versions du voyage, lignes appariées par la colonne Id.
+
+    Les cellules des lignes communes sont comparées colonne par colonne, par
+    masques sur les colonnes entières : l'ordre des lignes n'intervient pas, si
+    bien qu'un tri ou une suppression ne fait pas apparaître de fausses
+    modifications. Les lignes ajoutées doivent avoir reçu un identifiant
+    (voir assurer_identifiants).
+
+    Args:
+        avant: Version de référence (avec la colonne Id)
+        apres: Version modifiée (avec la colonne Id)
+        ignorer: Colonnes exclues de la comparaison (états d'affichage, ...)
+
+    Returns:
+        Changements
+    """
+    ids_avant = pd.Index(avant[COLONNE_ID])
+    ids_apres = pd.Index(apres[COLONNE_ID])
+    inseres = ids_apres[~ids_apres.isin(ids_avant)]
+    supprimes = ids_avant[~ids_avant.isin(ids_apres)]
+    communs = ids_apres[ids_apres.isin(ids_avant)]
+
+    colonnes = [col for col in apres.columns
+                if col in avant.columns and col != COLONNE_ID and col not in ignorer]
+    gauche = avant.set_index(COLONNE_ID).loc[communs, colonnes]
+    droite = apres.set_index(COLONNE_ID).loc[communs, colonnes]
+
+    modifies = {}
+    for col in colonnes:
+        masque = _differences(gauche[col], droite[col])
+        if masque.any():
+            modifies[col] = communs[masque].tolist()
+
+    return Changements(inseres.tolist(), supprimes.tolist(), modifies)
+
+
+def appliquer_changements(df, apres, changements):
+    """
+    Reporte les changements sur le DataFrame complet du voyage.
+
+    Seules les cellules modifiées sont écrites ; les lignes supprimées sont
+    retirées et les lignes ajoutées complétées par des valeurs manquantes pour
+    les colonnes absentes de `apres` (tracés, coordonnées, ...). Les coordonnées
+    des lignes dont l'adresse a changé sont effacées pour être recalculées.
+
+    Args:
+        df: DataFrame complet du voyage (avec la colonne Id)
+        apres: Version modifiée (colonnes éditables, avec la colonne Id)
+        changements: Changements calculés entre la version affichée et `apres`
+
+    Returns:
+        Le nouveau DataFrame, dans l'ordre de df suivi des lignes ajoutées
+    """
+    df = df[~df[COLONNE_ID].isin(changements.supprimes)].set_index(COLONNE_ID)
+    modifiee = apres.set_index(COLONNE_ID)
+
+    for col, ids in changements.modifies.items():
+        if col not in df.columns:
+            continue
+        valeurs = modifiee.loc[ids, col]
+        if df[col].dtype != valeurs.dtype and valeurs.dtype == object:
+            # Texte saisi dans une colonne numérique : éviter une conversion implicite par pandas
+            df[col] = df[col].astype(object)
+        df.loc[ids, col] = valeurs.to_numpy()
+
+    a_geocoder = [i for i in changements.a_geocoder() if i in df.index]
+    for col in ("Latitude", "Longitude"):
+        if a_geocoder and col in df.columns:
+            df.loc[a_geocoder, col] = np.nan
+
+    if changements.inseres:
+        nouvelles = modifiee.loc[changements.inseres, [col for col in modifiee.columns if col in df.columns]]
+        df = pd.concat([df, nouvelles.reindex(columns=df.columns)])
+
+    return df.reset_index()
@@ -0,0 +1,290 @@
+import hashlib
+import json
+import threading
+from abc import ABC, abstractmethod
+import numpy as np
+import streamlit as st
+from pathlib import Path
+
+from utils.geodesie import haversine
+from utils.moteur_routage import requete_ors, requete_osrm
+from utils.parametres import lire_parametre
+from utils.routage_local import graphe_local
+
+
+class FournisseurRoutage(ABC):
+    """
+    Interface commune des moteurs de calcul d'itinéraires.
+
+    Un fournisseur calcule l'itinéraire passant par une suite de points et le
+    découpe en un résultat par tronçon (entre deux points consécutifs).
+    """
+
+    # Nom affiché dans les messages et préfixe des clés du cache des routes
+    nom = "abstrait"
+
+    # Les résultats méritent-ils d'être conservés dans le cache persistant des routes ?
+    mise_en_cache = False
+
+    # Le fournisseur sait-il calculer plusieurs tronçons en une seule requête ?
+    multi_points = False
+
+    @abstractmethod
+    def itineraire(self, points, profile):
+        """
+        Calcule l'itinéraire passant par tous les points.
+
+        Args:
+            points: Liste de tuples (latitude, longitude), au moins deux
+            profile: Profil ORS ('driving-car', 'foot-hiking', ...)
+
+        Returns:
+            Liste de tuples (distance_km, duration_hours, route_coords), un par tronçon,
+            route_coords étant une liste de points [lat, lon]
+
+        Raises:
+            requests.exceptions.RequestException en cas d'erreur réseau,
+            ValueError / KeyError / IndexError si la réponse est inexploitable
+        """
+
+    def cle_cache(self, profile):
+        """Profil utilisé dans les clés du cache des routes, pour ne pas mélanger les moteurs"""
+        return f"{self.nom}:{profile}"
+
+
+def extraire_geometrie(route):
+    """Extrait les coordonnées [lat, lon] d'un itinéraire ORS (polyline encodée ou GeoJSON)"""
+    geometry = route["geometry"]
+    if isinstance(geometry, str):
+        # Si c'est encodé, décoder avec polyline
+        import polyline
+        return [list(point) for point in polyline.decode(geometry)]
+
+    # Sinon, extraire directement
+    # OpenRouteService retourne [lon, lat], on inverse pour [lat, lon]
+    return [[point[1], point[0]] for point in geometry["coordinates"]]
+
+
+class FournisseurORS(FournisseurRoutage):
+    """OpenRouteService (API publique ou serveur compatible, voir openrouteservices.url)"""
+
+    nom = "ors"
+    mise_en_cache = True
+    multi_points = True
+
+    def __init__(self, url=None, token=None):
+        """
+        Args:
+            url: Adresse du serveur (par défaut openrouteservices.url, sinon l'API publique)
+            token: Clé d'API (par défaut openrouteservices.token)
+        """
+        self.url = url
+        self.token = token
+
+    def cle_cache(self, profile):
+        # Clés historiques du cache : le profil seul
+        return profile
+
+    def itineraire(self, points, profile):
+        # Notez que ORS attend les coordonnées en [longitude, latitude]
+        coordinates = [[lon, lat] for lat, lon in points]
+        data = requete_ors(profile, coordinates, url=self.url, token=self.token)
+
+        if not data.get("routes"):
+            raise ValueError("Aucun itinéraire trouvé dans la réponse OpenRouteService")
+        route = data["routes"][0]
+        route_coords = extraire_geometrie(route)
+
+        if len(points) == 2:
+            # Un seul tronçon : le résumé suffit
+            return [(route["summary"]["distance"], route["summary"]["duration"] / 3600, route_coords)]
+
+        # way_points : indice dans la géométrie de chaque point de passage
+        way_points = route["way_points"]
+        legs = route["segments"]
+        if len(way_points) != len(points) or len(legs) != len(points) - 1:
+            raise ValueError("Découpage des segments incohérent avec les points envoyés")
+
+        return [
+            (leg["distance"], leg["duration"] / 3600, route_coords[way_points[j]:way_points[j + 1] + 1])
+            for j, leg in enumerate(legs)
+        ]
+
+
+class FournisseurOSRM(FournisseurRoutage):
+    """Serveur OSRM ou compatible (API /route/v1), par exemple auto-hébergé"""
+
+    nom = "osrm"
+    mise_en_cache = True
+    multi_points = True
+
+    # Profils OSRM correspondant aux profils ORS
+    PROFILS = {"driving-car": "driving", "foot-hiking": "foot"}
+
+    def __init__(self, url):
+        """
+        Args:
+            url: Adresse du serveur OSRM (ex: http://localhost:5000)
+        """
+        self.url = url.rstrip("/")
+
+    def itineraire(self, points, profile):
+        coordonnees = [[lon, lat] for lat, lon in points]
+        data = requete_osrm(self.url, self.PROFILS.get(profile, profile), coordonnees)
+        if data.get("code") != "Ok" or not data.get("routes"):
+            raise ValueError(f"Aucun itinéraire trouvé dans la réponse OSRM ({data.get('code')})")
+
+        legs = data["routes"][0]["legs"]
+        if len(legs) != len(points) - 1:
+            raise ValueError("Découpage des segments incohérent avec les points envoyés")
+
+        resultats = []
+        for leg in legs:
+            # Géométrie d'un tronçon : étapes mises bout à bout (sans dupliquer les jonctions)
+            route_coords = []
+            for step in leg["steps"]:
+                coords = [[lat, lon] for lon, lat in step["geometry"]["coordinates"]]
+                route_coords.extend(coords[1:] if route_coords and coords and coords[0] == route_coords[-1] else coords)
+            resultats.append((leg["distance"] / 1000, leg["duration"] / 3600, route_coords))
+        return resultats
+
+
+class FournisseurLigneDroite(FournisseurRoutage):
+    """Lignes droites à vitesse constante : aucun appel réseau (tests, mode dégradé)"""
+
+    nom = "ligne_droite"
+    multi_points = True
+
+    # Vitesses (km/h) par profil ORS
+    VITESSES = {"driving-car": 50, "foot-hiking": 3.5}
+
+    def itineraire(self, points, profile):
+        points = np.asarray(points, dtype=np.float64)
+        distances_km = haversine(points[:-1, 0], points[:-1, 1], points[1:, 0], points[1:, 1]) / 1000
+        vitesse = self.VITESSES.get(profile, 50)
+        return [
+            (float(d), float(d) / vitesse, [points[j].tolist(), points[j + 1].tolist()])
+            for j, d in enumerate(distances_km)
+        ]
+
+
+class FournisseurLocal(FournisseurRoutage):
+    """
+    Graphe routier local (voir utils.routage_local), avec un fournisseur de secours
+    pour les points hors du réseau ou non reliés.
+    """
+
+    nom = "local"
+
+    def __init__(self, graphe, secours=None):
+        """
+        Args:
+            graphe: GrapheRoutier chargé
+            secours: Fournisseur utilisé quand le graphe ne trouve pas d'itinéraire (optionnel)
+        """
+        self.graphe = graphe
+        self.secours = secours
+
+    def itineraire(self, points, profile):
+        resultats = []
+        for depart, arrivee in zip(points[:-1], points[1:]):
+            locale = self.graphe.itineraire(depart, arrivee, profile)
+            if locale is not None:
+                distance_km, duration_hours, coords_json = locale
+                resultats.append((distance_km, duration_hours, json.loads(coords_json)))
+            elif self.secours is not None:
+                resultats.extend(self.secours.itineraire([depart, arrivee], profile))
+            else:
+                raise ValueError("Aucun itinéraire trouvé dans le graphe local")
+        return resultats
+
+
+class FournisseurEnregistre(FournisseurRoutage):
+    """
+    Enregistre les réponses d'un autre fournisseur dans un fichier JSON Lines, ou les rejoue.
+
+    En mode "rejouer", aucune requête n'est envoyée : un itinéraire absent de
+    l'enregistrement lève une ValueError. Utile pour des mesures reproductibles.
+    """
+
+    nom = "enregistrement"
+
+    def __init__(self, fichier, fournisseur=None, mode="rejouer"):
+        """
+        Args:
+            fichier: Fichier .jsonl des réponses enregistrées
+            fournisseur: Fournisseur interrogé en mode "enregistrer"
+            mode: "enregistrer" ou "rejouer"
+        """
+        if mode not in ("enregistrer", "rejouer"):
+            raise ValueError(f"Mode d'enregistrement inconnu : {mode}")
+        if mode == "enregistrer" and fournisseur is None:
+            raise ValueError("Le mode 'enregistrer' nécessite un fournisseur")
+
+        self.fichier = Path(fichier)
+        self.fournisseur = fournisseur
+        self.mode = mode
+        self.multi_points = fournisseur.multi_points if fournisseur is not None else True
+        self._verrou = threading.Lock()
+        self._reponses = {}
+        if self.fichier.is_file():
+            with open(self.fichier, encoding="utf-8") as f:
+                for ligne in f:
+                    if ligne.strip():
+                        entree = json.loads(ligne)
+                        self._reponses[entree["cle"]] = entree["troncons"]
+
+    @staticmethod
+    def _cle(points, profile):
+        texte = json.dumps([profile, [[round(float(v), 6) for v in p] for p in points]])
+        return hashlib.sha1(texte.encode("utf-8")).hexdigest()
+
+    def itineraire(self, points, profile):
+        cle = self._cle(points, profile)
+        with self._verrou:
+            troncons = self._reponses.get(cle)
+        if troncons is not None:
+            return [tuple(t) for t in troncons]
+        if self.mode == "rejouer":
+            raise ValueError(f"Itinéraire absent de l'enregistrement {self.fichier.name}")
+
+        troncons = self.fournisseur.itineraire(points, profile)
+        with self._verrou:
+            self._reponses[cle] = troncons
+            self.fichier.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.fichier, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"cle": cle, "troncons": troncons}) + "\n")
+        return troncons
+
+
+@st.cache_resource
+def fournisseur_routage():
+    """
+    Retourne le fournisseur d'itinéraires configuré, partagé entre les sessions.
+
+    Paramètres (section routage) :
+        fournisseur: "ors" (défaut), "osrm", "ligne_droite" ou "local"
+            ("local" par défaut si routage.graphe_local est renseigné)
+        osrm_url: Adresse du serveur OSRM
+        enregistrement: Fichier .jsonl d'enregistrement des réponses (optionnel)
+        mode_enregistrement: "enregistrer" (défaut) ou "rejouer"
+    """
+    graphe = graphe_local()
+    nom = lire_parametre("routage", "fournisseur", "local" if graphe is not None else "ors")
+
+    if nom == "osrm":
+        fournisseur = FournisseurOSRM(lire_parametre("routage", "osrm_url", "http://localhost:5000"))
+    elif nom == "ligne_droite":
+        fournisseur = FournisseurLigneDroite()
+    elif nom == "local" and graphe is not None:
+        fournisseur = FournisseurLocal(graphe, secours=FournisseurORS())
+    else:
+        if nom != "ors":
+            print(f"Fournisseur de routage '{nom}' indisponible, utilisation d'OpenRouteService")
+        fournisseur = FournisseurORS()
+
+    fichier = lire_parametre("routage", "enregistrement")
+    if fichier:
+        mode = lire_parametre("routage", "mode_enregistrement", "enregistrer")
+        fournisseur = FournisseurEnregistre(fichier, fournisseur, mode)
+    return fournisseur
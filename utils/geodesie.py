@@ -0,0 +1,103 @@
+import numpy as np
+
+# Rayon de la Terre en mètres
+RAYON_TERRE = 6371000
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Calcule la distance haversine (en mètres) entre des points, sur des tableaux entiers.
+
+    Les arguments peuvent être des scalaires ou des tableaux de formes compatibles
+    (règles de broadcasting NumPy).
+
+    Returns:
+        Distance(s) en mètres, de la forme du broadcast des arguments
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+
+    # Formule Haversine
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAYON_TERRE * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def distances_consecutives(latitudes, longitudes):
+    """
+    Calcule la distance entre chaque point et le suivant.
+
+    Args:
+        latitudes: Tableau de n latitudes
+        longitudes: Tableau de n longitudes
+
+    Returns:
+        Tableau de n - 1 distances en mètres (NaN si une coordonnée manque)
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    return haversine(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:])
+
+
+def matrice_distances(latitudes, longitudes):
+    """
+    Calcule la matrice N×N des distances à vol d'oiseau entre toutes les étapes.
+
+    Args:
+        latitudes: Tableau de n latitudes
+        longitudes: Tableau de n longitudes
+
+    Returns:
+        Tableau (n, n) de distances en mètres
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    return haversine(latitudes[:, None], longitudes[:, None], latitudes[None, :], longitudes[None, :])
+
+
+def distances_cumulees(points):
+    """
+    Calcule la distance parcourue depuis le début d'une polyligne, à chaque sommet.
+
+    Args:
+        points: Tableau (n, 2) de points [lat, lon]
+
+    Returns:
+        Tableau de n distances en mètres (la première vaut 0)
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) == 0:
+        return np.zeros(0)
+    return np.concatenate(([0.0], np.cumsum(distances_consecutives(points[:, 0], points[:, 1]))))
+
+
+def longueur_polyligne(points):
+    """Calcule la longueur (en mètres) d'une polyligne de points [lat, lon]"""
+    cumul = distances_cumulees(points)
+    return float(cumul[-1]) if len(cumul) else 0.0
+
+
+def longueurs_polylignes(polylignes):
+    """
+    Calcule la longueur de plusieurs polylignes en un seul calcul vectorisé.
+
+    Args:
+        polylignes: Liste de tableaux (n_i, 2) de points [lat, lon]
+
+    Returns:
+        Tableau des longueurs en mètres (0 pour une polyligne de moins de deux points)
+    """
+    tailles = np.array([len(p) for p in polylignes], dtype=np.int64)
+    longueurs = np.zeros(len(polylignes))
+    if tailles.sum() < 2:
+        return longueurs
+
+    points = np.concatenate([np.asarray(p, dtype=np.float64).reshape(-1, 2) for p in polylignes])
+    pas = distances_consecutives(points[:, 0], points[:, 1])
+
+    # Somme des pas de chaque polyligne (pas d'indices [debut, fin - 1[), les paires
+    # à cheval sur deux polylignes étant ainsi exclues
+    fins = np.cumsum(tailles)
+    debuts = fins - tailles
+    non_vides = tailles >= 2
+    cumul = np.concatenate(([0.0], np.cumsum(pas)))
+    longueurs[non_vides] = cumul[fins[non_vides] - 1] - cumul[debuts[non_vides]]
+    return longueurs
@@ -0,0 +1,232 @@
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from utils.simplification import niveaux_sommets, simplifier
+
+# Type Arrow de la colonne Chemin : [lat0, lon0, lat1, lon1, ...] en float32 (~1 m de précision)
+TYPE_CHEMIN = pa.list_(pa.float32())
+
+# Type Arrow de la colonne Chemin_Niveaux : niveau de détail de chaque sommet du tracé
+TYPE_NIVEAUX = pa.list_(pa.uint8())
+
+# Colonnes stockées en listes Arrow natives
+TYPES_COLONNES_LISTES = {"Chemin": TYPE_CHEMIN, "Chemin_Niveaux": TYPE_NIVEAUX}
+
+# Colonnes contenant les tracés, inutiles hors de la carte
+COLONNES_GEOMETRIE = ["Chemin", "Chemin_Niveaux"]
+
+# Nombre de décimales conservées lors de l'envoi des tracés au navigateur (~1 m)
+DECIMALES_AFFICHAGE = 5
+
+
+class CheminsParesseux:
+    """
+    Accès paresseux aux tracés d'un voyage.
+
+    Ne conserve que des références vers les cellules des colonnes Chemin et
+    Chemin_Niveaux : un tracé n'est décodé que lorsqu'il est lu (`chemins[i]`),
+    c'est-à-dire quand le segment est effectivement dessiné.
+    """
+
+    def __init__(self, chemins, niveaux=None, segments=None, charger=None):
+        """
+        Args:
+            chemins: Cellules de la colonne Chemin (tableau NumPy object)
+            niveaux: Cellules de la colonne Chemin_Niveaux (optionnel)
+            segments: Identifiants des tracés, quand ils sont stockés à part (voir depuis_segments)
+            charger: Fonction {identifiants} -> {identifiant: (Chemin, Chemin_Niveaux)}
+        """
+        self._chemins = chemins
+        self._niveaux = niveaux
+        self._segments = segments
+        self._charger = charger
+
+    @classmethod
+    def depuis_df(cls, df):
+        """Crée l'accesseur à partir des colonnes d'un DataFrame, sans copier les tracés"""
+        chemins = df["Chemin"].to_numpy() if "Chemin" in df.columns else np.full(len(df), None)
+        niveaux = df["Chemin_Niveaux"].to_numpy() if "Chemin_Niveaux" in df.columns else None
+        return cls(chemins, niveaux)
+
+    @classmethod
+    def depuis_segments(cls, segments, charger):
+        """
+        Crée l'accesseur à partir des identifiants des tracés stockés à part.
+
+        Les tracés de tous les segments sont lus en une fois, au premier tracé demandé.
+        """
+        segments = np.asarray(segments, dtype=object)
+        return cls(None, segments=segments, charger=charger)
+
+    def _charger_traces(self):
+        if self._chemins is None:
+            traces = self._charger(set(self._segments.tolist()))
+            # Remplissage cellule par cellule : un tableau object ne doit pas diffuser les tracés
+            self._chemins = np.full(len(self._segments), None, dtype=object)
+            self._niveaux = np.full(len(self._segments), None, dtype=object)
+            for i, segment in enumerate(self._segments):
+                self._chemins[i], self._niveaux[i] = traces.get(segment, (None, None))
+
+    def __len__(self):
+        return len(self._segments) if self._chemins is None else len(self._chemins)
+
+    def __getitem__(self, i):
+        """Retourne le tracé du segment i sous forme de tableau (n, 2) [lat, lon]"""
+        self._charger_traces()
+        return decoder_chemin(self._chemins[i])
+
+    def present(self, i):
+        """Indique si le segment i a un tracé enregistré"""
+        self._charger_traces()
+        return chemin_present(self._chemins[i])
+
+    def pour_affichage(self, i, niveau=0):
+        """Retourne le tracé du segment i simplifié au niveau demandé, prêt pour Folium"""
+        self._charger_traces()
+        niveaux = self._niveaux[i] if self._niveaux is not None else None
+        return chemin_pour_affichage(self._chemins[i], niveaux, niveau)
+
+
+def encoder_chemin(route_coords):
+    """
+    Convertit un tracé vers le format compact stocké dans la colonne Chemin.
+
+    Args:
+        route_coords: Liste de points [lat, lon], chaîne JSON (ancien format) ou tableau NumPy
+
+    Returns:
+        Tableau NumPy float32 à une dimension [lat0, lon0, lat1, lon1, ...],
+        ou None si le tracé est absent
+    """
+    if not chemin_present(route_coords):
+        return None
+    if isinstance(route_coords, str):
+        route_coords = json.loads(route_coords) if route_coords else []
+    return np.asarray(route_coords, dtype=np.float32).reshape(-1)
+
+
+def decoder_chemin(valeur):
+    """
+    Retourne un tracé sous forme de tableau (n, 2) de points [lat, lon].
+
+    Pour le format compact, le résultat est une vue sur les données lues depuis
+    Parquet : aucune copie ni analyse JSON n'est effectuée.
+
+    Args:
+        valeur: Contenu d'une cellule de la colonne Chemin (tableau, liste, chaîne JSON ou None)
+
+    Returns:
+        Tableau NumPy de forme (n, 2), vide si le tracé est absent ou illisible
+    """
+    if not chemin_present(valeur):
+        return np.empty((0, 2), dtype=np.float32)
+    if isinstance(valeur, str):
+        try:
+            valeur = json.loads(valeur) if valeur else []
+        except json.JSONDecodeError:
+            return np.empty((0, 2), dtype=np.float32)
+    return np.asarray(valeur).reshape(-1, 2)
+
+
+def chemin_present(valeur):
+    """Indique si une cellule de la colonne Chemin contient un tracé (éventuellement vide)"""
+    if isinstance(valeur, (np.ndarray, list, str)):
+        return True
+    return valeur is not None and pd.notna(valeur)
+
+
+def calculer_niveaux(valeur):
+    """Précalcule les niveaux de détail d'un tracé (None si le tracé est absent)"""
+    if not chemin_present(valeur):
+        return None
+    return niveaux_sommets(decoder_chemin(valeur))
+
+
+def chemin_pour_affichage(valeur, niveaux=None, niveau=0):
+    """
+    Convertit un tracé en liste de points [lat, lon] arrondis, prête pour Folium.
+
+    Args:
+        valeur: Contenu d'une cellule de la colonne Chemin
+        niveaux: Contenu de la cellule Chemin_Niveaux correspondante (optionnel)
+        niveau: Niveau de détail voulu (0 = tracé complet)
+    """
+    points = simplifier(decoder_chemin(valeur), niveaux if isinstance(niveaux, np.ndarray) else None, niveau)
+    return np.round(points.astype(np.float64), DECIMALES_AFFICHAGE).tolist()
+
+
+def completer_niveaux(df):
+    """
+    Calcule les niveaux de détail des tracés qui n'en ont pas encore.
+
+    Args:
+        df: DataFrame avec les données du voyage (modifié en place)
+
+    Returns:
+        Le DataFrame
+    """
+    if "Chemin" not in df.columns:
+        return df
+    if "Chemin_Niveaux" not in df.columns:
+        df["Chemin_Niveaux"] = None
+
+    a_completer = [
+        i for i, (chemin, niveaux) in enumerate(zip(df["Chemin"], df["Chemin_Niveaux"]))
+        if chemin_present(chemin) and not (
+            isinstance(niveaux, np.ndarray) and len(niveaux) == len(decoder_chemin(chemin))
+        )
+    ]
+    if a_completer:
+        niveaux = df["Chemin_Niveaux"].astype(object).to_numpy(copy=True)
+        for i in a_completer:
+            niveaux[i] = calculer_niveaux(df["Chemin"].iat[i])
+        df["Chemin_Niveaux"] = niveaux
+    return df
+
+
+def migrer_chemins(df):
+    """
+    Convertit la colonne Chemin de l'ancien format (chaînes JSON) vers le format compact.
+
+    Les cellules déjà au format compact ne sont pas modifiées. Les niveaux de
+    détail manquants sont calculés au passage.
+
+    Args:
+        df: DataFrame avec les données du voyage (modifié en place)
+
+    Returns:
+        Le DataFrame
+    """
+    if "Chemin" in df.columns and df["Chemin"].map(lambda v: isinstance(v, (str, list))).any():
+        df["Chemin"] = [
+            encoder_chemin(v) if isinstance(v, (str, list)) else v for v in df["Chemin"]
+        ]
+    return completer_niveaux(df)
+
+
+def table_arrow(df):
+    """
+    Convertit le DataFrame du voyage en table Arrow, avec les tracés en listes natives
+    (Chemin en list<float32>, Chemin_Niveaux en list<uint8>).
+
+    Args:
+        df: DataFrame avec les données du voyage
+
+    Returns:
+        pyarrow.Table prête à être écrite en Parquet
+    """
+    colonnes_listes = [col for col in TYPES_COLONNES_LISTES if col in df.columns]
+    table = pa.Table.from_pandas(df.drop(columns=colonnes_listes), preserve_index=False)
+
+    for col in sorted(colonnes_listes, key=df.columns.get_loc):
+        type_arrow = TYPES_COLONNES_LISTES[col]
+        if col == "Chemin":
+            valeurs = [encoder_chemin(v) for v in df[col]]
+        else:
+            valeurs = [v if isinstance(v, np.ndarray) else None for v in df[col]]
+        table = table.add_column(
+            df.columns.get_loc(col), pa.field(col, type_arrow), pa.array(valeurs, type=type_arrow)
+        )
+    return table
@@ -1,50 +1,258 @@
-from opencage.geocoder import OpenCageGeocode
+from opencage.geocoder import OpenCageGeocode, RateLimitExceededError
 import streamlit as st
 import pandas as pd
+import numpy as np
 import requests
 import json
-from math import sin, cos, sqrt, atan2, radians
+import re
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from utils.cache_persistant import CacheSQLite
+from utils.cache_routes import cache_routes, cle_segment
+from utils.geodesie import haversine, longueurs_polylignes
+from utils.geometrie import calculer_niveaux, decoder_chemin, encoder_chemin
+from utils.limiteur import LimiteurDebit, appeler_avec_reessais
+from utils.fournisseurs_routage import fournisseur_routage
+from utils.moteur_routage import executer_en_parallele
+from utils.parametres import lire_parametre
+
+
+@st.cache_resource
+def limiteur_geocodage():
+    """Retourne le limiteur de débit OpenCage, partagé entre les sessions (le quota est par clé)"""
+    return LimiteurDebit(lire_parametre("opencage", "requetes_par_seconde", 1))
+
+
+@st.cache_resource
+def cache_geocodage():
+    """Retourne le cache persistant des géocodages, partagé entre les sessions"""
+    return CacheSQLite(
+        "geocodage",
+        ttl=lire_parametre("cache", "geocodage_ttl_jours", 180) * 86400,
+        taille_max=lire_parametre("cache", "geocodage_taille_max", 50000),
+    )
+
+
+def normaliser_adresse(adresse):
+    """Normalise une adresse (Unicode, casse, espaces, virgules) pour servir de clé de cache"""
+    if not isinstance(adresse, str):
+        return None
+    adresse = unicodedata.normalize("NFKC", adresse).casefold()
+    adresse = re.sub(r"\s*,\s*", ", ", adresse)
+    adresse = " ".join(adresse.split()).strip(", ")
+    return adresse or None
+
+
+def statistiques_geocodage():
+    """Retourne les compteurs hits/misses du cache de géocodage"""
+    return cache_geocodage().statistiques()
 
 
 def add_lat_lon(df, address_column="Adresse"):
-    """Ajoute les coordonnées géographiques (latitude, longitude) pour chaque adresse"""
-    try:
-        api_key = st.secrets["opencage"]["api_key"]
-    except KeyError:
-        st.error("Clé API OpenCage manquante. Vérifiez le fichier .streamlit/secrets.toml.")
-        return df
-
-    geocoder = OpenCageGeocode(api_key)
+    """
+    Ajoute les coordonnées géographiques (latitude, longitude) pour chaque adresse.
 
+    Les adresses sont normalisées et dédoublonnées : chaque adresse distincte n'est
+    géocodée qu'une fois, et seulement si elle est absente du cache persistant.
+    Les adresses restantes sont géocodées en parallèle dans la limite du quota OpenCage
+    (paramètre opencage.requetes_par_seconde), puis écrites en bloc dans le DataFrame.
+    """
     # Créer les colonnes Latitude et Longitude si elles n'existent pas
     if "Latitude" not in df.columns:
-        df["Latitude"] = None
+        df["Latitude"] = np.nan
     if "Longitude" not in df.columns:
-        df["Longitude"] = None
-
-    def get_coordinates(address):
-        try:
-            result = geocoder.geocode(address)
-            if result:
-                return result[0]["geometry"]["lat"], result[0]["geometry"]["lng"]
-        except Exception as e:
-            st.error(f"Erreur pour {address} : {e}")
-        return None, None
-
-    for index, row in df.iterrows():
-        if pd.isna(row["Latitude"]) or pd.isna(row["Longitude"]):
-            lat, lon = get_coordinates(row[address_column])
-            df.at[index, "Latitude"] = lat
-            df.at[index, "Longitude"] = lon
-
-    st.info("✅ Latitude et Longitude ajoutées avec succès !")
+        df["Longitude"] = np.nan
+
+    manquantes = df["Latitude"].isna() | df["Longitude"].isna()
+    if not manquantes.any():
+        return df
+
+    adresses = df.loc[manquantes, address_column]
+    cles = adresses.map(normaliser_adresse)
+
+    # Une adresse originale par clé normalisée (la première rencontrée)
+    originales = adresses[cles.notna()].groupby(cles[cles.notna()], sort=False).first()
+
+    cache = cache_geocodage()
+    coordonnees = cache.lire_plusieurs(originales.index)
+    a_geocoder = originales[~originales.index.isin(list(coordonnees))]
+
+    api_key = lire_parametre("opencage", "api_key") if not a_geocoder.empty else None
+    if not a_geocoder.empty and api_key is None:
+        # Les coordonnées trouvées dans le cache sont tout de même appliquées
+        st.error("Clé API OpenCage manquante. Vérifiez le fichier .streamlit/secrets.toml.")
+
+    if api_key is not None:
+        limiteur = limiteur_geocodage()
+        erreurs = []
+
+        with OpenCageGeocode(api_key) as geocoder:
+
+            def get_coordinates(address):
+                try:
+                    result = appeler_avec_reessais(
+                        lambda: geocoder.geocode(address), limiteur, RateLimitExceededError
+                    )
+                    if result:
+                        return result[0]["geometry"]["lat"], result[0]["geometry"]["lng"]
+                except Exception as e:
+                    # st.error n'est pas utilisable depuis un thread secondaire
+                    erreurs.append(f"Erreur pour {address} : {e}")
+                return None, None
+
+            # Les requêtes partent en parallèle, le limiteur garantit le respect du quota
+            nb_threads = lire_parametre("opencage", "threads", 4)
+            with ThreadPoolExecutor(max_workers=nb_threads) as executor:
+                resultats = list(executor.map(get_coordinates, a_geocoder.values))
+
+        for erreur in erreurs:
+            st.error(erreur)
+
+        # Les échecs ne sont pas mis en cache pour pouvoir être retentés
+        nouvelles = {
+            cle: [lat, lon]
+            for cle, (lat, lon) in zip(a_geocoder.index, resultats)
+            if lat is not None and lon is not None
+        }
+        cache.ecrire_plusieurs(nouvelles)
+        coordonnees.update(nouvelles)
+
+    # Écriture groupée des résultats dans le DataFrame
+    # NaN (et non None) pour les échecs : les colonnes restent de type float
+    df.loc[manquantes, "Latitude"] = cles.map(lambda c: coordonnees.get(c, (np.nan, np.nan))[0])
+    df.loc[manquantes, "Longitude"] = cles.map(lambda c: coordonnees.get(c, (np.nan, np.nan))[1])
+
+    stats = cache.statistiques()
+    st.info(
+        f"✅ Latitude et Longitude ajoutées avec succès ! "
+        f"({len(originales) - len(a_geocoder)} adresse(s) trouvée(s) dans le cache, "
+        f"taux de hit global : {stats['taux_hit']:.0%})"
+    )
     return df
 
 
+def profil_ors(type_deplacement):
+    """
+    Retourne le profil OpenRouteService correspondant au type de déplacement.
+
+    Args:
+        type_deplacement: Type de déplacement ('Marche' ou 'Voiture')
+
+    Returns:
+        'foot-hiking', 'driving-car' ou None si le type n'est pas reconnu
+    """
+    if not isinstance(type_deplacement, str):
+        print(f"Type de déplacement invalide: {type_deplacement} (type: {type(type_deplacement)})")
+        return None
+
+    if type_deplacement == "Marche":
+        return "foot-hiking"  # Utilise le profil randonnée
+    elif type_deplacement == "Voiture":
+        return "driving-car"
+
+    print(f"Type de déplacement non reconnu: {type_deplacement}")
+    return None
+
+
+# En dessous de cette distance (en mètres), deux étapes sont reliées par une ligne directe
+SEUIL_LIGNE_DIRECTE_M = 50
+
+# Vitesses estimées (km/h) sur une ligne directe : à pied (~3.5 km/h) et autres modes
+VITESSE_MARCHE_KMH = 3.5
+VITESSE_DEFAUT_KMH = 50
+
+
+def ligne_directe(start_coords, end_coords, type_deplacement="Marche", distance_m=None):
+    """
+    Retourne une ligne directe entre deux points très proches (<50m).
+
+    Args:
+        start_coords: Tuple (latitude, longitude) du point de départ
+        end_coords: Tuple (latitude, longitude) du point d'arrivée
+        type_deplacement: Type de déplacement ('Marche' ou 'Voiture')
+        distance_m: Distance à vol d'oiseau déjà calculée (optionnel)
+
+    Returns:
+        Un tuple (distance_km, duration_hours, coords_json), ou None si les points sont plus éloignés
+    """
+    # Calculer la distance directe
+    if distance_m is None:
+        distance_m = float(haversine(start_coords[0], start_coords[1], end_coords[0], end_coords[1]))
+
+    # Si les points sont très proches (moins de 50m), connecter directement
+    if distance_m > SEUIL_LIGNE_DIRECTE_M:
+        return None
+
+    print(f"Points très proches ({distance_m:.2f}m), création d'une ligne directe")
+
+    # Créer un itinéraire simple avec juste les deux points
+    route_coords = [
+        [start_coords[0], start_coords[1]],
+        [end_coords[0], end_coords[1]]
+    ]
+
+    distance_km = distance_m / 1000
+    # Estimer la durée (pour la randonnée: ~3.5 km/h)
+    vitesse_km_h = VITESSE_MARCHE_KMH if type_deplacement == "Marche" else VITESSE_DEFAUT_KMH
+    duration_hours = distance_km / vitesse_km_h
+
+    return distance_km, duration_hours, json.dumps(route_coords)
+
+
+def lignes_directes(latitudes, longitudes, types, segments):
+    """
+    Repère en un seul calcul les segments assez courts pour une ligne directe.
+
+    Args:
+        latitudes: Tableau float des latitudes des étapes (NaN si inconnue)
+        longitudes: Tableau float des longitudes des étapes
+        types: Tableau des types de déplacement, par étape
+        segments: Tableau des positions des segments à examiner
+
+    Returns:
+        dict {indice: (distance_km, duration_hours, coords_json)} des segments courts
+    """
+    segments = np.asarray(segments, dtype=np.int64)
+    if not len(segments):
+        return {}
+    distances_m = haversine(latitudes[segments], longitudes[segments],
+                            latitudes[segments + 1], longitudes[segments + 1])
+    courts = distances_m <= SEUIL_LIGNE_DIRECTE_M  # NaN -> False
+    if not courts.any():
+        return {}
+
+    indices = segments[courts]
+    distances_km = distances_m[courts] / 1000
+    vitesses = np.where(types[indices] == "Marche", VITESSE_MARCHE_KMH, VITESSE_DEFAUT_KMH)
+    durees_h = distances_km / vitesses
+    print(f"{len(indices)} segment(s) de moins de {SEUIL_LIGNE_DIRECTE_M}m reliés par une ligne directe")
+
+    return {
+        int(i): (float(d), float(h), json.dumps([[latitudes[i], longitudes[i]],
+                                                 [latitudes[i + 1], longitudes[i + 1]]]))
+        for i, d, h in zip(indices, distances_km, durees_h)
+    }
+
+
+def route_en_cache(start_coords, end_coords, profile):
+    """
+    Cherche un segment déjà calculé (dans ce voyage ou un autre) dans le cache persistant.
+
+    Returns:
+        Un tuple (distance_km, duration_hours, coords_json), ou None si le segment est absent
+    """
+    en_cache = cache_routes().lire(cle_segment(start_coords, end_coords, profile))
+    if en_cache is None:
+        return None
+    distance_km, duration_hours, route_coords = en_cache
+    return distance_km, duration_hours, json.dumps(route_coords)
+
+
 def get_route(start_coords, end_coords, type_deplacement="Marche"):
     """
-    Calcule un itinéraire en utilisant l'API OpenRouteService.
+    Calcule un itinéraire avec le fournisseur de routage configuré (OpenRouteService par défaut).
     Pour les points très proches (<50m), crée une ligne directe.
+    Les itinéraires obtenus sont conservés dans le cache persistant des routes.
 
     Args:
         start_coords: Tuple (latitude, longitude) du point de départ
@@ -60,232 +268,365 @@ def get_route(start_coords, end_coords, type_deplacement="Marche"):
         print("Coordonnées invalides, impossible de calculer l'itinéraire.")
         return None, None, None
 
-    # Calculer la distance haversine entre les deux points
-    def haversine_distance(lat1, lon1, lat2, lon2):
-        # Rayon de la Terre en mètres
-        R = 6371000
+    directe = ligne_directe(start_coords, end_coords, type_deplacement)
+    if directe is not None:
+        return directe
+
+    # Déterminer le profil ORS en fonction du type de déplacement
+    profile = profil_ors(type_deplacement)
+    if profile is None:
+        return None, None, None
 
-        # Conversion en radians
-        lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    fournisseur = fournisseur_routage()
+    if fournisseur.mise_en_cache:
+        en_cache = route_en_cache(start_coords, end_coords, fournisseur.cle_cache(profile))
+        if en_cache is not None:
+            return en_cache
 
-        # Différence de latitude et longitude
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
+    try:
+        [(distance_km, duration_hours, route_coords)] = fournisseur.itineraire(
+            [start_coords, end_coords], profile
+        )
+
+        # Mettre en cache puis convertir en JSON pour stockage
+        if fournisseur.mise_en_cache:
+            cle = cle_segment(start_coords, end_coords, fournisseur.cle_cache(profile))
+            cache_routes().ecrire(cle, [distance_km, duration_hours, route_coords])
+        return distance_km, duration_hours, json.dumps(route_coords)
 
-        # Formule Haversine
-        a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-        distance = R * c
+    except requests.exceptions.RequestException as e:
+        print(f"Erreur lors de la requête de routage ({fournisseur.nom}): {e}")
+        if e.response is not None:
+            print(f"Réponse: {e.response.text}")
+        return None, None, None
+    except (KeyError, IndexError, ValueError) as e:
+        print(f"Erreur lors du traitement de la réponse de routage ({fournisseur.nom}): {e}")
+        return None, None, None
 
-        return distance
 
-    # Calculer la distance directe
-    direct_distance = haversine_distance(start_coords[0], start_coords[1], end_coords[0], end_coords[1])
+def get_route_multi(points, type_deplacement):
+    """
+    Calcule en une seule requête l'itinéraire passant par plusieurs points,
+    puis le découpe en un résultat par segment.
 
-    # Si les points sont très proches (moins de 50m), connecter directement
-    if direct_distance <= 50:  # 50 mètres comme seuil
-        print(f"Points très proches ({direct_distance:.2f}m), création d'une ligne directe")
+    Si la requête groupée échoue (un point non routable suffit), chaque segment
+    est recalculé individuellement avec get_route.
 
-        # Créer un itinéraire simple avec juste les deux points
-        route_coords = [
-            [start_coords[0], start_coords[1]],
-            [end_coords[0], end_coords[1]]
+    Args:
+        points: Liste de tuples (latitude, longitude), au moins deux
+        type_deplacement: Type de déplacement commun à tous les segments
+
+    Returns:
+        Liste de tuples (distance_km, duration_hours, coords_json), un par segment
+    """
+    profile = profil_ors(type_deplacement)
+    if profile is None:
+        return [(None, None, None)] * (len(points) - 1)
+
+    fournisseur = fournisseur_routage()
+    try:
+        troncons = fournisseur.itineraire(points, profile)
+        if len(troncons) != len(points) - 1:
+            raise ValueError("Découpage des segments incohérent avec les points envoyés")
+
+        if fournisseur.mise_en_cache:
+            cache_routes().ecrire_plusieurs({
+                cle_segment(points[j], points[j + 1], fournisseur.cle_cache(profile)): list(troncon)
+                for j, troncon in enumerate(troncons)
+            })
+        return [
+            (distance_km, duration_hours, json.dumps(route_coords))
+            for distance_km, duration_hours, route_coords in troncons
         ]
 
-        # Estimer la durée (pour la randonnée: ~3.5 km/h)
-        vitesse_km_h = 3.5 if type_deplacement == "Marche" else 50
-        distance_km = direct_distance / 1000
-        duration_hours = distance_km / vitesse_km_h
+    except (requests.exceptions.RequestException, KeyError, IndexError, ValueError) as e:
+        print(f"Échec de la requête groupée ({fournisseur.nom}, {len(points)} points), "
+              f"calcul segment par segment: {e}")
+        return [get_route(points[j], points[j + 1], type_deplacement) for j in range(len(points) - 1)]
 
-        return distance_km, duration_hours, json.dumps(route_coords)
 
-    # Déterminer le profil ORS en fonction du type de déplacement
-    if not isinstance(type_deplacement, str):
-        print(f"Type de déplacement invalide: {type_deplacement} (type: {type(type_deplacement)})")
-        return None, None, None
+def grouper_segments(a_calculer, points_max):
+    """
+    Regroupe les segments consécutifs de même type de déplacement en chaînes.
 
-    if type_deplacement == "Marche":
-        profile = "foot-hiking"  # Utilise le profil randonnée
-    elif type_deplacement == "Voiture":
-        profile = "driving-car"
-    else:
-        print(f"Type de déplacement non reconnu: {type_deplacement}")
-        return None, None, None
+    Args:
+        a_calculer: dict {indice: (start_coords, end_coords, type_deplacement)}
+        points_max: Nombre maximal de points par requête ORS
+
+    Returns:
+        Liste de chaînes, chacune étant une liste d'indices de segments consécutifs
+    """
+    chaines = []
+    for i in sorted(a_calculer):
+        chaine = chaines[-1] if chaines else None
+        if (chaine is not None and chaine[-1] == i - 1
+                and a_calculer[chaine[-1]][2] == a_calculer[i][2]
+                and len(chaine) < points_max - 1):
+            chaine.append(i)
+        else:
+            chaines.append([i])
+    return chaines
+
+
+def router_segments(a_calculer, multi_points=None):
+    """
+    Calcule un ensemble de segments, en parallèle, éventuellement groupés par chaînes.
+
+    Args:
+        a_calculer: dict {indice: (start_coords, end_coords, type_deplacement)}
+        multi_points: Si True, les segments consécutifs de même type de déplacement sont
+            calculés en une seule requête ORS à plusieurs points (par défaut :
+            paramètre openrouteservices.multi_points)
 
-    # Votre clé API OpenRouteService (inscription gratuite nécessaire)
-    api_key = token = st.secrets["openrouteservices"]["token"]
-
-    # Construire la requête
-    base_url = "https://api.openrouteservice.org/v2/directions/" + profile
-
-    # Notez que ORS attend les coordonnées en [longitude, latitude]
-    body = {
-        "coordinates": [
-            [start_coords[1], start_coords[0]],  # [lon, lat]
-            [end_coords[1], end_coords[0]]  # [lon, lat]
-        ],
-        "format": "json",
-        "units": "km",
-        "language": "fr"
+    Returns:
+        dict {indice: (distance_km, duration_hours, coords_json)}
+    """
+    if multi_points is None:
+        multi_points = lire_parametre("openrouteservices", "multi_points", False)
+
+    fournisseur = fournisseur_routage()
+    if not multi_points or not fournisseur.multi_points:
+        # Calculer tous les segments en parallèle sur la session HTTP partagée
+        return executer_en_parallele(get_route, a_calculer)
+
+    # Résoudre d'abord localement les segments très courts ou déjà en cache
+    resultats = {}
+    restants = {}
+    for i, (start_coords, end_coords, type_deplacement) in a_calculer.items():
+        connu = ligne_directe(start_coords, end_coords, type_deplacement)
+        if connu is None:
+            profile = profil_ors(type_deplacement)
+            if profile is None:
+                connu = (None, None, None)
+            elif fournisseur.mise_en_cache:
+                connu = route_en_cache(start_coords, end_coords, fournisseur.cle_cache(profile))
+        if connu is not None:
+            resultats[i] = connu
+        else:
+            restants[i] = (start_coords, end_coords, type_deplacement)
+
+    # Une requête par chaîne de segments consécutifs de même type, chaînes en parallèle
+    points_max = lire_parametre("openrouteservices", "points_max", 50)
+    taches = {
+        tuple(chaine): (
+            [restants[chaine[0]][0]] + [restants[i][1] for i in chaine],
+            restants[chaine[0]][2],
+        )
+        for chaine in grouper_segments(restants, points_max)
     }
+    for chaine, resultats_chaine in executer_en_parallele(get_route_multi, taches).items():
+        resultats.update(zip(chaine, resultats_chaine))
+    return resultats
+
+
+def segments_impactes(ordre, lignes_modifiees=()):
+    """
+    Détermine les segments à recalculer après une modification suivie d'un tri.
+
+    Le segment p relie la ligne p à la ligne p + 1 (positions après le tri). Il est à
+    recalculer si l'une de ses deux extrémités a été modifiée, ou si ces deux lignes
+    n'étaient pas voisines avant le tri (lignes déplacées, insérées ou supprimées).
+
+    Args:
+        ordre: Positions d'origine des lignes, dans l'ordre après le tri
+            (les nouvelles lignes reçoivent des positions au-delà de l'ancienne taille)
+        lignes_modifiees: Positions d'origine des lignes dont l'adresse ou le type
+            de déplacement a changé
+
+    Returns:
+        set des positions (après le tri) des segments à recalculer
+    """
+    ordre = np.asarray(ordre)
+    if len(ordre) < 2:
+        return set()
+
+    modifiees = np.isin(ordre, list(lignes_modifiees))
+    nouveaux_voisins = ordre[1:] != ordre[:-1] + 1
+    impactes = modifiees[:-1] | modifiees[1:] | nouveaux_voisins
+    return set(np.flatnonzero(impactes).tolist())
+
 
-    headers = {
-        'Authorization': api_key,
-        'Content-Type': 'application/json; charset=utf-8'
+def recalculer_segments(df, segments, multi_points=None):
+    """
+    Recalcule uniquement les segments indiqués, sans parcourir le reste du voyage.
+
+    Le segment i relie la ligne i à la ligne i + 1 (positions). Seules les lignes
+    aux extrémités de ces segments sont géocodées si leurs coordonnées manquent.
+
+    Args:
+        df: DataFrame avec les données du voyage, trié par Nuit
+        segments: Positions des segments à recalculer
+        multi_points: Voir router_segments
+
+    Returns:
+        Une copie du DataFrame avec les segments mis à jour
+    """
+    # Créer une copie du DataFrame pour éviter de modifier l'original
+    df = df.copy()
+    for col in ("Latitude", "Longitude", "Chemin", "Distance (km)", "Durée (h)"):
+        if col not in df.columns:
+            df[col] = None
+
+    segments = sorted(i for i in set(segments) if 0 <= i < len(df) - 1)
+    if not segments:
+        return df
+
+    # Géocoder seulement les extrémités des segments concernés
+    lignes = sorted(set(segments) | {i + 1 for i in segments})
+    extremites = df.iloc[lignes]
+    sans_coords = extremites["Latitude"].isna() | extremites["Longitude"].isna()
+    if sans_coords.any():
+        df_missing = add_lat_lon(extremites[sans_coords].copy())
+        positions = [lignes[k] for k in np.flatnonzero(sans_coords.to_numpy())]
+        # Conversion en float : une colonne objet (None) ne doit pas être écrite dans une colonne float
+        df.iloc[positions, df.columns.get_loc("Latitude")] = df_missing["Latitude"].to_numpy().astype(float)
+        df.iloc[positions, df.columns.get_loc("Longitude")] = df_missing["Longitude"].to_numpy().astype(float)
+
+    # Colonnes entières en tableaux : validité et distances calculées en un seul passage
+    latitudes = pd.to_numeric(df["Latitude"], errors="coerce").to_numpy(dtype=float)
+    longitudes = pd.to_numeric(df["Longitude"], errors="coerce").to_numpy(dtype=float)
+    if "Type_Deplacement" in df.columns:
+        types = df["Type_Deplacement"].to_numpy(dtype=object)
+    else:
+        types = np.full(len(df), None, dtype=object)
+
+    segments = np.asarray(segments, dtype=np.int64)
+    coords_valides = ~(np.isnan(latitudes[segments]) | np.isnan(longitudes[segments])
+                       | np.isnan(latitudes[segments + 1]) | np.isnan(longitudes[segments + 1]))
+    type_defini = pd.notna(types[segments])
+
+    resultats = {}
+    for i in segments[~coords_valides]:
+        print(f"Coordonnées manquantes pour le segment {i} à {i + 1}, impossible de calculer l'itinéraire.")
+        resultats[int(i)] = (None, None, json.dumps([]))
+    for i in segments[coords_valides & ~type_defini]:
+        print(f"Type de déplacement non défini pour le segment {i} à {i + 1}, impossible de calculer l'itinéraire.")
+        resultats[int(i)] = (None, None, json.dumps([]))
+
+    # Segments très courts : ligne directe, sans appel au moteur de routage
+    calculables = segments[coords_valides & type_defini]
+    directs = lignes_directes(latitudes, longitudes, types, calculables)
+    resultats.update(directs)
+
+    # Le tracé des autres segments sera récupéré (cache persistant ou OpenRouteService)
+    a_calculer = {
+        int(i): ((latitudes[i], longitudes[i]), (latitudes[i + 1], longitudes[i + 1]), types[i])
+        for i in calculables if int(i) not in directs
     }
 
-    try:
-        response = requests.post(base_url, json=body, headers=headers)
-        response.raise_for_status()
-
-        data = response.json()
-
-        if "routes" in data and len(data["routes"]) > 0:
-            route = data["routes"][0]
-
-            # Extraire les informations pertinentes
-            distance_km = route["summary"]["distance"]  # Déjà en km
-            duration_hours = route["summary"]["duration"] / 3600  # Conversion de secondes en heures
-
-            # Extraire les coordonnées du chemin - ORS utilise format différent de GH
-            geometry = route["geometry"]
-            if isinstance(geometry, str):
-                # Si c'est encodé, décoder avec polyline
-                import polyline
-                route_coords = polyline.decode(geometry)
-            else:
-                # Sinon, extraire directement
-                route_coords = []
-                for point in geometry["coordinates"]:
-                    # OpenRouteService retourne [lon, lat], on inverse pour [lat, lon]
-                    route_coords.append([point[1], point[0]])
-
-            # Convertir en JSON pour stockage
-            route_coords_json = json.dumps(route_coords)
-
-            return distance_km, duration_hours, route_coords_json
-        else:
-            print("Aucun itinéraire trouvé dans la réponse OpenRouteService")
-            return None, None, None
+    resultats.update(router_segments(a_calculer, multi_points))
+
+    # Écrire les résultats aux positions recalculées uniquement
+    col_distance = df.columns.get_loc("Distance (km)")
+    col_duree = df.columns.get_loc("Durée (h)")
+    for col in ("Chemin", "Chemin_Niveaux"):
+        if col not in df.columns or df[col].dtype != object:
+            # Une colonne entièrement vide peut avoir été lue en float
+            df[col] = df[col].astype(object) if col in df.columns else None
+    col_chemin = df.columns.get_loc("Chemin")
+    col_niveaux = df.columns.get_loc("Chemin_Niveaux")
+    for i, (distance, duration, route_coords) in resultats.items():
+        df.iat[i, col_distance] = distance
+        df.iat[i, col_duree] = duration
+
+        # Stocker le tracé au format compact (float32) plutôt qu'en JSON,
+        # avec ses niveaux de détail précalculés pour l'affichage
+        chemin = encoder_chemin(route_coords)
+        df.iat[i, col_chemin] = chemin
+        df.iat[i, col_niveaux] = calculer_niveaux(chemin)
 
-    except requests.exceptions.RequestException as e:
-        print(f"Erreur lors de la requête OpenRouteService: {e}")
-        if 'response' in locals():
-            print(f"Réponse: {response.text}")
-        return None, None, None
-    except (KeyError, IndexError, ValueError) as e:
-        print(f"Erreur lors du traitement de la réponse OpenRouteService: {e}")
-        return None, None, None
+    return df
 
 
-def calculate_routes(df):
-    """Calcule les distances, durées et les trajets avec  si non enregistrés."""
+def calculate_routes(df, multi_points=None):
+    """
+    Calcule les distances, durées et les trajets s'ils ne sont pas enregistrés.
+
+    Les segments à calculer sont envoyés simultanément (openrouteservices.threads au
+    maximum) : un recalcul complet dure à peu près le temps du segment le plus lent.
 
+    Args:
+        df: DataFrame avec les données du voyage
+        multi_points: Si True, les segments consécutifs de même Type_Deplacement sont
+            calculés en une seule requête ORS à plusieurs points (par défaut :
+            paramètre openrouteservices.multi_points)
+
+    Returns:
+        distances, durations, route_geoms, df
+    """
 
     # Créer une copie du DataFrame pour éviter de modifier l'original
     df = df.copy()
+    for col in ("Chemin", "Distance (km)", "Durée (h)"):
+        if col not in df.columns:
+            df[col] = None
 
     # Vérifier s'il y a des coordonnées manquantes et les ajouter
-    missing_coords = df[df["Latitude"].isna() | df["Longitude"].isna()].index
-    if len(missing_coords) > 0:
+    missing_coords = df["Latitude"].isna() | df["Longitude"].isna()
+    if missing_coords.any():
         # Appliquer add_lat_lon seulement aux lignes avec coordonnées manquantes
-        df_missing = df.loc[missing_coords].copy()
-        df_missing = add_lat_lon(df_missing)
+        df_missing = add_lat_lon(df[missing_coords].copy())
 
         # Mettre à jour le DataFrame original avec les nouvelles coordonnées
-        for idx in missing_coords:
-            df.loc[idx, "Latitude"] = df_missing.loc[idx, "Latitude"]
-            df.loc[idx, "Longitude"] = df_missing.loc[idx, "Longitude"]
-
-    # Initialiser les listes pour stocker les résultats
-    distances = []
-    durations = []
-    route_geoms = []
-
-    # Variable pour suivre les itinéraires déjà calculés entre des paires de points
-    routes_cache = {}
-
-    # Calculer les itinéraires pour chaque segment
-    for i in range(len(df) - 1):  # On parcourt jusqu'à l'avant-dernier point
-        lat1, lon1 = df.iloc[i]["Latitude"], df.iloc[i]["Longitude"]
-        lat2, lon2 = df.iloc[i + 1]["Latitude"], df.iloc[i + 1]["Longitude"]
-
-        # Récupérer le type de déplacement
-        if "Type_Deplacement" in df.columns and pd.notna(df.iloc[i]["Type_Deplacement"]):
-            type_deplacement = df.iloc[i]["Type_Deplacement"]
-        else:
-            print(f"Type de déplacement non spécifié pour le segment {i} à {i + 1}")
-            type_deplacement = None
+        df.loc[missing_coords, "Latitude"] = df_missing["Latitude"]
+        df.loc[missing_coords, "Longitude"] = df_missing["Longitude"]
 
-        # Vérifier si toutes les coordonnées sont valides
-        valid_coords = pd.notna(lat1) and pd.notna(lon1) and pd.notna(lat2) and pd.notna(lon2)
+    # Les segments sans tracé, distance ou durée enregistrés sont à calculer
+    incomplets = df["Chemin"].isna() | df["Distance (km)"].isna() | df["Durée (h)"].isna()
+    df = recalculer_segments(df, np.flatnonzero(incomplets.to_numpy()[:-1]), multi_points)
 
-        # Créer une clé unique pour cette paire de coordonnées et type de déplacement
-        if valid_coords and type_deplacement is not None:
-            route_key = f"{lat1},{lon1}|{lat2},{lon2}|{type_deplacement}"
+    # Ajouter une dernière valeur pour correspondre à la taille du DataFrame
+    distances = df["Distance (km)"].iloc[:-1].tolist() + [None]
+    durations = df["Durée (h)"].iloc[:-1].tolist() + [None]
+    route_geoms = df["Chemin"].iloc[:-1].tolist() + [encoder_chemin([])]
 
-            # Vérifier si l'itinéraire est déjà dans le cache
-            if route_key in routes_cache:
-                distance, duration, route_coords = routes_cache[route_key]
-            # Si déjà calculé dans le DataFrame et type de déplacement identique, on utilise cette valeur
-            elif pd.notna(df.iloc[i]["Chemin"]) and pd.notna(df.iloc[i]["Distance (km)"]):
-                try:
-                    route_coords = df.iloc[i]["Chemin"]
-                    if isinstance(route_coords, str):
-                        route_coords = json.loads(route_coords)
-                    distance = df.iloc[i]["Distance (km)"]
-                    duration = df.iloc[i]["Durée (h)"] if pd.notna(df.iloc[i]["Durée (h)"]) else None
-
-                    # Si la durée n'est pas disponible, on calcule l'itinéraire
-                    if duration is None:
-                        start_coords = (lat1, lon1)
-                        end_coords = (lat2, lon2)
-                        distance, duration, route_coords = get_route(start_coords, end_coords,
-                                                                                 type_deplacement)
-                        # Mettre en cache
-                        routes_cache[route_key] = (distance, duration, route_coords)
-                except Exception as e:
-                    print(f"Erreur lors de la lecture du chemin à l'index {i}: {e}")
-                    start_coords = (lat1, lon1)
-                    end_coords = (lat2, lon2)
-                    distance, duration, route_coords = get_route(start_coords, end_coords, type_deplacement)
-                    # Mettre en cache
-                    routes_cache[route_key] = (distance, duration, route_coords)
-            else:
-                # Sinon on calcule un nouveau tracé
-                start_coords = (lat1, lon1)
-                end_coords = (lat2, lon2)
-                distance, duration, route_coords = get_route(start_coords, end_coords, type_deplacement)
-                # Mettre en cache
-                routes_cache[route_key] = (distance, duration, route_coords)
-        else:
-            # Coordonnées invalides ou type de déplacement non défini
-            if not valid_coords:
-                print(f"Coordonnées manquantes pour le segment {i} à {i + 1}, impossible de calculer l'itinéraire.")
-            else:
-                print(
-                    f"Type de déplacement non défini pour le segment {i} à {i + 1}, impossible de calculer l'itinéraire.")
-            distance = None
-            duration = None
-            route_coords = json.dumps([])
-
-        # Mettre à jour le DataFrame directement
-        df.at[i, "Distance (km)"] = distance
-        df.at[i, "Durée (h)"] = duration
-
-        # S'assurer que route_coords est au format JSON
-        if isinstance(route_coords, list):
-            route_coords = json.dumps(route_coords)
-        df.at[i, "Chemin"] = route_coords
-
-        # Stocker pour retour de fonction
-        distances.append(distance)
-        durations.append(duration)
-        route_geoms.append(route_coords)
+    return distances, durations, route_geoms, df
 
-    # Ajouter une dernière valeur pour correspondre à la taille du DataFrame
-    distances.append(None)
-    durations.append(None)
-    route_geoms.append(json.dumps([]))
 
-    return distances, durations, route_geoms, df
\ No newline at end of file
+def controler_routes(df, tolerance=0.2, marge_km=0.5, segments=None):
+    """
+    Repère les segments dont l'itinéraire enregistré paraît incohérent.
+
+    Les segments sont contrôlés en un seul calcul vectorisé : un itinéraire ne
+    peut pas être plus court que la distance à vol d'oiseau entre ses extrémités, et
+    la longueur de son tracé doit correspondre à la distance annoncée.
+
+    Args:
+        df: DataFrame avec les données du voyage, trié par Nuit
+        tolerance: Écart relatif admis entre la longueur du tracé et la distance
+        marge_km: Écart absolu admis en plus de l'écart relatif
+        segments: Positions des segments à contrôler (par défaut tous) ; seuls
+            leurs tracés sont décodés
+
+    Returns:
+        Tableau booléen de len(df) - 1 valeurs, vrai pour les segments incohérents
+    """
+    incoherents = np.zeros(max(len(df) - 1, 0), dtype=bool)
+    if len(df) < 2 or "Distance (km)" not in df.columns:
+        return incoherents
+
+    if segments is None:
+        segments = np.arange(len(df) - 1)
+    segments = np.asarray(sorted(i for i in set(segments) if 0 <= i < len(df) - 1), dtype=np.int64)
+    if not len(segments):
+        return incoherents
+
+    latitudes = pd.to_numeric(df["Latitude"], errors="coerce").to_numpy(dtype=float)
+    longitudes = pd.to_numeric(df["Longitude"], errors="coerce").to_numpy(dtype=float)
+    vol_oiseau_km = haversine(latitudes[segments], longitudes[segments],
+                              latitudes[segments + 1], longitudes[segments + 1]) / 1000
+    distances_km = pd.to_numeric(df["Distance (km)"], errors="coerce").to_numpy(dtype=float)[segments]
+
+    if "Chemin" in df.columns:
+        chemins = df["Chemin"].to_numpy()
+        traces = [decoder_chemin(chemins[i]) for i in segments]
+    else:
+        traces = [np.empty((0, 2))] * len(segments)
+    avec_trace = np.array([len(t) >= 2 for t in traces], dtype=bool)
+    longueurs_km = longueurs_polylignes(traces) / 1000
+
+    # Les comparaisons avec NaN (coordonnées ou distance inconnues) valent faux
+    trop_court = distances_km < 0.95 * vol_oiseau_km
+    ecart_trace = avec_trace & (np.abs(longueurs_km - distances_km) > tolerance * distances_km + marge_km)
+    incoherents[segments] = trop_court | ecart_trace
+    return incoherents
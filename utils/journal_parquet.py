@@ -0,0 +1,304 @@
+import bisect
+import re
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from io import BytesIO
+
+from utils.diff_voyage import COLONNE_ID
+from utils.geometrie import COLONNES_GEOMETRIE, table_arrow
+from utils.parametres import lire_parametre
+
+# Colonne des patchs donnant le rang de chaque ligne ajoutée, modifiée ou déplacée
+# dans le DataFrame après le patch (-1 : ligne supprimée)
+COLONNE_RANG = "_rang"
+
+# Colonne des patchs des premières versions du journal, appariés par position
+COLONNE_POSITION = "_position"
+
+# Nom d'un patch : numéro d'ordre et nombre de lignes du voyage après le patch
+MOTIF_PATCH = re.compile(r"(\d+)_(\d+)\.parquet")
+
+
+def dossier_journal(nom_fichier):
+    """Retourne le dossier des patchs d'un fichier Parquet (ex: data/voyage.journal)"""
+    return nom_fichier.removesuffix(".parquet") + ".journal"
+
+
+def lister_patchs(arbre, nom_fichier):
+    """
+    Liste les patchs d'un fichier présents dans une arborescence, dans l'ordre d'application.
+
+    Args:
+        arbre: dict {chemin: SHA} (voir DepotBlobs.arbre)
+        nom_fichier: Chemin du fichier Parquet de base
+
+    Returns:
+        Liste de tuples (numéro, nombre de lignes, chemin du patch)
+    """
+    prefixe = dossier_journal(nom_fichier) + "/"
+    patchs = []
+    for chemin in arbre:
+        if chemin.startswith(prefixe):
+            correspondance = MOTIF_PATCH.fullmatch(chemin[len(prefixe):])
+            if correspondance is not None:
+                patchs.append((int(correspondance[1]), int(correspondance[2]), chemin))
+    return sorted(patchs)
+
+
+def _traces_egaux(a, b):
+    """Compare deux cellules de tracé (tableau compact, ou absence de tracé)"""
+    if isinstance(a, np.ndarray) and isinstance(b, np.ndarray):
+        return np.array_equal(a, b)
+    return not isinstance(a, np.ndarray) and not isinstance(b, np.ndarray)
+
+
+def _identifiants_uniques(df):
+    """Indique que la colonne Id identifie chaque ligne (présente, complète, sans doublon)"""
+    return COLONNE_ID in df.columns and df[COLONNE_ID].notna().all() and df[COLONNE_ID].is_unique
+
+
+def _plus_longue_sous_suite_croissante(valeurs):
+    """
+    Returns:
+        Masque des éléments d'une plus longue sous-suite strictement croissante
+    """
+    fins, indices_fins = [], []
+    precedents = np.full(len(valeurs), -1)
+    for i, valeur in enumerate(valeurs):
+        k = bisect.bisect_left(fins, valeur)
+        if k == len(fins):
+            fins.append(valeur)
+            indices_fins.append(i)
+        else:
+            fins[k] = valeur
+            indices_fins[k] = i
+        precedents[i] = indices_fins[k - 1] if k else -1
+
+    masque = np.zeros(len(valeurs), dtype=bool)
+    i = indices_fins[-1] if indices_fins else -1
+    while i >= 0:
+        masque[i] = True
+        i = precedents[i]
+    return masque
+
+
+def calculer_patch(ancien, nouveau):
+    """
+    Calcule les lignes du nouveau DataFrame qui diffèrent de l'ancien, appariées par la colonne Id.
+
+    Les colonnes scalaires sont comparées ligne à ligne en un seul hachage
+    vectorisé ; les tracés ne sont comparés que pour les lignes encore égales.
+    Une ligne ajoutée ou supprimée n'écrit qu'une ligne dans le patch : les
+    lignes conservées gardent leur ordre relatif, et seules celles qui sortent de
+    cet ordre (la plus longue sous-suite déjà ordonnée est conservée) sont réécrites.
+
+    Args:
+        ancien: DataFrame tel qu'enregistré
+        nouveau: DataFrame à enregistrer
+
+    Returns:
+        DataFrame des lignes ajoutées, modifiées ou déplacées avec leur rang dans
+        COLONNE_RANG, suivies des lignes supprimées (rang -1) ; vide si rien n'a
+        changé. None si les colonnes diffèrent ou si la colonne Id n'identifie pas
+        chaque ligne (réécriture complète)
+    """
+    if list(ancien.columns) != list(nouveau.columns) \
+            or not _identifiants_uniques(ancien) or not _identifiants_uniques(nouveau):
+        return None
+
+    ancien = ancien.reset_index(drop=True)
+    nouveau = nouveau.reset_index(drop=True)
+    positions_anciennes = pd.Index(ancien[COLONNE_ID]).get_indexer(nouveau[COLONNE_ID])
+    communes = np.flatnonzero(positions_anciennes >= 0)
+    alignees = ancien.iloc[positions_anciennes[communes]].reset_index(drop=True)
+    comparees = nouveau.iloc[communes].reset_index(drop=True)
+
+    # Lignes ajoutées (absentes de l'ancien DataFrame), puis lignes communes modifiées
+    modifiees = positions_anciennes < 0
+    scalaires = [col for col in nouveau.columns if col not in COLONNES_GEOMETRIE]
+    if scalaires and len(communes):
+        hachages_anciens = pd.util.hash_pandas_object(alignees[scalaires].astype(object), index=False).to_numpy()
+        hachages_nouveaux = pd.util.hash_pandas_object(comparees[scalaires].astype(object), index=False).to_numpy()
+        modifiees[communes] |= hachages_anciens != hachages_nouveaux
+
+    for col in COLONNES_GEOMETRIE:
+        if col not in nouveau.columns:
+            continue
+        valeurs_anciennes = alignees[col].to_numpy()
+        valeurs_nouvelles = comparees[col].to_numpy()
+        for k in np.flatnonzero(~modifiees[communes]):
+            if not _traces_egaux(valeurs_anciennes[k], valeurs_nouvelles[k]):
+                modifiees[communes[k]] = True
+
+    # Lignes déplacées : celles qui ne suivent plus l'ordre relatif des autres lignes conservées
+    conservees = np.flatnonzero(~modifiees)
+    ordre_ancien = positions_anciennes[conservees]
+    if len(ordre_ancien) and (np.diff(ordre_ancien) < 0).any():
+        modifiees[conservees[~_plus_longue_sous_suite_croissante(ordre_ancien.tolist())]] = True
+
+    rangs = np.flatnonzero(modifiees)
+    ecrites = nouveau.iloc[rangs].reset_index(drop=True)
+    ecrites.insert(0, COLONNE_RANG, rangs.astype(np.int64))
+
+    # Lignes supprimées : leurs anciennes valeurs gardent le type des colonnes, seul l'Id compte
+    supprimees = ancien[~ancien[COLONNE_ID].isin(nouveau[COLONNE_ID])].reset_index(drop=True)
+    supprimees.insert(0, COLONNE_RANG, np.full(len(supprimees), -1, dtype=np.int64))
+    if supprimees.empty:
+        return ecrites
+    if ecrites.empty:
+        return supprimees
+    return pd.concat([ecrites, supprimees], ignore_index=True)
+
+
+def en_parquet(df):
+    """Sérialise un DataFrame (ou un patch) en Parquet, tracés au format compact"""
+    buffer = BytesIO()
+    pq.write_table(table_arrow(df), buffer)
+    return buffer.getvalue()
+
+
+def _colonne_assemblee(valeurs, geometrie):
+    """Série d'une colonne reconstituée cellule par cellule (tableau objet)"""
+    colonne = pd.Series(valeurs)
+    return colonne if geometrie else colonne.infer_objects()
+
+
+def _appliquer_patch_positionnel(df, patch, nb_lignes):
+    """Applique un patch des premières versions du journal, apparié par position"""
+    resultat = df.iloc[:nb_lignes].reset_index(drop=True)
+    if nb_lignes > len(resultat):
+        resultat = resultat.reindex(range(nb_lignes))
+
+    positions = patch[COLONNE_POSITION].to_numpy()
+    for col in patch.columns:
+        if col == COLONNE_POSITION or col not in resultat.columns:
+            continue
+        # Tableau objet : les tracés (ndarray) sont affectés cellule par cellule sans diffusion
+        valeurs = resultat[col].to_numpy(dtype=object, copy=True)
+        nouvelles = patch[col].to_numpy(dtype=object)
+        for position, valeur in zip(positions, nouvelles):
+            valeurs[position] = valeur
+        resultat[col] = _colonne_assemblee(valeurs, col in COLONNES_GEOMETRIE)
+    return resultat
+
+
+def appliquer_patch(df, patch, nb_lignes):
+    """
+    Applique un patch à un DataFrame.
+
+    Les lignes du patch remplacent (ou complètent) les lignes de même Id, à leur
+    rang ; les lignes supprimées sont retirées, et les autres lignes occupent les
+    rangs restants dans leur ordre d'origine.
+
+    Args:
+        df: DataFrame de départ (non modifié)
+        patch: Lignes écrites, avec leur rang dans COLONNE_RANG (voir calculer_patch)
+        nb_lignes: Nombre de lignes après le patch
+
+    Returns:
+        Le nouveau DataFrame
+
+    Raises:
+        ValueError si le patch ne correspond pas au DataFrame
+    """
+    if COLONNE_RANG not in patch.columns:
+        return _appliquer_patch_positionnel(df, patch, nb_lignes)
+
+    rangs = patch[COLONNE_RANG].to_numpy()
+    ecrites = patch[rangs >= 0]
+    rangs = rangs[rangs >= 0]
+    conservees = df[~df[COLONNE_ID].isin(patch[COLONNE_ID])]
+
+    libres = np.ones(nb_lignes, dtype=bool)
+    libres[rangs] = False
+    rangs_conservees = np.flatnonzero(libres)
+    if len(rangs_conservees) != len(conservees):
+        raise ValueError(f"Patch incohérent : {len(conservees)} lignes conservées pour {len(rangs_conservees)} rangs libres")
+
+    resultat = pd.DataFrame(index=pd.RangeIndex(nb_lignes))
+    for col in df.columns:
+        # Tableau objet : les tracés (ndarray) sont affectés cellule par cellule sans diffusion
+        valeurs = np.full(nb_lignes, None, dtype=object)
+        valeurs[rangs_conservees] = conservees[col].to_numpy(dtype=object)
+        if col in ecrites.columns:
+            valeurs[rangs] = ecrites[col].to_numpy(dtype=object)
+        resultat[col] = _colonne_assemblee(valeurs, col in COLONNES_GEOMETRIE)
+    return resultat
+
+
+def lire_avec_journal(depot, nom_fichier, branche="main"):
+    """
+    Lit un fichier Parquet du dépôt et rejoue ses patchs.
+
+    Le DataFrame rejoué est mémorisé par le dépôt sous les SHA de la base et des
+    patchs : tant que le journal n'a pas changé, les patchs ne sont pas rejoués.
+
+    Args:
+        depot: Dépôt des données (voir utils.stockage)
+        nom_fichier: Chemin du fichier Parquet de base
+        branche: Nom de la branche
+
+    Returns:
+        Tuple (DataFrame à jour, liste des patchs appliqués, voir lister_patchs)
+
+    Raises:
+        FileNotFoundError si le fichier n'existe pas sur la branche
+    """
+    # Une seule lecture de l'arborescence : base et patchs viennent de la même version
+    arbre = depot.arbre(branche)
+    sha_base = arbre.get(nom_fichier)
+    if sha_base is None:
+        raise FileNotFoundError(f"{nom_fichier} absent de {depot.nom}@{branche}")
+    patchs = lister_patchs(arbre, nom_fichier)
+    if not patchs:
+        return depot.lire_parquet_blob(sha_base), patchs
+
+    def rejouer():
+        df = depot.lire_parquet_blob(sha_base)
+        for _, nb_lignes, chemin in patchs:
+            df = appliquer_patch(df, depot.lire_parquet_blob(arbre[chemin]), nb_lignes)
+        return df
+
+    cle = ("journal", sha_base) + tuple((nb_lignes, arbre[chemin]) for _, nb_lignes, chemin in patchs)
+    return depot.memoriser(cle, rejouer), patchs
+
+
+def preparer_ecriture(depot, nom_fichier, df, branche="main"):
+    """
+    Prépare l'écriture d'un DataFrame sous forme de patch plutôt que de réécriture complète.
+
+    Seules les lignes modifiées sont envoyées, dans un nouveau fichier du
+    journal. Le journal est compacté (fichier de base réécrit, patchs supprimés)
+    quand il compte stockage.seuil_compaction patchs (défaut 20), quand un
+    patch toucherait plus de la moitié des lignes, quand les colonnes changent
+    ou quand la colonne Id n'identifie pas chaque ligne.
+
+    Args:
+        depot: Dépôt des données (voir utils.stockage)
+        nom_fichier: Chemin du fichier Parquet de base
+        df: DataFrame à enregistrer
+        branche: Nom de la branche
+
+    Returns:
+        dict {chemin: octets ou None pour supprimer} à passer à DepotBlobs.commiter
+    """
+    try:
+        actuel, patchs = lire_avec_journal(depot, nom_fichier, branche)
+    except FileNotFoundError:
+        actuel, patchs = None, []
+
+    patch = None if actuel is None else calculer_patch(actuel, df)
+    seuil = lire_parametre("stockage", "seuil_compaction", 20)
+
+    if patch is not None and len(patchs) < seuil and len(patch) <= max(len(df) // 2, 1):
+        if patch.empty:
+            return {}
+        numero = patchs[-1][0] + 1 if patchs else 1
+        chemin = f"{dossier_journal(nom_fichier)}/{numero:06d}_{len(df)}.parquet"
+        return {chemin: en_parquet(patch)}
+
+    # Compaction : nouvelle base et suppression des patchs, dans le même commit
+    fichiers = {chemin: None for _, _, chemin in patchs}
+    fichiers[nom_fichier] = en_parquet(df.reset_index(drop=True))
+    return fichiers
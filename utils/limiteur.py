@@ -0,0 +1,88 @@
+import random
+import threading
+import time
+
+
+class LimiteurDebit:
+    """
+    Seau à jetons thread-safe limitant le nombre d'appels par seconde à une API.
+
+    Chaque appel consomme un jeton ; les jetons se régénèrent au rythme de `debit`
+    par seconde, jusqu'à `capacite` jetons (taille maximale d'une rafale).
+    """
+
+    def __init__(self, debit, capacite=None):
+        """
+        Args:
+            debit: Nombre d'appels autorisés par seconde
+            capacite: Nombre maximal de jetons accumulés (par défaut max(1, debit))
+        """
+        self.debit = float(debit)
+        self.capacite = float(capacite) if capacite is not None else max(1.0, self.debit)
+        self._jetons = self.capacite
+        self._derniere_maj = time.monotonic()
+        self._pause_jusqua = 0.0
+        self._verrou = threading.Lock()
+
+    def acquerir(self):
+        """Bloque jusqu'à ce qu'un jeton soit disponible, puis le consomme"""
+        while True:
+            with self._verrou:
+                maintenant = time.monotonic()
+                if maintenant < self._pause_jusqua:
+                    attente = self._pause_jusqua - maintenant
+                else:
+                    # Régénérer les jetons accumulés depuis la dernière mise à jour
+                    ecoule = maintenant - max(self._derniere_maj, self._pause_jusqua)
+                    self._jetons = min(self.capacite, self._jetons + ecoule * self.debit)
+                    self._derniere_maj = maintenant
+                    if self._jetons >= 1:
+                        self._jetons -= 1
+                        return
+                    attente = (1 - self._jetons) / self.debit
+            time.sleep(attente)
+
+    def suspendre(self, duree):
+        """
+        Vide le seau et bloque tous les appelants pendant `duree` secondes.
+
+        À utiliser quand l'API répond 429 : le quota côté serveur est atteint,
+        inutile que les autres threads continuent à envoyer des requêtes.
+        """
+        with self._verrou:
+            self._jetons = 0.0
+            self._pause_jusqua = max(self._pause_jusqua, time.monotonic() + duree)
+
+
+def appeler_avec_reessais(fonction, limiteur, exceptions_limite, essais_max=5,
+                          attente_initiale=1.0, delai_attente=None):
+    """
+    Appelle `fonction` en respectant le limiteur et réessaie après un dépassement de quota.
+
+    Args:
+        fonction: Fonction sans argument effectuant l'appel à l'API
+        limiteur: LimiteurDebit partagé par tous les appelants de la même API
+        exceptions_limite: Exception (ou tuple) signalant un dépassement de quota (HTTP 429)
+        essais_max: Nombre maximal de tentatives
+        attente_initiale: Attente avant la deuxième tentative, doublée à chaque échec
+        delai_attente: Fonction optionnelle exception -> secondes (ex: en-tête Retry-After),
+            prioritaire sur le backoff exponentiel quand elle retourne une valeur
+
+    Returns:
+        Le résultat de `fonction`
+
+    Raises:
+        La dernière exception de quota si toutes les tentatives échouent
+    """
+    for essai in range(essais_max):
+        limiteur.acquerir()
+        try:
+            return fonction()
+        except exceptions_limite as e:
+            if essai == essais_max - 1:
+                raise
+            attente = delai_attente(e) if delai_attente is not None else None
+            if attente is None:
+                # Backoff exponentiel avec un peu d'aléa pour désynchroniser les threads
+                attente = attente_initiale * (2 ** essai) * (1 + random.random() / 4)
+            limiteur.suspendre(attente)
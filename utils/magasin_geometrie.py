@@ -0,0 +1,239 @@
+import hashlib
+import re
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import streamlit as st
+from io import BytesIO
+
+from utils.stockage import depot_donnees
+from utils.geometrie import COLONNES_GEOMETRIE, calculer_niveaux, table_arrow
+from utils.parametres import lire_parametre
+
+# Colonne des métadonnées référençant le tracé du segment sortant de chaque ligne
+COLONNE_SEGMENT = "Segment"
+
+# Nom d'un paquet de tracés : numéro d'ordre
+MOTIF_PAQUET = re.compile(r"(\d+)\.parquet")
+
+# Nombre de tracés par groupe de lignes Parquet : les filtres par identifiant
+# écartent les groupes dont les statistiques min/max ne peuvent pas correspondre
+TAILLE_GROUPE = 64
+
+
+def dossier_geometrie(nom_fichier):
+    """Retourne le dossier des tracés d'un fichier Parquet (ex: data/voyage.geometrie)"""
+    return nom_fichier.removesuffix(".parquet") + ".geometrie"
+
+
+def id_segment(chemin):
+    """
+    Identifiant d'un tracé, dérivé de son contenu : un tracé inchangé garde son
+    identifiant, et deux segments au tracé identique partagent le même.
+
+    Args:
+        chemin: Tracé au format compact (ndarray float32)
+
+    Returns:
+        Identifiant hexadécimal, ou None si le segment n'a pas de tracé
+    """
+    if not isinstance(chemin, np.ndarray):
+        return None
+    return hashlib.blake2b(chemin.astype(np.float32, copy=False).tobytes(), digest_size=12).hexdigest()
+
+
+def separer_geometrie(df):
+    """
+    Sépare les tracés des métadonnées du voyage.
+
+    Args:
+        df: DataFrame avec les colonnes Chemin (et Chemin_Niveaux)
+
+    Returns:
+        Tuple (métadonnées avec la colonne Segment à la place des tracés,
+        DataFrame des tracés distincts [Segment, Chemin, Chemin_Niveaux] trié par Segment)
+    """
+    chemins = df["Chemin"].to_numpy() if "Chemin" in df.columns else np.full(len(df), None)
+    niveaux = df["Chemin_Niveaux"].to_numpy() if "Chemin_Niveaux" in df.columns else np.full(len(df), None)
+    ids = [id_segment(chemin) for chemin in chemins]
+
+    metadonnees = df.drop(columns=COLONNES_GEOMETRIE, errors="ignore").copy()
+    metadonnees[COLONNE_SEGMENT] = pd.Series(ids, index=df.index, dtype=object)
+
+    traces = {}
+    for segment, chemin, niveau in zip(ids, chemins, niveaux):
+        if segment is not None and segment not in traces:
+            traces[segment] = (chemin, niveau if isinstance(niveau, np.ndarray) else calculer_niveaux(chemin))
+    segments = sorted(traces)
+    geometrie = pd.DataFrame({
+        COLONNE_SEGMENT: pd.Series(segments, dtype=object),
+        "Chemin": pd.Series([traces[s][0] for s in segments], dtype=object),
+        "Chemin_Niveaux": pd.Series([traces[s][1] for s in segments], dtype=object),
+    })
+    return metadonnees, geometrie
+
+
+class MagasinGeometrie:
+    """
+    Tracés d'un voyage, stockés à part des métadonnées et adressés par identifiant de segment.
+
+    Les tracés sont répartis en paquets Parquet (dossier <fichier>.geometrie/).
+    Une sauvegarde n'ajoute qu'un paquet des tracés nouveaux ; les paquets sont
+    fusionnés quand ils deviennent trop nombreux ou contiennent surtout des
+    tracés qui ne servent plus. La lecture ne charge que les identifiants
+    demandés (filtre Parquet sur des fichiers projetés en mémoire).
+    """
+
+    def __init__(self, depot, nom_fichier, branche="main"):
+        """
+        Args:
+            depot: Dépôt des données (voir utils.stockage)
+            nom_fichier: Chemin du fichier Parquet des métadonnées
+            branche: Nom de la branche
+        """
+        self.depot = depot
+        self.nom_fichier = nom_fichier
+        self.branche = branche
+        self._verrou = threading.Lock()
+        self._index = {}  # SHA du paquet -> identifiants qu'il contient
+        self._en_attente = {}  # identifiant -> (Chemin, Chemin_Niveaux) des sauvegardes en file d'attente
+
+    def paquets(self):
+        """
+        Returns:
+            Liste de tuples (numéro, chemin, SHA) des paquets, du plus ancien au plus récent
+        """
+        prefixe = dossier_geometrie(self.nom_fichier) + "/"
+        paquets = []
+        for chemin, sha in self.depot.arbre(self.branche).items():
+            if chemin.startswith(prefixe):
+                correspondance = MOTIF_PAQUET.fullmatch(chemin[len(prefixe):])
+                if correspondance is not None:
+                    paquets.append((int(correspondance[1]), chemin, sha))
+        return sorted(paquets)
+
+    def _identifiants(self, sha):
+        """Identifiants contenus dans un paquet (seule la colonne Segment est lue)"""
+        with self._verrou:
+            ids = self._index.get(sha)
+        if ids is None:
+            table = pq.read_table(str(self.depot.chemin_blob(sha)), columns=[COLONNE_SEGMENT], memory_map=True)
+            ids = frozenset(table.column(COLONNE_SEGMENT).to_pylist())
+            with self._verrou:
+                self._index[sha] = ids
+        return ids
+
+    def retenir(self, geometrie):
+        """
+        Garde en mémoire les tracés d'une sauvegarde pas encore écrite, pour que
+        lire les trouve avant qu'ils ne soient dans un paquet.
+
+        Args:
+            geometrie: DataFrame des tracés (voir separer_geometrie)
+        """
+        with self._verrou:
+            for segment, chemin, niveaux in zip(*(geometrie[col] for col in (COLONNE_SEGMENT, *COLONNES_GEOMETRIE))):
+                self._en_attente[segment] = (chemin, niveaux)
+
+    def oublier(self, segments):
+        """Libère les tracés retenus une fois écrits dans un paquet (voir retenir)"""
+        with self._verrou:
+            for segment in segments:
+                self._en_attente.pop(segment, None)
+
+    def lire(self, segments):
+        """
+        Lit les tracés demandés.
+
+        Args:
+            segments: Identifiants de segment (les valeurs manquantes sont ignorées)
+
+        Returns:
+            dict {identifiant: (Chemin, Chemin_Niveaux)}
+        """
+        restants = {s for s in segments if isinstance(s, str)}
+        with self._verrou:
+            traces = {s: self._en_attente[s] for s in restants if s in self._en_attente}
+        restants -= set(traces)
+        for _, _, sha in reversed(self.paquets() if restants else []):
+            utiles = restants & self._identifiants(sha)
+            if not utiles:
+                continue
+            table = pq.read_table(str(self.depot.chemin_blob(sha)), memory_map=True,
+                                  filters=[(COLONNE_SEGMENT, "in", sorted(utiles))])
+            for segment, chemin, niveaux in zip(*(table.column(col).to_numpy(zero_copy_only=False)
+                                                   for col in (COLONNE_SEGMENT, *COLONNES_GEOMETRIE))):
+                traces[segment] = (chemin, niveaux)
+            restants -= utiles
+            if not restants:
+                break
+        if restants:
+            print(f"{len(restants)} tracé(s) introuvable(s) dans {dossier_geometrie(self.nom_fichier)}")
+        return traces
+
+    def preparer_ecriture(self, geometrie):
+        """
+        Prépare l'enregistrement des tracés d'un voyage.
+
+        Args:
+            geometrie: DataFrame des tracés utilisés (voir separer_geometrie)
+
+        Returns:
+            dict {chemin: octets ou None pour supprimer} à passer à DepotBlobs.commiter
+        """
+        paquets = self.paquets()
+        utilises = set(geometrie[COLONNE_SEGMENT])
+        connus = set().union(*(self._identifiants(sha) for _, _, sha in paquets)) if paquets else set()
+
+        nouveaux = geometrie[~geometrie[COLONNE_SEGMENT].isin(connus)]
+        inutiles = len(connus - utilises)
+        seuil = lire_parametre("stockage", "seuil_compaction", 20)
+        dossier = dossier_geometrie(self.nom_fichier)
+
+        numero = paquets[-1][0] + 1 if paquets else 1
+        if len(paquets) < seuil and inutiles <= len(utilises):
+            if nouveaux.empty:
+                return {}
+            return {f"{dossier}/{numero:06d}.parquet": self._en_parquet(nouveaux)}
+
+        # Fusion : un seul paquet des tracés encore utilisés
+        fichiers = {chemin: None for _, chemin, _ in paquets}
+        fichiers[f"{dossier}/{numero:06d}.parquet"] = self._en_parquet(geometrie)
+        return fichiers
+
+    @staticmethod
+    def _en_parquet(geometrie):
+        buffer = BytesIO()
+        # Sans dictionnaire : les identifiants sont uniques et les coordonnées presque toutes
+        # distinctes, un dictionnaire par petit groupe de lignes ne ferait qu'alourdir le fichier
+        pq.write_table(table_arrow(geometrie.reset_index(drop=True)), buffer,
+                       row_group_size=TAILLE_GROUPE, use_dictionary=False)
+        return buffer.getvalue()
+
+
+def joindre_geometrie(df, magasin):
+    """
+    Ajoute au DataFrame des métadonnées les colonnes Chemin et Chemin_Niveaux.
+
+    Args:
+        df: Métadonnées du voyage, avec la colonne Segment
+        magasin: MagasinGeometrie du voyage
+
+    Returns:
+        Une copie du DataFrame avec les tracés (le DataFrame lui-même s'il en a déjà)
+    """
+    if "Chemin" in df.columns or COLONNE_SEGMENT not in df.columns:
+        return df
+    traces = magasin.lire(df[COLONNE_SEGMENT].tolist())
+    df = df.copy()
+    for k, col in enumerate(COLONNES_GEOMETRIE):
+        df[col] = pd.Series([traces.get(s, (None, None))[k] for s in df[COLONNE_SEGMENT]],
+                            index=df.index, dtype=object)
+    return df
+
+
+@st.cache_resource
+def magasin_geometrie(nom_fichier, branche="main"):
+    """Retourne le magasin des tracés d'un fichier du dépôt, partagé entre les sessions"""
+    return MagasinGeometrie(depot_donnees(), nom_fichier, branche)
@@ -0,0 +1,158 @@
+import requests
+import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+from utils.limiteur import LimiteurDebit, appeler_avec_reessais
+from utils.parametres import lire_parametre
+
+URL_ORS = "https://api.openrouteservice.org"
+
+
+class QuotaRoutageDepasse(requests.exceptions.HTTPError):
+    """Réponse HTTP 429 d'un moteur de routage"""
+
+
+class QuotaORSDepasse(QuotaRoutageDepasse):
+    """Réponse HTTP 429 d'OpenRouteService"""
+
+
+def nombre_threads_routage():
+    """Nombre maximal de requêtes de routage simultanées (openrouteservices.threads)"""
+    return lire_parametre("openrouteservices", "threads", 8)
+
+
+@st.cache_resource
+def session_ors():
+    """
+    Retourne la session HTTP partagée vers les moteurs de routage (ORS, OSRM).
+
+    Les connexions TLS sont conservées (keep-alive) et réutilisées par tous les
+    threads : un recalcul complet ne paie qu'une poignée de handshakes.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=nombre_threads_routage())
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+@st.cache_resource
+def limiteur_ors():
+    """
+    Retourne le limiteur de débit OpenRouteService, partagé entre les sessions.
+
+    Par défaut : 40 requêtes par minute, utilisables en rafale (quota du plan gratuit).
+    """
+    par_minute = lire_parametre("openrouteservices", "requetes_par_minute", 40)
+    return LimiteurDebit(par_minute / 60, capacite=par_minute)
+
+
+@st.cache_resource
+def limiteur_osrm():
+    """
+    Retourne le limiteur de débit du serveur OSRM, partagé entre les sessions.
+
+    Par défaut : 50 requêtes par seconde (routage.osrm_requetes_par_seconde).
+    """
+    return LimiteurDebit(lire_parametre("routage", "osrm_requetes_par_seconde", 50))
+
+
+def _delai_retry_after(erreur):
+    """Retourne la durée indiquée par l'en-tête Retry-After d'une réponse 429, si présente"""
+    try:
+        return float(erreur.response.headers["Retry-After"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def requete_ors(profile, coordinates, url=None, token=None):
+    """
+    Envoie une requête de calcul d'itinéraire à OpenRouteService.
+
+    Args:
+        profile: Profil ORS ('driving-car', 'foot-hiking', ...)
+        coordinates: Liste de points [longitude, latitude] dans l'ordre du trajet
+        url: Adresse du serveur ORS (par défaut openrouteservices.url, sinon l'API publique)
+        token: Clé d'API (par défaut openrouteservices.token)
+
+    Returns:
+        La réponse JSON décodée
+
+    Raises:
+        requests.exceptions.RequestException en cas d'erreur HTTP ou réseau
+    """
+    api_key = token if token is not None else st.secrets["openrouteservices"]["token"]
+    base_url = f"{url or lire_parametre('openrouteservices', 'url', URL_ORS)}/v2/directions/{profile}"
+
+    body = {
+        "coordinates": coordinates,
+        "format": "json",
+        "units": "km",
+        "language": "fr"
+    }
+
+    headers = {
+        'Authorization': api_key,
+        'Content-Type': 'application/json; charset=utf-8'
+    }
+
+    def envoyer():
+        response = session_ors().post(base_url, json=body, headers=headers, timeout=60)
+        if response.status_code == 429:
+            raise QuotaORSDepasse("Quota OpenRouteService dépassé (429)", response=response)
+        response.raise_for_status()
+        return response.json()
+
+    return appeler_avec_reessais(envoyer, limiteur_ors(), QuotaORSDepasse,
+                                 delai_attente=_delai_retry_after)
+
+
+def requete_osrm(url, profil, coordonnees):
+    """
+    Envoie une requête de calcul d'itinéraire à un serveur OSRM (API /route/v1).
+
+    Args:
+        url: Adresse du serveur OSRM
+        profil: Profil OSRM ('driving', 'foot', ...)
+        coordonnees: Liste de points [longitude, latitude] dans l'ordre du trajet
+
+    Returns:
+        La réponse JSON décodée
+
+    Raises:
+        requests.exceptions.RequestException en cas d'erreur HTTP ou réseau
+    """
+    chemin = ";".join(f"{lon},{lat}" for lon, lat in coordonnees)
+    params = {"overview": "false", "steps": "true", "geometries": "geojson"}
+
+    def envoyer():
+        response = session_ors().get(f"{url}/route/v1/{profil}/{chemin}", params=params, timeout=60)
+        if response.status_code == 429:
+            raise QuotaRoutageDepasse("Quota OSRM dépassé (429)", response=response)
+        response.raise_for_status()
+        return response.json()
+
+    return appeler_avec_reessais(envoyer, limiteur_osrm(), QuotaRoutageDepasse,
+                                 delai_attente=_delai_retry_after)
+
+
+def executer_en_parallele(fonction, taches, nb_threads=None):
+    """
+    Exécute `fonction` sur chaque tâche dans un pool de threads borné.
+
+    Args:
+        fonction: Fonction appelée avec les arguments de chaque tâche
+        taches: dict {clé: tuple d'arguments}
+        nb_threads: Nombre maximal d'appels simultanés (par défaut openrouteservices.threads)
+
+    Returns:
+        dict {clé: résultat}
+    """
+    if not taches:
+        return {}
+
+    nb_threads = min(nb_threads or nombre_threads_routage(), len(taches))
+    with ThreadPoolExecutor(max_workers=nb_threads) as executor:
+        futures = {cle: executor.submit(fonction, *args) for cle, args in taches.items()}
+        return {cle: future.result() for cle, future in futures.items()}
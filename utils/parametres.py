@@ -0,0 +1,23 @@
+import streamlit as st
+from pathlib import Path
+
+# Dossier racine des caches locaux (exclu du dépôt)
+DOSSIER_CACHE = Path(__file__).resolve().parent.parent / ".cache"
+
+
+def lire_parametre(section, cle, defaut=None):
+    """
+    Lit un paramètre optionnel dans .streamlit/secrets.toml.
+
+    Args:
+        section: Nom de la section (ex: "cache")
+        cle: Nom du paramètre dans la section
+        defaut: Valeur retournée si le fichier, la section ou la clé est absent
+
+    Returns:
+        La valeur configurée ou la valeur par défaut
+    """
+    try:
+        return st.secrets[section][cle]
+    except Exception:
+        return defaut
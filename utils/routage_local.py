@@ -0,0 +1,478 @@
+import heapq
+import json
+import math
+import sys
+import threading
+import numpy as np
+import streamlit as st
+from pathlib import Path
+
+from utils.geodesie import RAYON_TERRE, haversine
+from utils.parametres import lire_parametre
+
+# Profils ORS pris en charge par le moteur local
+PROFILS = ("driving-car", "foot-hiking")
+
+# Vitesses (km/h) par type de voie OSM (clé highway), 0 = voie interdite au profil
+VITESSES_OSM = {
+    "driving-car": {
+        "motorway": 110, "motorway_link": 60, "trunk": 90, "trunk_link": 50,
+        "primary": 80, "primary_link": 50, "secondary": 70, "secondary_link": 40,
+        "tertiary": 60, "tertiary_link": 40, "unclassified": 50, "residential": 30,
+        "living_street": 10, "service": 20, "road": 40,
+    },
+    "foot-hiking": {
+        "primary": 4, "primary_link": 4, "secondary": 4, "secondary_link": 4,
+        "tertiary": 4, "tertiary_link": 4, "unclassified": 4, "residential": 4,
+        "living_street": 4, "service": 4, "road": 4, "pedestrian": 4, "footway": 4,
+        "path": 3.5, "track": 3.5, "bridleway": 3.5, "cycleway": 4, "steps": 2,
+    },
+}
+
+
+# Côté (en degrés) des cases de l'index spatial des noeuds, et nombre d'anneaux de cases
+# explorés autour d'un point avant de se rabattre sur un parcours de tous les noeuds
+TAILLE_CASE_DEG = 0.01
+ANNEAUX_MAX = 50
+
+# Longueur d'un degré de latitude en mètres
+METRES_PAR_DEGRE = math.pi * RAYON_TERRE / 180
+
+
+def _cle_vitesses(profile):
+    """Nom du tableau des vitesses d'un profil dans le fichier .npz"""
+    return "vitesses_" + profile.replace("-", "_")
+
+
+class _ReseauProfil:
+    """
+    Graphe restreint aux arêtes praticables par un profil, en listes Python
+    (plus rapides que les tableaux NumPy pour un parcours élément par élément).
+    """
+
+    def __init__(self, graphe, profile):
+        vitesses = graphe.vitesses[profile]
+        praticables = vitesses > 0
+        if not praticables.any():
+            raise ValueError(f"Aucune voie praticable pour le profil {profile}")
+
+        origines = np.repeat(np.arange(graphe.nb_noeuds), np.diff(graphe.indptr))[praticables]
+        destinations = graphe.indices[praticables]
+        longueurs_m = graphe.longueurs_m[praticables].astype(np.float64)
+        poids_h = longueurs_m / 1000 / vitesses[praticables]
+
+        # Graphe direct (CSR), les arêtes étant déjà triées par origine
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(origines, minlength=graphe.nb_noeuds))))
+
+        # Graphe inverse (CSR par destination), calculé une fois au chargement
+        ordre = np.argsort(destinations, kind="stable")
+        indptr_inverse = np.concatenate(([0], np.cumsum(np.bincount(destinations, minlength=graphe.nb_noeuds))))
+
+        self.indptr = indptr.tolist()
+        self.indices = destinations.tolist()
+        self.origines = origines.tolist()
+        self.poids = poids_h.tolist()
+        self.longueurs_m = longueurs_m.tolist()
+        self.indptr_inverse = indptr_inverse.tolist()
+        self.indices_inverse = origines[ordre].tolist()
+        self.aretes_inverse = ordre.tolist()
+        self.vitesse_max = float(vitesses.max())
+
+        # Noeuds d'où l'on peut partir / où l'on peut arriver
+        self.departs_possibles = np.diff(indptr) > 0
+        self.arrivees_possibles = np.diff(indptr_inverse) > 0
+
+
+class GrapheRoutier:
+    """
+    Réseau routier et pédestre compact pour le calcul d'itinéraires hors ligne.
+
+    Le graphe est stocké en CSR (Compressed Sparse Row) : les arêtes sortant du
+    noeud u sont indices[indptr[u]:indptr[u + 1]], avec pour chacune sa longueur
+    en mètres et une vitesse par profil (0 = interdite). Les itinéraires sont
+    calculés par A* bidirectionnel, avec la distance à vol d'oiseau parcourue à la
+    vitesse maximale du profil comme heuristique.
+    """
+
+    def __init__(self, latitudes, longitudes, indptr, indices, longueurs_m, vitesses):
+        """
+        Args:
+            latitudes: Latitude de chaque noeud
+            longitudes: Longitude de chaque noeud
+            indptr: Tableau de nb_noeuds + 1 bornes des arêtes sortantes de chaque noeud
+            indices: Noeud d'arrivée de chaque arête
+            longueurs_m: Longueur de chaque arête en mètres
+            vitesses: dict {profil ORS: vitesse de chaque arête en km/h}
+        """
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.longueurs_m = np.asarray(longueurs_m, dtype=np.float32)
+        self.vitesses = {profil: np.asarray(v, dtype=np.float32) for profil, v in vitesses.items()}
+        self._reseaux = {}
+        self._grille = None
+        self._radians = None
+        self._verrou = threading.Lock()
+
+    @property
+    def nb_noeuds(self):
+        return len(self.latitudes)
+
+    @property
+    def profils(self):
+        return list(self.vitesses)
+
+    @classmethod
+    def charger(cls, chemin):
+        """Charge un graphe enregistré par `enregistrer`"""
+        with np.load(chemin) as donnees:
+            vitesses = {
+                profil: donnees[_cle_vitesses(profil)]
+                for profil in PROFILS if _cle_vitesses(profil) in donnees
+            }
+            return cls(donnees["latitudes"], donnees["longitudes"], donnees["indptr"],
+                       donnees["indices"], donnees["longueurs_m"], vitesses)
+
+    def enregistrer(self, chemin):
+        """Enregistre le graphe dans un fichier .npz compressé"""
+        np.savez_compressed(
+            chemin,
+            latitudes=self.latitudes,
+            longitudes=self.longitudes,
+            indptr=self.indptr,
+            indices=self.indices,
+            longueurs_m=self.longueurs_m,
+            **{_cle_vitesses(profil): v for profil, v in self.vitesses.items()},
+        )
+
+    def _reseau(self, profile):
+        """Retourne (en le construisant au premier appel) le graphe praticable d'un profil"""
+        with self._verrou:
+            if profile not in self._reseaux:
+                self._reseaux[profile] = _ReseauProfil(self, profile)
+            return self._reseaux[profile]
+
+    def _index_spatial(self):
+        """
+        Retourne (en le construisant au premier appel) l'index des noeuds par case de
+        TAILLE_CASE_DEG degrés : noeuds triés par case et {case: (début, fin)} dans ce tri.
+        """
+        with self._verrou:
+            if self._grille is None:
+                cases = self._cases(self.latitudes, self.longitudes)
+                ordre = np.argsort(cases, kind="stable")
+                uniques, debuts = np.unique(cases[ordre], return_index=True)
+                fins = np.append(debuts[1:], len(ordre))
+                self._grille = (ordre, dict(zip(uniques.tolist(), zip(debuts.tolist(), fins.tolist()))))
+            return self._grille
+
+    @staticmethod
+    def _cases(latitudes, longitudes):
+        """Numéro de la case de la grille contenant chaque point"""
+        lignes = np.floor(np.asarray(latitudes) / TAILLE_CASE_DEG).astype(np.int64)
+        colonnes = np.floor(np.asarray(longitudes) / TAILLE_CASE_DEG).astype(np.int64)
+        return lignes * 100_000 + colonnes
+
+    def noeud_proche(self, coords, candidats=None):
+        """
+        Trouve le noeud le plus proche d'un point.
+
+        Les cases de l'index spatial sont explorées par anneaux concentriques autour
+        du point, jusqu'à ce qu'aucun noeud des anneaux suivants ne puisse être plus
+        proche que le meilleur trouvé.
+
+        Args:
+            coords: Tuple (latitude, longitude)
+            candidats: Masque booléen des noeuds admissibles (optionnel)
+
+        Returns:
+            Un tuple (indice du noeud, distance en mètres)
+        """
+        ordre, cases = self._index_spatial()
+        latitude, longitude = float(coords[0]), float(coords[1])
+        case = int(self._cases(latitude, longitude))
+        ligne, colonne = divmod(case, 100_000)
+
+        meilleur, distance_min = None, np.inf
+        for rayon in range(ANNEAUX_MAX + 1):
+            if rayon == 0:
+                voisines = [(0, 0)]
+            else:
+                voisines = ([(dl, dc) for dl in (-rayon, rayon) for dc in range(-rayon, rayon + 1)]
+                            + [(dl, dc) for dc in (-rayon, rayon) for dl in range(-rayon + 1, rayon)])
+            tranches = [cases[c] for c in ((ligne + dl) * 100_000 + colonne + dc for dl, dc in voisines) if c in cases]
+            if tranches:
+                noeuds = np.concatenate([ordre[debut:fin] for debut, fin in tranches])
+                if candidats is not None:
+                    noeuds = noeuds[candidats[noeuds]]
+                if len(noeuds):
+                    distances = haversine(latitude, longitude, self.latitudes[noeuds], self.longitudes[noeuds])
+                    k = int(np.argmin(distances))
+                    if distances[k] < distance_min:
+                        meilleur, distance_min = int(noeuds[k]), float(distances[k])
+
+            # Tout noeud hors des anneaux explorés est à au moins `rayon` cases du point,
+            # une case étant la plus étroite à la latitude extrême de ces anneaux
+            latitude_extreme = min(abs(latitude) + (rayon + 1) * TAILLE_CASE_DEG, 90)
+            largeur_case = TAILLE_CASE_DEG * METRES_PAR_DEGRE * math.cos(math.radians(latitude_extreme))
+            if meilleur is not None and distance_min <= rayon * largeur_case:
+                return meilleur, distance_min
+
+        # Point isolé (ou proche d'un pôle) : parcours de tous les noeuds
+        distances = haversine(latitude, longitude, self.latitudes, self.longitudes)
+        if candidats is not None:
+            distances = np.where(candidats, distances, np.inf)
+        noeud = int(np.argmin(distances))
+        return noeud, float(distances[noeud])
+
+    def _coordonnees_radians(self):
+        """Latitudes, longitudes (en radians) et cosinus des latitudes des noeuds, en listes Python"""
+        with self._verrou:
+            if self._radians is None:
+                latitudes = np.radians(self.latitudes)
+                self._radians = (latitudes.tolist(), np.radians(self.longitudes).tolist(), np.cos(latitudes).tolist())
+            return self._radians
+
+    def _chercher(self, reseau, source, cible):
+        """
+        A* bidirectionnel entre deux noeuds.
+
+        Les deux recherches utilisent le potentiel moyen p(v) = (h_cible(v) - h_source(v)) / 2,
+        ce qui rend les poids réduits identiques dans les deux sens : la recherche peut
+        s'arrêter dès que la somme des deux plus petites clés dépasse le meilleur trajet connu.
+        Le potentiel n'est calculé que pour les noeuds atteints par la recherche.
+
+        Returns:
+            Liste des arêtes du trajet, ou None si les noeuds ne sont pas reliés
+        """
+        if source == cible:
+            return []
+
+        latitudes, longitudes, cosinus = self._coordonnees_radians()
+        lat_c, lon_c, cos_c = latitudes[cible], longitudes[cible], cosinus[cible]
+        lat_s, lon_s, cos_s = latitudes[source], longitudes[source], cosinus[source]
+        echelle = 2 * RAYON_TERRE / (2000 * reseau.vitesse_max)
+        sin, asin, sqrt = math.sin, math.asin, math.sqrt
+        potentiels = {}
+
+        def potentiel(v):
+            """Potentiel (en heures) d'un noeud, mémorisé pour rester identique d'une visite à l'autre"""
+            p = potentiels.get(v)
+            if p is None:
+                lat, lon, cos_lat = latitudes[v], longitudes[v], cosinus[v]
+                a_c = sin((lat_c - lat) / 2) ** 2 + cos_lat * cos_c * sin((lon_c - lon) / 2) ** 2
+                a_s = sin((lat_s - lat) / 2) ** 2 + cos_lat * cos_s * sin((lon_s - lon) / 2) ** 2
+                p = potentiels[v] = (asin(sqrt(min(a_c, 1.0))) - asin(sqrt(min(a_s, 1.0)))) * echelle
+            return p
+
+        graphes = (
+            (reseau.indptr, reseau.indices, range(len(reseau.indices))),
+            (reseau.indptr_inverse, reseau.indices_inverse, reseau.aretes_inverse),
+        )
+        poids = reseau.poids
+        distances = ({source: 0.0}, {cible: 0.0})
+        parents = ({source: None}, {cible: None})
+        tas = ([(potentiel(source), source)], [(-potentiel(cible), cible)])
+        fermes = (set(), set())
+        signes = (1, -1)
+
+        meilleur = float("inf")
+        rencontre = None
+        while tas[0] and tas[1]:
+            if tas[0][0][0] + tas[1][0][0] >= meilleur:
+                break
+
+            # Avancer la recherche dont la plus petite clé est la plus faible
+            sens = 0 if tas[0][0][0] <= tas[1][0][0] else 1
+            _, u = heapq.heappop(tas[sens])
+            if u in fermes[sens]:
+                continue
+            fermes[sens].add(u)
+
+            indptr, indices, aretes = graphes[sens]
+            distances_sens, distances_autre = distances[sens], distances[1 - sens]
+            g_u = distances_sens[u]
+            for k in range(indptr[u], indptr[u + 1]):
+                v = indices[k]
+                arete = aretes[k]
+                g = g_u + poids[arete]
+                if g < distances_sens.get(v, meilleur):
+                    distances_sens[v] = g
+                    parents[sens][v] = arete
+                    heapq.heappush(tas[sens], (g + signes[sens] * potentiel(v), v))
+                    autre = distances_autre.get(v)
+                    if autre is not None and g + autre < meilleur:
+                        meilleur = g + autre
+                        rencontre = v
+
+        if rencontre is None:
+            return None
+
+        # Reconstituer le trajet : de la source à la rencontre, puis jusqu'à la cible
+        avant = []
+        v = rencontre
+        while parents[0][v] is not None:
+            avant.append(parents[0][v])
+            v = reseau.origines[parents[0][v]]
+        apres = []
+        v = rencontre
+        while parents[1][v] is not None:
+            apres.append(parents[1][v])
+            v = reseau.indices[parents[1][v]]
+        return avant[::-1] + apres
+
+    def itineraire(self, start_coords, end_coords, profile):
+        """
+        Calcule un itinéraire sur le graphe local.
+
+        Args:
+            start_coords: Tuple (latitude, longitude) du point de départ
+            end_coords: Tuple (latitude, longitude) du point d'arrivée
+            profile: Profil ORS ('driving-car' ou 'foot-hiking')
+
+        Returns:
+            Un tuple (distance_km, duration_hours, coords_json), ou None si le profil
+            n'est pas disponible, si un point est trop loin du réseau ou si aucun
+            trajet ne relie les deux points
+        """
+        if profile not in self.vitesses:
+            return None
+        reseau = self._reseau(profile)
+
+        distance_max = lire_parametre("routage", "distance_accroche_m", 2000)
+        source, acces_depart = self.noeud_proche(start_coords, reseau.departs_possibles)
+        cible, acces_arrivee = self.noeud_proche(end_coords, reseau.arrivees_possibles)
+        if max(acces_depart, acces_arrivee) > distance_max:
+            print(f"Point trop éloigné du réseau local ({max(acces_depart, acces_arrivee):.0f}m)")
+            return None
+
+        aretes = self._chercher(reseau, source, cible)
+        if aretes is None:
+            return None
+
+        noeuds = [source] + [reseau.indices[a] for a in aretes]
+        distance_m = sum(reseau.longueurs_m[a] for a in aretes)
+        duration_hours = sum(reseau.poids[a] for a in aretes)
+
+        # Relier les points demandés au réseau, à la vitesse de la première et de la dernière arête
+        # (deux points accrochés au même noeud : à la vitesse de la première arête qui en part)
+        premiere, derniere = (aretes[0], aretes[-1]) if aretes else (reseau.indptr[source],) * 2
+        for acces, arete in ((acces_depart, premiere), (acces_arrivee, derniere)):
+            distance_m += acces
+            duration_hours += acces * reseau.poids[arete] / max(reseau.longueurs_m[arete], 1e-9)
+
+        route_coords = (
+            [[float(start_coords[0]), float(start_coords[1])]]
+            + np.column_stack((self.latitudes[noeuds], self.longitudes[noeuds])).tolist()
+            + [[float(end_coords[0]), float(end_coords[1])]]
+        )
+        return distance_m / 1000, duration_hours, json.dumps(route_coords)
+
+
+def construire_graphe(latitudes, longitudes, origines, destinations, vitesses, longueurs_m=None):
+    """
+    Construit un graphe CSR à partir d'une liste d'arêtes orientées.
+
+    Args:
+        latitudes: Latitude de chaque noeud
+        longitudes: Longitude de chaque noeud
+        origines: Noeud de départ de chaque arête
+        destinations: Noeud d'arrivée de chaque arête
+        vitesses: dict {profil ORS: vitesse de chaque arête en km/h, 0 = interdite}
+        longueurs_m: Longueur de chaque arête (par défaut, distance à vol d'oiseau)
+
+    Returns:
+        Un GrapheRoutier
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    origines = np.asarray(origines, dtype=np.int64)
+    destinations = np.asarray(destinations, dtype=np.int64)
+    if longueurs_m is None:
+        longueurs_m = haversine(latitudes[origines], longitudes[origines],
+                                latitudes[destinations], longitudes[destinations])
+
+    # Trier les arêtes par origine pour obtenir la représentation CSR
+    ordre = np.argsort(origines, kind="stable")
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(origines, minlength=len(latitudes)))))
+    return GrapheRoutier(
+        latitudes, longitudes, indptr, destinations[ordre], np.asarray(longueurs_m)[ordre],
+        {profil: np.asarray(v)[ordre] for profil, v in vitesses.items()},
+    )
+
+
+def extraire_graphe_osm(fichier_pbf):
+    """
+    Extrait le réseau routier et pédestre d'un fichier OpenStreetMap (.osm.pbf).
+
+    Nécessite le paquet optionnel `osmium` (pip install osmium).
+
+    Args:
+        fichier_pbf: Chemin du fichier OSM
+
+    Returns:
+        Un GrapheRoutier
+    """
+    import osmium
+
+    noeuds = {}
+    latitudes, longitudes = [], []
+    origines, destinations = [], []
+    vitesses = {profil: [] for profil in PROFILS}
+
+    def indice(noeud):
+        if noeud.ref not in noeuds:
+            noeuds[noeud.ref] = len(latitudes)
+            latitudes.append(noeud.lat)
+            longitudes.append(noeud.lon)
+        return noeuds[noeud.ref]
+
+    class Voies(osmium.SimpleHandler):
+        def way(self, voie):
+            highway = voie.tags.get("highway")
+            vitesses_voie = {profil: VITESSES_OSM[profil].get(highway, 0) for profil in PROFILS}
+            if not any(vitesses_voie.values()):
+                return
+
+            # Sens unique : seul le profil voiture en tient compte
+            sens_unique = voie.tags.get("oneway", "no")
+            voiture_aller = sens_unique != "-1"
+            voiture_retour = sens_unique not in ("yes", "1", "true") and highway != "motorway"
+
+            points = [indice(n) for n in voie.nodes if n.location.valid()]
+            for u, v in zip(points[:-1], points[1:]):
+                for depart, arrivee, voiture in ((u, v, voiture_aller), (v, u, voiture_retour)):
+                    origines.append(depart)
+                    destinations.append(arrivee)
+                    vitesses["driving-car"].append(vitesses_voie["driving-car"] if voiture else 0)
+                    vitesses["foot-hiking"].append(vitesses_voie["foot-hiking"])
+
+    Voies().apply_file(str(fichier_pbf), locations=True)
+    return construire_graphe(latitudes, longitudes, origines, destinations, vitesses)
+
+
+@st.cache_resource
+def graphe_local():
+    """
+    Retourne le graphe local configuré (routage.graphe_local), partagé entre les sessions.
+
+    Returns:
+        Un GrapheRoutier, ou None si aucun graphe n'est configuré ou si le fichier est absent
+    """
+    chemin = lire_parametre("routage", "graphe_local")
+    if not chemin:
+        return None
+    if not Path(chemin).is_file():
+        print(f"Graphe de routage local introuvable : {chemin}")
+        return None
+    return GrapheRoutier.charger(chemin)
+
+
+if __name__ == "__main__":
+    # python -m utils.routage_local region.osm.pbf graphe.npz
+    if len(sys.argv) != 3:
+        sys.exit("Usage : python -m utils.routage_local <fichier.osm.pbf> <graphe.npz>")
+    graphe = extraire_graphe_osm(sys.argv[1])
+    graphe.enregistrer(sys.argv[2])
+    print(f"Graphe enregistré : {graphe.nb_noeuds} noeuds, {len(graphe.indices)} arêtes")
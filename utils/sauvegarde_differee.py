@@ -0,0 +1,190 @@
+import threading
+import time
+
+
+class FileSauvegardes:
+    """
+    File d'écriture différée (write-behind) vers le dépôt distant.
+
+    Les sauvegardes soumises sont regroupées par un thread de fond : une rafale de
+    modifications du même fichier ne produit qu'un envoi (la dernière version
+    gagne), et tous les fichiers en attente partent dans un seul commit par
+    branche. L'envoi a lieu `delai` secondes après la dernière soumission, et au
+    plus tard `delai_max` secondes après la première.
+    """
+
+    def __init__(self, ecrire, delai=2.0, delai_max=10.0, essais_max=3):
+        """
+        Args:
+            ecrire: Fonction (fichiers, message, branche) qui enregistre un lot de fichiers
+                {nom: contenu} en un commit, et lève une exception en cas d'échec
+            delai: Délai d'inactivité (s) avant l'envoi
+            delai_max: Attente maximale (s) depuis la première soumission non envoyée
+            essais_max: Nombre de tentatives avant d'abandonner un fichier (voir reessayer)
+        """
+        self._ecrire = ecrire
+        self.delai = delai
+        self.delai_max = delai_max
+        self.essais_max = essais_max
+
+        self._condition = threading.Condition()
+        self._en_attente = {}   # (branche, nom) -> (contenu, message)
+        self._en_cours = {}     # lot en cours d'envoi
+        self._abandons = {}     # (branche, nom) -> (contenu, message) après essais_max échecs
+        self._echecs = {}       # (branche, nom) -> dernière erreur
+        self._essais = {}       # (branche, nom) -> nombre d'échecs consécutifs
+        self._premiere = None
+        self._derniere = None
+        self._pas_avant = 0.0
+        self._forcer = False
+        self._arret = False
+        self.derniere_sauvegarde = None
+
+        self._thread = threading.Thread(target=self._boucle, name="sauvegardes", daemon=True)
+        self._thread.start()
+
+    def soumettre(self, nom_fichier, contenu, message, branche="main"):
+        """Ajoute (ou remplace) la version en attente d'un fichier ; retourne immédiatement"""
+        cle = (branche, nom_fichier)
+        with self._condition:
+            self._en_attente[cle] = (contenu, message)
+            self._abandons.pop(cle, None)
+            self._echecs.pop(cle, None)
+            self._essais.pop(cle, None)
+            maintenant = time.monotonic()
+            if self._premiere is None:
+                self._premiere = maintenant
+            self._derniere = maintenant
+            self._condition.notify_all()
+
+    def contenu_en_attente(self, nom_fichier, branche="main"):
+        """
+        Retourne la version la plus récente d'un fichier pas encore écrite dans le dépôt
+        (lecture de ses propres écritures), ou None.
+        """
+        cle = (branche, nom_fichier)
+        with self._condition:
+            for source in (self._en_attente, self._en_cours, self._abandons):
+                if cle in source:
+                    return source[cle][0]
+        return None
+
+    def etat(self):
+        """
+        Returns:
+            dict avec les fichiers en attente, en cours d'envoi, en échec
+            ({nom: erreur}) et l'heure (time.time) de la dernière sauvegarde réussie
+        """
+        with self._condition:
+            return {
+                "en_attente": [nom for _, nom in self._en_attente],
+                "en_cours": [nom for _, nom in self._en_cours],
+                "echecs": {nom: erreur for (_, nom), erreur in self._echecs.items()},
+                "derniere_sauvegarde": self.derniere_sauvegarde,
+            }
+
+    def reessayer(self):
+        """Remet en attente les fichiers abandonnés après trop d'échecs"""
+        with self._condition:
+            for cle, entree in self._abandons.items():
+                self._en_attente.setdefault(cle, entree)
+                self._essais.pop(cle, None)
+            self._abandons.clear()
+            if self._en_attente and self._premiere is None:
+                self._premiere = self._derniere = time.monotonic()
+            self._pas_avant = 0.0
+            self._forcer = True
+            self._condition.notify_all()
+
+    def vider(self, timeout=None):
+        """
+        Envoie immédiatement les fichiers en attente et attend la fin de l'envoi.
+
+        Returns:
+            True si plus rien n'est en attente (hors fichiers abandonnés)
+        """
+        fin = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._forcer = True
+            self._pas_avant = 0.0
+            self._condition.notify_all()
+            while self._en_attente or self._en_cours:
+                reste = None if fin is None else fin - time.monotonic()
+                if reste is not None and reste <= 0:
+                    return False
+                self._condition.wait(reste)
+        return True
+
+    def arreter(self, timeout=60):
+        """Vide la file puis arrête le thread de fond (à l'arrêt du processus)"""
+        self.vider(timeout)
+        with self._condition:
+            self._arret = True
+            self._condition.notify_all()
+        self._thread.join(timeout=5)
+
+    def _boucle(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._arret and not self._en_attente:
+                        return
+                    if self._en_attente:
+                        maintenant = time.monotonic()
+                        echeance = max(min(self._derniere + self.delai, self._premiere + self.delai_max),
+                                       self._pas_avant)
+                        if self._forcer or self._arret or maintenant >= echeance:
+                            break
+                        self._condition.wait(echeance - maintenant)
+                    else:
+                        self._condition.wait()
+
+                lot = self._en_attente
+                self._en_attente = {}
+                self._en_cours = lot
+                self._premiere = None
+                self._forcer = False
+
+            erreurs = self._envoyer(lot)
+
+            with self._condition:
+                for cle, entree in lot.items():
+                    if cle not in erreurs:
+                        self._essais.pop(cle, None)
+                        self._echecs.pop(cle, None)
+                        continue
+                    self._echecs[cle] = erreurs[cle]
+                    if cle in self._en_attente:
+                        # Une version plus récente a été soumise entre-temps
+                        continue
+                    self._essais[cle] = self._essais.get(cle, 0) + 1
+                    if self._essais[cle] >= self.essais_max:
+                        self._abandons[cle] = entree
+                    else:
+                        # Nouvel essai avec un délai croissant
+                        self._en_attente[cle] = entree
+                        maintenant = time.monotonic()
+                        if self._premiere is None:
+                            self._premiere = self._derniere = maintenant
+                        self._pas_avant = maintenant + self.delai * 2 ** self._essais[cle]
+                if len(erreurs) < len(lot):
+                    self.derniere_sauvegarde = time.time()
+                self._en_cours = {}
+                self._condition.notify_all()
+
+    def _envoyer(self, lot):
+        """Écrit un lot (un commit par branche) ; retourne {cle: erreur} pour les échecs"""
+        par_branche = {}
+        for (branche, nom), (contenu, message) in lot.items():
+            par_branche.setdefault(branche, {})[nom] = (contenu, message)
+
+        erreurs = {}
+        for branche, entrees in par_branche.items():
+            messages = list(dict.fromkeys(message for _, message in entrees.values()))
+            message = messages[0] if len(messages) == 1 else "; ".join(messages)
+            try:
+                self._ecrire({nom: contenu for nom, (contenu, _) in entrees.items()}, message, branche)
+            except Exception as e:
+                print(f"Échec de la sauvegarde en arrière-plan ({', '.join(entrees)}): {e}")
+                erreurs.update({(branche, nom): str(e) for nom in entrees})
+        return erreurs
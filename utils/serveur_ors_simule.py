@@ -0,0 +1,220 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.geodesie import haversine
+
+# Vitesses simulées (km/h) par profil ORS ou OSRM
+VITESSES = {"driving-car": 60, "driving": 60, "foot-hiking": 4, "foot": 4}
+
+# Allongement d'un itinéraire par rapport à la ligne droite
+FACTEUR_DETOUR = 1.3
+
+# Nombre de sommets générés par tronçon
+SOMMETS_PAR_TRONCON = 20
+
+
+def _troncons(points, profil):
+    """
+    Simule les tronçons entre points consécutifs.
+
+    Args:
+        points: Liste de points [longitude, latitude]
+
+    Returns:
+        Liste de tuples (distance_m, duree_s, coordonnees [lon, lat])
+    """
+    points = np.asarray(points, dtype=np.float64)
+    distances_m = FACTEUR_DETOUR * haversine(points[:-1, 1], points[:-1, 0], points[1:, 1], points[1:, 0])
+    vitesse_m_s = VITESSES.get(profil, 50) / 3.6
+    t = np.linspace(0, 1, SOMMETS_PAR_TRONCON)[:, None]
+    return [
+        (float(d), float(d) / vitesse_m_s, (points[j] + t * (points[j + 1] - points[j])).tolist())
+        for j, d in enumerate(distances_m)
+    ]
+
+
+class ServeurRoutageSimule:
+    """
+    Serveur HTTP multi-thread répondant aux API /v2/directions (ORS) et /route/v1 (OSRM).
+
+    Sert à mesurer le débit et la latence du calcul des itinéraires sans réseau ni
+    quota : il suffit de renseigner son adresse dans openrouteservices.url (ou
+    routage.osrm_url). Les itinéraires renvoyés sont des lignes droites
+    échantillonnées, allongées d'un facteur de détour.
+
+    Chaque requête attend une latence tirée selon une loi log-normale (médiane
+    `latence`, écart-type logarithmique `dispersion`), puis peut échouer en 500 ou
+    429 (avec Retry-After) selon les taux configurés. Les statistiques sont
+    disponibles sur GET /stats. Le script benchmarks/routage.py l'utilise pour
+    mesurer le débit et la latence de calculate_routes.
+    """
+
+    def __init__(self, port=0, latence=0.0, dispersion=0.0, taux_erreur=0.0, taux_429=0.0,
+                 retry_after=1, graine=None):
+        """
+        Args:
+            port: Port d'écoute (0 = port libre choisi par le système)
+            latence: Latence médiane en secondes
+            dispersion: Écart-type du logarithme de la latence (0 = latence constante)
+            taux_erreur: Proportion de réponses 500
+            taux_429: Proportion de réponses 429 (quota dépassé)
+            retry_after: Valeur de l'en-tête Retry-After des réponses 429, en secondes
+            graine: Graine du générateur aléatoire (reproductibilité)
+        """
+        self.latence = latence
+        self.dispersion = dispersion
+        self.taux_erreur = taux_erreur
+        self.taux_429 = taux_429
+        self.retry_after = retry_after
+        self._aleatoire = random.Random(graine)
+        self._verrou = threading.Lock()
+        self._durees = []
+        self._compteurs = {"requetes": 0, "erreurs": 0, "quotas": 0}
+
+        serveur = self
+
+        class Gestionnaire(BaseHTTPRequestHandler):
+            def do_POST(self):
+                correspondance = re.fullmatch(r"/v2/directions/([\w-]+)(?:/json)?", self.path)
+                if correspondance is None:
+                    return self._repondre(404, {"error": "not found"})
+                longueur = int(self.headers.get("Content-Length", 0))
+                corps = json.loads(self.rfile.read(longueur) or b"{}")
+                serveur._traiter(self, serveur._reponse_ors, corps.get("coordinates", []), correspondance[1])
+
+            def do_GET(self):
+                if self.path == "/stats":
+                    return self._repondre(200, serveur.statistiques())
+                correspondance = re.fullmatch(r"/route/v1/([\w-]+)/([^?]+)(?:\?.*)?", self.path)
+                if correspondance is None:
+                    return self._repondre(404, {"code": "InvalidUrl"})
+                points = [[float(v) for v in p.split(",")] for p in correspondance[2].split(";")]
+                serveur._traiter(self, serveur._reponse_osrm, points, correspondance[1])
+
+            def _repondre(self, statut, donnees, entetes=None):
+                contenu = json.dumps(donnees).encode("utf-8")
+                self.send_response(statut)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(contenu)))
+                for nom, valeur in (entetes or {}).items():
+                    self.send_header(nom, valeur)
+                self.end_headers()
+                self.wfile.write(contenu)
+
+            def log_message(self, *args):
+                pass
+
+        self._http = ThreadingHTTPServer(("127.0.0.1", port), Gestionnaire)
+        self._http.daemon_threads = True
+        self._thread = threading.Thread(target=self._http.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._http.server_port}"
+
+    def arreter(self):
+        """Arrête le serveur"""
+        self._http.shutdown()
+        self._http.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.arreter()
+
+    def _traiter(self, gestionnaire, construire_reponse, points, profil):
+        """Applique la latence et les erreurs simulées, puis répond"""
+        debut = time.perf_counter()
+        with self._verrou:
+            self._compteurs["requetes"] += 1
+            attente = self.latence * np.exp(self._aleatoire.gauss(0, self.dispersion)) if self.latence else 0
+            tirage = self._aleatoire.random()
+        time.sleep(attente)
+
+        if tirage < self.taux_429:
+            statut, donnees, entetes = 429, {"error": "Rate Limit Exceeded"}, {"Retry-After": str(self.retry_after)}
+            cle = "quotas"
+        elif tirage < self.taux_429 + self.taux_erreur:
+            statut, donnees, entetes = 500, {"error": "Erreur simulée"}, None
+            cle = "erreurs"
+        elif len(points) < 2:
+            statut, donnees, entetes = 400, {"error": "Au moins deux points sont nécessaires"}, None
+            cle = "erreurs"
+        else:
+            statut, donnees, entetes = 200, construire_reponse(points, profil), None
+            cle = None
+
+        gestionnaire._repondre(statut, donnees, entetes)
+        with self._verrou:
+            if cle is not None:
+                self._compteurs[cle] += 1
+            self._durees.append(time.perf_counter() - debut)
+
+    @staticmethod
+    def _reponse_ors(points, profil):
+        troncons = _troncons(points, profil)
+        geometrie = []
+        way_points = [0]
+        for _, _, coords in troncons:
+            geometrie.extend(coords[1:] if geometrie else coords)
+            way_points.append(len(geometrie) - 1)
+        return {"routes": [{
+            "summary": {"distance": sum(t[0] for t in troncons) / 1000, "duration": sum(t[1] for t in troncons)},
+            "segments": [{"distance": d / 1000, "duration": s} for d, s, _ in troncons],
+            "way_points": way_points,
+            "geometry": {"type": "LineString", "coordinates": geometrie},
+        }]}
+
+    @staticmethod
+    def _reponse_osrm(points, profil):
+        troncons = _troncons(points, profil)
+        return {"code": "Ok", "routes": [{
+            "distance": sum(t[0] for t in troncons),
+            "duration": sum(t[1] for t in troncons),
+            "legs": [
+                {"distance": d, "duration": s, "steps": [{"geometry": {"type": "LineString", "coordinates": c}}]}
+                for d, s, c in troncons
+            ],
+        }]}
+
+    def statistiques(self):
+        """
+        Returns:
+            dict avec le nombre de requêtes, d'erreurs et de 429 injectés, et les
+            percentiles de la durée de traitement en millisecondes
+        """
+        with self._verrou:
+            durees = np.array(self._durees) * 1000
+            stats = dict(self._compteurs)
+        for p in (50, 95, 99):
+            stats[f"p{p}_ms"] = float(np.percentile(durees, p)) if len(durees) else None
+        return stats
+
+
+if __name__ == "__main__":
+    # python -m utils.serveur_ors_simule --port 8080 --latence 0.3 --dispersion 0.5 --taux-429 0.02
+    parser = argparse.ArgumentParser(description="Serveur ORS/OSRM simulé")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latence", type=float, default=0.2, help="Latence médiane (s)")
+    parser.add_argument("--dispersion", type=float, default=0.0, help="Écart-type log de la latence")
+    parser.add_argument("--taux-erreur", type=float, default=0.0, help="Proportion de réponses 500")
+    parser.add_argument("--taux-429", type=float, default=0.0, help="Proportion de réponses 429")
+    parser.add_argument("--graine", type=int, default=None)
+    args = parser.parse_args()
+
+    serveur = ServeurRoutageSimule(args.port, args.latence, args.dispersion, args.taux_erreur,
+                                   args.taux_429, graine=args.graine)
+    print(f"Serveur simulé sur {serveur.url} (statistiques : {serveur.url}/stats)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print(json.dumps(serveur.statistiques(), indent=2))
+        serveur.arreter()
@@ -0,0 +1,158 @@
+import numpy as np
+
+from utils.parametres import lire_parametre
+
+# Tolérances (en mètres) des niveaux de détail : le niveau k conserve les sommets
+# qui s'écartent de plus de TOLERANCES_M[k - 1] du tracé simplifié, le niveau 0 les garde tous
+TOLERANCES_M = np.array([2.0, 10.0, 50.0, 250.0])
+
+# Rayon de la Terre en mètres
+RAYON_TERRE = 6371000
+
+# Largeur approximative de la carte en pixels, pour passer de l'étendue au zoom
+LARGEUR_CARTE_PX = 1000
+
+# Mètres par pixel au zoom 0 à l'équateur (tuiles web Mercator de 256 px)
+METRES_PAR_PIXEL_ZOOM_0 = 156543.03
+
+
+def _projeter(points):
+    """Projette des points [lat, lon] en mètres (projection équirectangulaire locale)"""
+    points = np.asarray(points, dtype=np.float64)
+    lat0 = np.radians(points[:, 0].mean())
+    echelle = np.radians(1.0) * RAYON_TERRE
+    return np.column_stack((points[:, 1] * np.cos(lat0) * echelle, points[:, 0] * echelle))
+
+
+def importance_sommets(points):
+    """
+    Calcule l'importance de chaque sommet au sens de Douglas-Peucker.
+
+    L'importance d'un sommet est la plus grande tolérance (en mètres) pour laquelle
+    l'algorithme le conserve : simplifier à la tolérance t revient à garder les
+    sommets d'importance > t. Toutes les sous-parties ouvertes d'une même profondeur
+    de récursion sont traitées ensemble par des opérations NumPy vectorisées.
+
+    Args:
+        points: Tableau (n, 2) de points [lat, lon]
+
+    Returns:
+        Tableau de n importances (infinie pour les extrémités)
+    """
+    n = len(points)
+    importance = np.zeros(n)
+    if n == 0:
+        return importance
+    importance[[0, -1]] = np.inf
+    if n < 3:
+        return importance
+
+    xy = _projeter(points)
+
+    # Sous-parties à traiter : [debut, fin] et importance maximale héritée du parent
+    debuts = np.array([0])
+    fins = np.array([n - 1])
+    plafonds = np.array([np.inf])
+
+    while len(debuts):
+        longueurs = fins - debuts - 1
+        ouvertes = longueurs > 0
+        debuts, fins, plafonds, longueurs = debuts[ouvertes], fins[ouvertes], plafonds[ouvertes], longueurs[ouvertes]
+        if not len(debuts):
+            break
+
+        # Sommets intérieurs de toutes les sous-parties, mis bout à bout
+        groupes = np.repeat(np.arange(len(debuts)), longueurs)
+        decalages = np.cumsum(longueurs) - longueurs
+        total = longueurs.sum()
+        indices = np.arange(total) - decalages[groupes] + debuts[groupes] + 1
+
+        # Distance de chaque sommet au segment [debut, fin] de sa sous-partie
+        a = xy[debuts[groupes]]
+        ab = xy[fins[groupes]] - a
+        ap = xy[indices] - a
+        longueur2 = (ab * ab).sum(axis=1)
+        t = np.divide((ap * ab).sum(axis=1), longueur2, out=np.zeros(total), where=longueur2 > 0)
+        ecarts = ap - np.clip(t, 0, 1)[:, None] * ab
+        distances = np.hypot(ecarts[:, 0], ecarts[:, 1])
+
+        # Sommet le plus éloigné de chaque sous-partie (le premier en cas d'égalité)
+        maximums = np.maximum.reduceat(distances, decalages)
+        positions = np.where(distances == maximums[groupes], np.arange(total), total)
+        coupures = indices[np.minimum.reduceat(positions, decalages)]
+
+        # Un sommet n'est jamais plus important que celui qui a créé sa sous-partie
+        valeurs = np.minimum(maximums, plafonds)
+        importance[coupures] = valeurs
+
+        debuts = np.concatenate((debuts, coupures))
+        fins = np.concatenate((coupures, fins))
+        plafonds = np.concatenate((valeurs, valeurs))
+
+    return importance
+
+
+def niveaux_sommets(points):
+    """
+    Précalcule les niveaux de détail d'un tracé.
+
+    Args:
+        points: Tableau (n, 2) de points [lat, lon]
+
+    Returns:
+        Tableau uint8 de n valeurs : le sommet est conservé aux niveaux 0 à valeur inclus
+    """
+    importance = importance_sommets(points)
+    return np.searchsorted(TOLERANCES_M, importance, side="left").astype(np.uint8)
+
+
+def simplifier(points, niveaux, niveau):
+    """
+    Retourne les sommets d'un tracé conservés à un niveau de détail donné.
+
+    Args:
+        points: Tableau (n, 2) de points [lat, lon]
+        niveaux: Niveaux précalculés par niveaux_sommets (None = pas de simplification)
+        niveau: Niveau de détail voulu (0 = tracé complet)
+
+    Returns:
+        Tableau (m, 2) des sommets conservés
+    """
+    if niveaux is None or niveau <= 0 or len(niveaux) != len(points):
+        return points
+    return points[np.asarray(niveaux) >= niveau]
+
+
+def choisir_niveau(latitudes, longitudes, zoom=None):
+    """
+    Choisit le niveau de détail adapté à l'étendue du voyage et au zoom de la carte.
+
+    La tolérance admise correspond à un pixel lorsque l'utilisateur a zoomé de
+    carte.marge_zoom niveaux (3 par défaut) au-delà de la vue d'ensemble.
+
+    Args:
+        latitudes: Latitudes des étapes
+        longitudes: Longitudes des étapes
+        zoom: Zoom initial de la carte (optionnel)
+
+    Returns:
+        Niveau de détail (0 à len(TOLERANCES_M))
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    valides = ~(np.isnan(latitudes) | np.isnan(longitudes))
+    if valides.sum() < 2:
+        return 0
+
+    marge = lire_parametre("carte", "marge_zoom", 3)
+    points = np.column_stack((latitudes[valides], longitudes[valides]))
+    xy = _projeter(points)
+    etendue_m = np.hypot(*(xy.max(axis=0) - xy.min(axis=0)))
+
+    # Mètres représentés par un pixel, une fois zoomé de `marge` niveaux
+    tolerance_m = etendue_m / (LARGEUR_CARTE_PX * 2 ** marge)
+    if zoom is not None:
+        cos_lat = np.cos(np.radians(points[:, 0].mean()))
+        tolerance_m = min(tolerance_m, METRES_PAR_PIXEL_ZOOM_0 * cos_lat / 2 ** (zoom + marge))
+
+    return int(np.searchsorted(TOLERANCES_M, tolerance_m, side="right"))
@@ -0,0 +1,165 @@
+import atexit
+import json
+import os
+import threading
+import streamlit as st
+from pathlib import Path
+
+from utils.depot_github import miroir_github
+from utils.depots_locaux import DepotLocal, DepotSQLite
+from utils.parametres import DOSSIER_CACHE, lire_parametre
+
+
+def synchroniser(source, destination, branche="main", message="Synchronisation des données", base=None):
+    """
+    Recopie une branche d'un dépôt vers un autre, en une seule écriture.
+
+    Seuls les fichiers dont le SHA diffère sont transférés. Un fichier absent de
+    la source n'est supprimé de la destination que s'il figure dans `base` avec
+    le même SHA : la source l'a connu dans cette version, puis supprimé (les
+    patchs d'un journal compacté, par exemple). Les fichiers que la source n'a
+    jamais vus (ajoutés ou modifiés ailleurs, PDF jamais importés) sont conservés.
+
+    Args:
+        source: Dépôt lu (DepotBlobs)
+        destination: Dépôt écrit (DepotBlobs)
+        branche: Nom de la branche
+        message: Description de la modification
+        base: Arborescence recopiée lors de la synchronisation précédente
+            ({chemin: SHA}) ; sans base, aucun fichier n'est supprimé
+
+    Returns:
+        Arborescence recopiée, base de la synchronisation suivante
+    """
+    source.invalider(branche)
+    destination.invalider(branche)
+    fichiers_source = dict(source.arbre(branche))
+    fichiers_destination = destination.arbre(branche)
+    base = base or {}
+
+    # Lecture par SHA : le contenu est celui de l'arborescence lue, même si la source change entre-temps
+    fichiers = {chemin: source.chemin_blob(sha).read_bytes()
+                for chemin, sha in fichiers_source.items() if fichiers_destination.get(chemin) != sha}
+    supprimes = {chemin for chemin, sha in fichiers_destination.items()
+                 if chemin not in fichiers_source and base.get(chemin) == sha}
+    conserves = [chemin for chemin in fichiers_destination if chemin not in fichiers_source and chemin not in supprimes]
+    if conserves:
+        print(f"{len(conserves)} fichier(s) absent(s) de {source.nom} conservé(s) dans {destination.nom}")
+    fichiers.update({chemin: None for chemin in supprimes})
+
+    if fichiers:
+        destination.commiter(fichiers, message, branche)
+        print(f"Synchronisation {source.nom} -> {destination.nom} : {len(fichiers)} fichier(s)")
+    return fichiers_source
+
+
+class SynchronisationPeriodique:
+    """
+    Recopie régulièrement un dépôt local vers GitHub, dans un thread de fond.
+
+    L'arborescence recopiée est conservée dans un fichier d'état, à côté du
+    dépôt local : elle indique, même après un redémarrage, quels fichiers
+    distants le dépôt local a connus et peut donc supprimer (voir synchroniser).
+    """
+
+    def __init__(self, source, destination, intervalle, branche="main", fichier_etat=None, base=None):
+        """
+        Args:
+            source: Dépôt local
+            destination: Dépôt distant
+            intervalle: Délai entre deux synchronisations, en secondes
+            branche: Nom de la branche
+            fichier_etat: Fichier JSON de l'arborescence recopiée (optionnel)
+            base: Arborescence déjà identique dans les deux dépôts (par défaut : lue
+                dans fichier_etat)
+        """
+        self.source = source
+        self.destination = destination
+        self.intervalle = intervalle
+        self.branche = branche
+        self.fichier_etat = Path(fichier_etat) if fichier_etat is not None else None
+        self.derniere_erreur = None
+        self._verrou = threading.Lock()
+        if base is not None:
+            self._enregistrer_base(base)
+        else:
+            self.base = self._lire_base()
+        self._arret = threading.Event()
+        self._thread = threading.Thread(target=self._boucle, name="synchronisation", daemon=True)
+        self._thread.start()
+
+    def _lire_base(self):
+        if self.fichier_etat is None or not self.fichier_etat.is_file():
+            return None
+        with open(self.fichier_etat, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _enregistrer_base(self, base):
+        self.base = base
+        if self.fichier_etat is None:
+            return
+        # Écriture puis renommage : un arrêt brutal ne laisse pas de fichier partiel
+        temporaire = self.fichier_etat.with_suffix(".tmp")
+        with open(temporaire, "w", encoding="utf-8") as f:
+            json.dump(base, f)
+        os.replace(temporaire, self.fichier_etat)
+
+    def _boucle(self):
+        while not self._arret.wait(self.intervalle):
+            self.synchroniser()
+
+    def synchroniser(self):
+        """Synchronise immédiatement ; retourne False en cas d'échec"""
+        with self._verrou:
+            try:
+                self._enregistrer_base(synchroniser(self.source, self.destination, self.branche, base=self.base))
+                self.derniere_erreur = None
+                return True
+            except Exception as e:
+                self.derniere_erreur = str(e)
+                print(f"Échec de la synchronisation vers {self.destination.nom} : {e}")
+                return False
+
+    def arreter(self):
+        """Arrête le thread après une dernière synchronisation"""
+        self._arret.set()
+        self._thread.join(timeout=5)
+        self.synchroniser()
+
+
+@st.cache_resource
+def depot_donnees():
+    """
+    Retourne le dépôt des données du voyage, partagé entre les sessions.
+
+    Paramètres (section stockage) :
+        type: "github" (défaut), "local" ou "sqlite"
+        dossier: Dossier du dépôt local (défaut .cache/depot)
+        fichier: Fichier du dépôt SQLite (défaut .cache/depot.sqlite)
+        synchronisation_secondes: Intervalle de recopie d'un dépôt local vers GitHub
+            (optionnel ; sans ce paramètre, le dépôt local est autonome)
+
+    Un dépôt local vide est initialisé à partir de GitHub quand la synchronisation est
+    active. Les fichiers distants que le dépôt local n'a jamais eus ne sont pas supprimés.
+    """
+    type_depot = lire_parametre("stockage", "type", "github")
+    if type_depot == "local":
+        dossier = Path(lire_parametre("stockage", "dossier", DOSSIER_CACHE / "depot"))
+        depot = DepotLocal(dossier)
+        fichier_etat = dossier / "synchronisation.json"
+    elif type_depot == "sqlite":
+        fichier = Path(lire_parametre("stockage", "fichier", DOSSIER_CACHE / "depot.sqlite"))
+        depot = DepotSQLite(fichier)
+        fichier_etat = fichier.with_name(f"{fichier.stem}.synchronisation.json")
+    else:
+        if type_depot != "github":
+            print(f"Type de stockage '{type_depot}' inconnu, utilisation de GitHub")
+        return miroir_github()
+
+    intervalle = lire_parametre("stockage", "synchronisation_secondes")
+    if intervalle:
+        distant = miroir_github()
+        base = synchroniser(distant, depot, message="Import depuis GitHub") if not depot.arbre() else None
+        synchronisation = SynchronisationPeriodique(depot, distant, intervalle, fichier_etat=fichier_etat, base=base)
+        atexit.register(synchronisation.arreter)
+    return depot